@@ -3,7 +3,7 @@
 Админка предназначена для внутреннего использования:
 - просмотр аналитики уникальных вопросов;
 - редактирование Markdown базы знаний;
-- пересборка FAISS индекса;
+- фоновая пересборка FAISS индекса со статусом и отменой;
 - настройка параметров LLM провайдера в `.env` и runtime.
 """
 
@@ -19,7 +19,9 @@ from loguru import logger
 from app.admin.auth import verify_admin
 from app.config import settings
 from app.core.ai_client import AIClient
-from app.core.rag_engine import RAGEngine
+from app.core.rag_engine import get_rag_engine
+from app.core.rebuild_jobs import JOB_RUNNING
+from app.core.rebuild_jobs import RebuildJobManager
 from app.database.questions_db import QuestionsDB
 
 router = APIRouter(prefix="/admin")
@@ -27,9 +29,10 @@ templates = Jinja2Templates(directory="app/admin/templates")
 
 # В текущей архитектуре используем глобальные singletons на модуль.
 # Это упрощает запуск. При росте нагрузки лучше перейти на DI.
-rag = RAGEngine(settings.KNOWLEDGE_BASE_PATH, settings.FAISS_INDEX_PATH)
+rag = get_rag_engine()
 db = QuestionsDB()
 ai = AIClient()
+rebuild_jobs = RebuildJobManager(rag)
 
 
 def _update_env_file(updates: dict[str, str]) -> None:
@@ -110,8 +113,37 @@ async def save_knowledge(content: str = Form(...), username: str = Depends(verif
 
 @router.post("/api/rebuild")
 async def rebuild_index(username: str = Depends(verify_admin)):
-    """Пересобирает FAISS индекс по актуальной базе знаний."""
-    rag.rebuild_index()
+    """Запускает фоновую пересборку FAISS индекса по актуальной базе знаний.
+
+    Возвращает сразу; прогресс доступен через `/api/rebuild/{job_id}`.
+    """
+    job, created = rebuild_jobs.start()
+    if not created:
+        return {
+            "status": "error",
+            "message": "Пересборка индекса уже выполняется.",
+            "job": job.to_dict()
+        }
+    return {"status": "success", "job": job.to_dict()}
+
+
+@router.get("/api/rebuild/{job_id}")
+async def rebuild_status(job_id: str, username: str = Depends(verify_admin)):
+    """Статус и прогресс фоновой пересборки индекса."""
+    job = rebuild_jobs.get(job_id)
+    if job is None:
+        return {"status": "error", "message": "Задача пересборки не найдена."}
+    return {"status": "success", "job": job.to_dict()}
+
+
+@router.post("/api/rebuild/{job_id}/cancel")
+async def cancel_rebuild(job_id: str, username: str = Depends(verify_admin)):
+    """Отменяет выполняющуюся пересборку индекса."""
+    if not rebuild_jobs.cancel(job_id):
+        job = rebuild_jobs.get(job_id)
+        if job is not None and job.status == JOB_RUNNING and job.saving:
+            return {"status": "error", "message": "Индекс уже записывается, отмена невозможна."}
+        return {"status": "error", "message": "Задача не выполняется или не найдена."}
     return {"status": "success"}
 
 @router.get("/test", response_class=HTMLResponse)
@@ -26,10 +26,14 @@ class Settings(BaseSettings):
     TELEGRAM_BOT_TOKEN: str
     TELEGRAM_WEBHOOK_URL: Optional[str] = None
     TELEGRAM_USE_WEBHOOK: bool = False
+    TELEGRAM_STREAMING: bool = True
+    TELEGRAM_STREAM_EDIT_INTERVAL: float = 1.0
+    TELEGRAM_API_URL: Optional[str] = None
     
     # Jivo
     JIVO_BOT_TOKEN: Optional[str] = None
     JIVO_WEBHOOK_SECRET: Optional[str] = None
+    JIVO_API_URL: str = "https://api.jivo.ru/bot/v1/message"
     
     # Admin Panel
     ADMIN_USERNAME: str = "admin"
@@ -40,23 +44,98 @@ class Settings(BaseSettings):
     AI_TEMPERATURE: float = 0.7
     AI_MAX_TOKENS: int = 800
     AI_TOP_P: float = 0.9
+    PROMPT_TOKEN_BUDGET: int = 8000
+    PROMPT_SYSTEM_TOKENS: int = 4000
+    PROMPT_CONTEXT_TOKENS: int = 2500
+    PROMPT_HISTORY_TOKENS: int = 1500
     
+    # Embeddings
+    EMBEDDING_MODEL: str = "text-embedding-3-small"
+    EMBEDDING_MAX_CONCURRENCY: int = 8
+    EMBEDDING_TIMEOUT: float = 30.0
+    EMBEDDING_CONNECT_TIMEOUT: float = 5.0
+    EMBEDDING_MAX_RETRIES: int = 2
+    EMBEDDING_BATCH_SIZE: int = 64
+    EMBEDDING_REBUILD_CONCURRENCY: int = 4
+    EMBEDDING_RETRY_ATTEMPTS: int = 5
+    EMBEDDING_RETRY_BASE_DELAY: float = 1.0
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_PATH: str = "data/cache/embeddings.db"
+    EMBEDDING_CACHE_MAX_ITEMS: int = 100000
+
+    # Database
+    DATABASE_PATH: str = "data/database.db"
+    SQLITE_JOURNAL_MODE: Literal["wal", "delete", "truncate", "persist", "memory"] = "wal"
+    SQLITE_SYNCHRONOUS: Literal["off", "normal", "full", "extra"] = "normal"
+    SQLITE_BUSY_TIMEOUT: int = 5000
+    SQLITE_MMAP_SIZE: int = 268435456
+    SQLITE_POOL_SIZE: int = 5
+    SQLITE_MAX_OVERFLOW: int = 10
+
     # RAG Configuration
     KNOWLEDGE_BASE_PATH: str = "data/knowledge_base.md"
     FAISS_INDEX_PATH: str = "data/faiss_index"
     CHUNK_SIZE: int = 1000
     CHUNK_OVERLAP: int = 200
     TOP_K_RESULTS: int = 3
+    RAG_RELOAD_CHECK_INTERVAL: float = 2.0
+    RAG_INDEX_METRIC: Literal["cosine", "l2"] = "cosine"
+    RAG_MIN_SCORE: float = 0.3
+    RAG_INDEX_TYPE: Literal["flat", "hnsw", "ivfpq"] = "flat"
+    RAG_HNSW_M: int = 32
+    RAG_HNSW_EF_CONSTRUCTION: int = 200
+    RAG_HNSW_EF_SEARCH: int = 64
+    RAG_IVF_NLIST: int = 0
+    RAG_IVF_NPROBE: int = 16
+    RAG_PQ_M: int = 64
+    RAG_PQ_NBITS: int = 8
+    RAG_INDEX_EVAL_QUERIES: int = 200
+    RAG_HYBRID_SEARCH: bool = True
+    RAG_HYBRID_CANDIDATES: int = 20
+    RAG_RRF_K: int = 60
+    RAG_LEXICAL_MIN_MATCH: float = 0.4
+    RAG_LEXICAL_FAST_PATH: bool = True
+    RAG_LEXICAL_FAST_PATH_MIN_TERMS: int = 2
+    RAG_LEXICAL_FAST_PATH_RATIO: float = 2.0
     SIMILARITY_THRESHOLD: float = 0.85
+    QUESTION_EMBEDDING_DTYPE: Literal["float32", "float16"] = "float32"
+    QUESTION_LOG_QUEUE_SIZE: int = 1000
+    QUESTION_LOG_BATCH_SIZE: int = 50
+    QUESTION_LOG_FLUSH_INTERVAL: float = 1.0
+    QUESTION_LOG_SHUTDOWN_TIMEOUT: float = 10.0
     
+    # Answer Cache
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = 0.95
+    ANSWER_CACHE_TTL: int = 3600
+    ANSWER_CACHE_MAX_ITEMS: int = 1000
+
     # Rate Limiting
     RATE_LIMIT_REQUESTS: int = 20
     RATE_LIMIT_WINDOW: int = 3600
+    LIMITS_BACKEND: Literal["memory", "sqlite"] = "memory"
+    LIMITS_SQLITE_PATH: str = "data/limits.db"
+    LIMITS_MEMORY_MAX_KEYS: int = 100000
     
     # Context
     MAX_CONTEXT_MESSAGES: int = 5
     CONTEXT_TTL: int = 3600
+    CONTEXT_MAX_USERS: int = 10000
+    CONTEXT_SWEEP_INTERVAL: float = 60.0
+    CONTEXT_BACKEND: Literal["memory", "sqlite", "redis"] = "memory"
+    CONTEXT_SQLITE_PATH: str = "data/context.db"
+    CONTEXT_REDIS_URL: str = "redis://localhost:6379/0"
+    CONTEXT_REDIS_PREFIX: str = "context:"
+    CONTEXT_REDIS_TIMEOUT: float = 2.0
+    CONTEXT_CACHE_TTL: float = 5.0
+    CONTEXT_FLUSH_INTERVAL: float = 0.5
+    CONTEXT_FLUSH_BATCH: int = 100
     
+    # Health checks
+    HEALTH_DB_TIMEOUT: float = 2.0
+    HEALTH_PROVIDER_TTL: int = 60
+    HEALTH_PROVIDER_TIMEOUT: float = 5.0
+
     # System
     DEBUG: bool = False
     LOG_LEVEL: str = "INFO"
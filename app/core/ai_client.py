@@ -1,13 +1,34 @@
 """Клиент для генерации ответов через OpenAI-совместимый Chat API."""
 
+from typing import AsyncIterator
 from typing import Dict
 from typing import List
+from typing import Tuple
 
 from loguru import logger
 from openai import AsyncOpenAI
 
 from app.config import settings
+from app.core.metrics import record_prompt_usage
+from app.core.metrics import record_provider_error
+from app.core.prompt_budget import PromptUsage
+from app.core.prompt_budget import prompt_builder
 
+# Ответ пользователю при ошибке LLM; ответы, содержащие его, не кэшируются.
+FALLBACK_RESPONSE = (
+    "Извините, произошла ошибка при генерации ответа. "
+    "Пожалуйста, попробуйте позже или обратитесь в хелп-чат: "
+    "https://t.me/Ageev_Help_chat"
+)
+
+
+def is_cacheable_answer(text: str) -> bool:
+    """Можно ли кэшировать ответ и сохранять его в историю.
+
+    Не подходят пустые ответы и ответы с `FALLBACK_RESPONSE` — как
+    целиком ошибочные, так и оборванные потоки, к которым он дописан.
+    """
+    return bool(text.strip()) and FALLBACK_RESPONSE not in text
 
 class AIClient:
     """Обертка над Chat Completions API для генерации ответов бота."""
@@ -29,6 +50,38 @@ class AIClient:
             base_url=settings.OPENAI_API_BASE,
         )
 
+    @staticmethod
+    def _build_messages(
+        user_question: str,
+        rag_context: str,
+        conversation_history: List[Dict],
+        system_prompt: str,
+    ) -> Tuple[List[Dict], PromptUsage]:
+        """Собирает сообщения для Chat API в пределах бюджета токенов."""
+        messages, usage = prompt_builder.build(
+            user_question, rag_context, conversation_history, system_prompt
+        )
+        record_prompt_usage(usage)
+        return messages, usage
+
+    @staticmethod
+    def _log_usage(usage: PromptUsage, response_usage=None) -> None:
+        """Токены запроса: локальная оценка частей и, если есть, данные API."""
+        logger.info(
+            "LLM prompt tokens system={} context={} history={} question={} total={}/{} "
+            "truncated={} counter={} api_prompt={} api_completion={}",
+            usage.system,
+            usage.context,
+            usage.history,
+            usage.question,
+            usage.total,
+            usage.budget or "-",
+            ",".join(usage.truncated) or "-",
+            "tiktoken" if usage.exact else "estimate",
+            getattr(response_usage, "prompt_tokens", "-"),
+            getattr(response_usage, "completion_tokens", "-"),
+        )
+
     async def generate_response(
         self,
         user_question: str,
@@ -39,37 +92,10 @@ class AIClient:
         """Генерирует ответ модели по вопросу и RAG-контексту."""
         try:
             client = self._build_client()
-
-            # Backward-compatible: if placeholders are absent or broken, keep original prompt.
-            try:
-                rendered_system_prompt = system_prompt.format(
-                    rag_context=rag_context,
-                    conversation_history="",
-                    user_question="",
-                )
-            except Exception:
-                rendered_system_prompt = system_prompt
-
-            messages = [{"role": "system", "content": rendered_system_prompt}]
-
-            # Always inject retrieval context explicitly.
-            context_block = rag_context.strip() if rag_context and rag_context.strip() else "Контекст не найден."
-            messages.append(
-                {
-                    "role": "system",
-                    "content": (
-                        "Контекст для ответа (используй только его факты; "
-                        "если данных недостаточно, честно скажи об этом):\n\n"
-                        f"{context_block}"
-                    ),
-                }
+            messages, usage = self._build_messages(
+                user_question, rag_context, conversation_history, system_prompt
             )
 
-            for msg in conversation_history:
-                messages.append(msg)
-
-            messages.append({"role": "user", "content": user_question})
-
             response = await client.chat.completions.create(
                 model=settings.AI_MODEL,
                 messages=messages,
@@ -80,11 +106,65 @@ class AIClient:
                 presence_penalty=0.3,
             )
 
-            return response.choices[0].message.content
+            self._log_usage(usage, response.usage)
+            content = response.choices[0].message.content
+            if not content or not content.strip():
+                logger.warning("AI generation returned an empty answer")
+                return FALLBACK_RESPONSE
+            return content
         except Exception as e:
+            record_provider_error("llm", "chat")
             logger.error(f"AI generation error: {e}")
-            return (
-                "Извините, произошла ошибка при генерации ответа. "
-                "Пожалуйста, попробуйте позже или обратитесь в хелп-чат: "
-                "https://t.me/Ageev_Help_chat"
+            return FALLBACK_RESPONSE
+
+    async def stream_response(
+        self,
+        user_question: str,
+        rag_context: str,
+        conversation_history: List[Dict],
+        system_prompt: str,
+    ) -> AsyncIterator[str]:
+        """Генерирует ответ потоком: отдаёт фрагменты текста по мере прихода.
+
+        При ошибке отдаёт `FALLBACK_RESPONSE` (после уже полученной части
+        ответа, если поток оборвался посередине), поэтому оборванный ответ
+        можно распознать по вхождению этой строки. Пустой поток тоже
+        заканчивается `FALLBACK_RESPONSE`.
+        """
+        produced = False
+        try:
+            client = self._build_client()
+            messages, usage = self._build_messages(
+                user_question, rag_context, conversation_history, system_prompt
+            )
+            # В потоке API не сообщает токены — логируем локальный подсчёт.
+            self._log_usage(usage)
+
+            stream = await client.chat.completions.create(
+                model=settings.AI_MODEL,
+                messages=messages,
+                temperature=settings.AI_TEMPERATURE,
+                max_tokens=settings.AI_MAX_TOKENS,
+                top_p=settings.AI_TOP_P,
+                frequency_penalty=0.3,
+                presence_penalty=0.3,
+                stream=True,
             )
+
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    produced = True
+                    yield delta
+        except Exception as e:
+            record_provider_error("llm", "chat_stream")
+            logger.error(f"AI streaming error: {e}")
+            yield f"\n\n{FALLBACK_RESPONSE}" if produced else FALLBACK_RESPONSE
+            return
+
+        if not produced:
+            # Поток закончился без текста: пользователь не должен остаться без ответа.
+            logger.warning("AI stream finished without content")
+            yield FALLBACK_RESPONSE
@@ -0,0 +1,124 @@
+"""Семантический кэш ответов для повторяющихся вопросов.
+
+Основной поток поддержки — одни и те же несколько десятков вопросов.
+Если новый вопрос по cosine similarity достаточно близок к уже отвеченному
+(`ANSWER_CACHE_SIMILARITY_THRESHOLD`, та же идея, что и
+`SIMILARITY_THRESHOLD` в `QuestionsDB`), ответ отдаётся из кэша без
+RAG-поиска и вызова LLM.
+
+Кэшируются только ответы на первые реплики диалога (без истории): с
+историей тот же текст может означать другой вопрос.
+
+Записи привязаны к версии индекса базы знаний: после `rebuild_index`
+версия меняется и весь кэш сбрасывается при первом же обращении.
+Время жизни записи — `ANSWER_CACHE_TTL`, размер — `ANSWER_CACHE_MAX_ITEMS`
+(LRU-вытеснение).
+"""
+
+import itertools
+import time
+from collections import OrderedDict
+from typing import Dict
+from typing import Optional
+
+import numpy as np
+
+from app.config import settings
+from app.core.vector_index import VectorIndex
+
+
+class _CachedAnswer:
+    """Запись кэша: текст ответа и момент сохранения."""
+
+    __slots__ = ("answer", "created_at")
+
+    def __init__(self, answer: str, created_at: float):
+        self.answer = answer
+        self.created_at = created_at
+
+
+class AnswerCache:
+    """In-memory кэш ответов с поиском по сходству embeddings, TTL и LRU."""
+
+    # Сколько ближайших записей проверяется за один `get`.
+    SEARCH_K = 8
+
+    def __init__(self, max_items: int, ttl: int, threshold: float):
+        """Создаёт кэш.
+
+        Args:
+            max_items: Максимум ответов в кэше.
+            ttl: Время жизни ответа в секундах.
+            threshold: Минимальная cosine similarity для попадания.
+        """
+        self.max_items = max(1, int(max_items))
+        self.ttl = ttl
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._index = VectorIndex(initial_capacity=min(self.max_items, 1024))
+        self._entries: "OrderedDict[int, _CachedAnswer]" = OrderedDict()
+        self._ids = itertools.count(1)
+        self._index_version: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _sync_version(self, index_version: Optional[str]) -> None:
+        """Сбрасывает кэш, если индекс базы знаний пересобран."""
+        if index_version != self._index_version:
+            self.clear()
+            self._index_version = index_version
+
+    def _remove(self, entry_id: int) -> None:
+        self._entries.pop(entry_id, None)
+        self._index.remove(entry_id)
+
+    def get(self, embedding: np.ndarray, index_version: Optional[str]) -> Optional[str]:
+        """Возвращает закэшированный ответ на похожий вопрос или `None`.
+
+        Просматривает до `SEARCH_K` ближайших записей: истёкшие по TTL
+        удаляются из индекса, чтобы не заслонять свежие ответы рядом.
+        """
+        self._sync_version(index_version)
+        now = time.monotonic()
+        for entry_id, similarity in self._index.search(embedding, self.SEARCH_K):
+            if similarity < self.threshold:
+                break
+            entry = self._entries[entry_id]
+            if now - entry.created_at > self.ttl:
+                self._remove(entry_id)
+                continue
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return entry.answer
+
+        self.misses += 1
+        return None
+
+    def put(self, embedding: np.ndarray, answer: str, index_version: Optional[str]) -> None:
+        """Сохраняет ответ; при переполнении вытесняет давно не запрошенный."""
+        self._sync_version(index_version)
+        while len(self._entries) >= self.max_items:
+            oldest_id = next(iter(self._entries))
+            self._remove(oldest_id)
+
+        entry_id = next(self._ids)
+        self._entries[entry_id] = _CachedAnswer(answer, time.monotonic())
+        self._index.add(entry_id, embedding)
+
+    def clear(self) -> None:
+        """Удаляет все ответы."""
+        self._entries.clear()
+        self._index.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Счётчики кэша для логов и мониторинга."""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+answer_cache = AnswerCache(
+    max_items=settings.ANSWER_CACHE_MAX_ITEMS,
+    ttl=settings.ANSWER_CACHE_TTL,
+    threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+)
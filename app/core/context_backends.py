@@ -0,0 +1,415 @@
+"""Хранилища истории диалогов для `ContextManager`.
+
+`ContextManager` (см. `app.core.context_manager`) держит истории в
+памяти процесса и, если задано хранилище, читает из него недостающие и
+сбрасывает изменённые пачками. Хранилище выбирается `CONTEXT_BACKEND`:
+- `memory` — без хранилища, история теряется при рестарте;
+- `sqlite` — файл `CONTEXT_SQLITE_PATH` в режиме WAL, общий для воркеров
+  на одной машине;
+- `redis` — сервер по `CONTEXT_REDIS_URL` (Redis или совместимый с RESP),
+  общий для нескольких машин. Клиент минимальный, без внешних зависимостей.
+
+Новые сообщения дописываются в конец истории, а не заменяют её целиком:
+воркеры, одновременно отвечающие одному пользователю, не затирают
+сообщения друг друга. После записи история обрезается до последних
+`MAX_CONTEXT_MESSAGES` сообщений. В SQLite каждое сообщение — строка
+таблицы, в Redis — элемент списка (RPUSH, LTRIM, PEXPIRE в одной
+транзакции MULTI/EXEC). Истории без сообщений дольше `CONTEXT_TTL` не
+возвращаются и удаляются (в Redis — собственным TTL ключа).
+"""
+
+import abc
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+from urllib.parse import unquote
+from urllib.parse import urlparse
+
+from loguru import logger
+
+from app.config import settings
+
+Message = Tuple[str, str]
+History = Tuple[List[Message], float]
+
+
+class ContextBackend(abc.ABC):
+    """Интерфейс хранилища истории диалогов."""
+
+    def __init__(self, ttl: float, max_messages: int):
+        self.ttl = ttl
+        self.max_messages = max(1, max_messages)
+
+    @abc.abstractmethod
+    async def load(self, key: str) -> Optional[History]:
+        """История пользователя.
+
+        Returns:
+            Пара `(messages, last_activity)` или `None`, если истории нет
+            или она старше TTL.
+        """
+
+    @abc.abstractmethod
+    async def append(self, entries: Dict[str, History]) -> None:
+        """Дописывает сообщения в конец историй пользователей одной пачкой.
+
+        Каждая история после записи обрезается до `max_messages`
+        последних сообщений; `last_activity` — время новых сообщений.
+        """
+
+    @abc.abstractmethod
+    async def delete(self, keys: List[str]) -> None:
+        """Удаляет истории пользователей."""
+
+    @abc.abstractmethod
+    async def cleanup_expired(self) -> int:
+        """Удаляет истории старше TTL; возвращает их число."""
+
+    @abc.abstractmethod
+    async def aclose(self) -> None:
+        """Освобождает соединения."""
+
+
+class SQLiteContextBackend(ContextBackend):
+    """Истории в SQLite-файле (WAL), общем для процессов одной машины.
+
+    Одно сообщение — одна строка `context_messages`. Как и
+    `SQLiteLimitsBackend`: одно соединение, запросы выполняются в потоке
+    через `asyncio.to_thread` под блокировкой.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float,
+        max_messages: int,
+        busy_timeout: Optional[int] = None,
+    ):
+        super().__init__(ttl, max_messages)
+        self.path = path
+        if busy_timeout is None:
+            busy_timeout = settings.SQLITE_BUSY_TIMEOUT
+        self.busy_timeout = busy_timeout
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is not None:
+            return self._conn
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # isolation_level=None: транзакциями управляем явно (BEGIN IMMEDIATE).
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout)}")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS context_messages ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "key TEXT NOT NULL, "
+            "role TEXT NOT NULL, "
+            "content TEXT NOT NULL, "
+            "created_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_context_messages_key ON context_messages (key, id)"
+        )
+        self._conn = conn
+        return conn
+
+    def _load_sync(self, key: str) -> Optional[History]:
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT role, content, created_at FROM context_messages "
+                "WHERE key = ? ORDER BY id DESC LIMIT ?",
+                (key, self.max_messages),
+            ).fetchall()
+        if not rows:
+            return None
+        last_activity = max(row[2] for row in rows)
+        if last_activity <= time.time() - self.ttl:
+            return None
+        return [(role, content) for role, content, _ in reversed(rows)], last_activity
+
+    def _append_sync(self, entries: Dict[str, History]) -> None:
+        rows = [
+            (key, role, content, last_activity)
+            for key, (messages, last_activity) in entries.items()
+            for role, content in messages
+        ]
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT INTO context_messages (key, role, content, created_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+                # Оставляем `max_messages` последних сообщений каждой истории.
+                conn.executemany(
+                    "DELETE FROM context_messages WHERE key = ? AND id <= ("
+                    "SELECT id FROM context_messages WHERE key = ? "
+                    "ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                    [(key, key, self.max_messages) for key in entries],
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _delete_sync(self, keys: List[str]) -> None:
+        with self._lock:
+            self._connect().executemany(
+                "DELETE FROM context_messages WHERE key = ?", [(key,) for key in keys]
+            )
+
+    def _cleanup_expired_sync(self) -> int:
+        with self._lock:
+            conn = self._connect()
+            keys = [
+                row[0]
+                for row in conn.execute(
+                    "SELECT key FROM context_messages GROUP BY key HAVING MAX(created_at) <= ?",
+                    (time.time() - self.ttl,),
+                )
+            ]
+            conn.executemany("DELETE FROM context_messages WHERE key = ?", [(key,) for key in keys])
+            return len(keys)
+
+    async def load(self, key: str) -> Optional[History]:
+        return await asyncio.to_thread(self._load_sync, key)
+
+    async def append(self, entries: Dict[str, History]) -> None:
+        await asyncio.to_thread(self._append_sync, entries)
+
+    async def delete(self, keys: List[str]) -> None:
+        await asyncio.to_thread(self._delete_sync, keys)
+
+    async def cleanup_expired(self) -> int:
+        return await asyncio.to_thread(self._cleanup_expired_sync)
+
+    async def aclose(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class RespClient:
+    """Минимальный асинхронный клиент протокола RESP (Redis).
+
+    Одно соединение; команды пачки отправляются одной записью в сокет
+    (pipelining), ответы читаются по порядку. Если пачка прервана (сетевая
+    ошибка, таймаут, отмена), соединение закрывается и открывается заново
+    при следующем вызове.
+    """
+
+    def __init__(self, url: str, timeout: float = 2.0):
+        parsed = urlparse(url)
+        if parsed.scheme != "redis":
+            raise ValueError(f"Unsupported Redis URL scheme: {parsed.scheme}")
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _encode(command: Sequence) -> bytes:
+        parts = [b"*%d\r\n" % len(command)]
+        for arg in command:
+            if isinstance(arg, str):
+                arg = arg.encode("utf-8")
+            elif not isinstance(arg, bytes):
+                arg = str(arg).encode("ascii")
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Redis connection closed")
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b"+":
+            return payload.decode("utf-8")
+        if prefix == b"-":
+            # Ошибку команды возвращаем, а не бросаем: ответы остальных
+            # команд пачки нужно дочитать.
+            return RuntimeError(f"Redis error: {payload.decode('utf-8', 'replace')}")
+        if prefix == b":":
+            return int(payload)
+        if prefix == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            return (await self._reader.readexactly(length + 2))[:-2]
+        if prefix == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise ConnectionError(f"Unexpected Redis reply: {line[:32]!r}")
+
+    async def _roundtrip(self, commands: Sequence[Sequence]) -> List:
+        self._writer.write(b"".join(self._encode(command) for command in commands))
+        await self._writer.drain()
+        return [await self._read_reply() for _ in commands]
+
+    async def _connect(self) -> None:
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        handshake = []
+        if self.password is not None:
+            if self.username is not None:
+                handshake.append(("AUTH", self.username, self.password))
+            else:
+                handshake.append(("AUTH", self.password))
+        if self.db:
+            handshake.append(("SELECT", self.db))
+        if handshake:
+            for reply in await self._roundtrip(handshake):
+                if isinstance(reply, Exception):
+                    raise reply
+
+    async def _close(self) -> None:
+        writer = self._writer
+        # Сбрасываем до ожидания: даже если его прервут, соединение не переиспользуется.
+        self._reader = self._writer = None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    async def pipeline(self, commands: Sequence[Sequence]) -> List:
+        """Выполняет команды одной пачкой и возвращает их ответы.
+
+        Raises:
+            RuntimeError: Сервер вернул ошибку на одну из команд.
+        """
+        async with self._lock:
+            try:
+                if self._writer is None:
+                    await asyncio.wait_for(self._connect(), self.timeout)
+                replies = await asyncio.wait_for(self._roundtrip(commands), self.timeout)
+            except BaseException:
+                # Любой обрыв посреди пачки (включая отмену задачи) оставляет
+                # непрочитанные ответы: соединение не переиспользуем.
+                await self._close()
+                raise
+        for reply in replies:
+            if isinstance(reply, Exception):
+                raise reply
+        return replies
+
+    async def execute(self, *command):
+        """Выполняет одну команду."""
+        return (await self.pipeline([command]))[0]
+
+    async def aclose(self) -> None:
+        async with self._lock:
+            await self._close()
+
+
+class RedisContextBackend(ContextBackend):
+    """Истории в Redis: список `<prefix><user_id>` JSON-строк
+    `[role, content, created_at]`, срок жизни — по TTL ключа."""
+
+    def __init__(
+        self,
+        url: str,
+        ttl: float,
+        max_messages: int,
+        prefix: str = "context:",
+        timeout: float = 2.0,
+    ):
+        super().__init__(ttl, max_messages)
+        self.prefix = prefix
+        self.client = RespClient(url, timeout=timeout)
+
+    async def load(self, key: str) -> Optional[History]:
+        items = await self.client.execute("LRANGE", self.prefix + key, -self.max_messages, -1)
+        if not items:
+            return None
+        records = [json.loads(item) for item in items]
+        last_activity = max(record[2] for record in records)
+        if time.time() - last_activity > self.ttl:
+            return None
+        return [(role, content) for role, content, _ in records], last_activity
+
+    async def append(self, entries: Dict[str, History]) -> None:
+        now = time.time()
+        commands: List[Sequence] = [("MULTI",)]
+        for key, (messages, last_activity) in entries.items():
+            expires_ms = int((self.ttl - (now - last_activity)) * 1000)
+            if expires_ms <= 0 or not messages:
+                continue
+            payloads = [
+                json.dumps([role, content, last_activity], ensure_ascii=False)
+                for role, content in messages
+            ]
+            commands.append(("RPUSH", self.prefix + key, *payloads))
+            commands.append(("LTRIM", self.prefix + key, -self.max_messages, -1))
+            commands.append(("PEXPIRE", self.prefix + key, expires_ms))
+        if len(commands) == 1:
+            return
+        commands.append(("EXEC",))
+        # MULTI/EXEC: пачка применяется целиком или не применяется, поэтому
+        # повтор после ошибки не продублирует часть сообщений.
+        results = (await self.client.pipeline(commands))[-1]
+        if results is None:
+            raise RuntimeError("Redis transaction aborted")
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+    async def delete(self, keys: List[str]) -> None:
+        if keys:
+            await self.client.execute("DEL", *(self.prefix + key for key in keys))
+
+    async def cleanup_expired(self) -> int:
+        # Ключи удаляет сам Redis по TTL.
+        return 0
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+def create_context_backend() -> Optional[ContextBackend]:
+    """Хранилище по `CONTEXT_BACKEND`; `None` — только память процесса."""
+    if settings.CONTEXT_BACKEND == "sqlite":
+        logger.info("Conversation context stored in {}", settings.CONTEXT_SQLITE_PATH)
+        return SQLiteContextBackend(
+            settings.CONTEXT_SQLITE_PATH,
+            ttl=settings.CONTEXT_TTL,
+            max_messages=settings.MAX_CONTEXT_MESSAGES,
+        )
+    if settings.CONTEXT_BACKEND == "redis":
+        logger.info(
+            "Conversation context stored in Redis ({})",
+            urlparse(settings.CONTEXT_REDIS_URL).hostname,
+        )
+        return RedisContextBackend(
+            settings.CONTEXT_REDIS_URL,
+            ttl=settings.CONTEXT_TTL,
+            max_messages=settings.MAX_CONTEXT_MESSAGES,
+            prefix=settings.CONTEXT_REDIS_PREFIX,
+            timeout=settings.CONTEXT_REDIS_TIMEOUT,
+        )
+    return None
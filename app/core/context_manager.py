@@ -2,58 +2,383 @@
 
 Контекст хранится в памяти процесса:
 - ограничение длины задаётся `max_context`;
-- устаревшие контексты удаляются по TTL.
+- устаревшие контексты (без новых сообщений дольше `ttl`) удаляются;
+- пользователей не больше `max_users`: сверх лимита вытесняются
+  давно не писавшие.
 
-Важно: при рестарте приложения контекст теряется (это ожидаемо).
+Диалоги лежат в `OrderedDict` в порядке последнего обращения, поэтому
+устаревшие всегда в начале: фоновая задача раз в `CONTEXT_SWEEP_INTERVAL`
+секунд снимает их с начала, не обходя остальных, а `get_context`
+дополнительно проверяет срок своей записи. История пользователя — кортеж
+пар `(role, content)` вместо deque словарей.
+
+Если задано хранилище (`CONTEXT_BACKEND`, см. `app.core.context_backends`),
+память работает как кэш поверх него:
+- чтение идёт из памяти, а при промахе — из хранилища (read-through);
+  копия считается свежей `CONTEXT_CACHE_TTL` секунд, потом перечитывается,
+  чтобы увидеть сообщения, принятые другими воркерами;
+- новые сообщения сразу попадают в память, а в хранилище дописываются
+  фоновой задачей пачками раз в `CONTEXT_FLUSH_INTERVAL` секунд или по
+  набору `CONTEXT_FLUSH_BATCH` изменённых диалогов (write-behind).
+  В хранилище уходят только новые сообщения, а не вся история из
+  памяти, поэтому устаревшая копия одного воркера не затирает сообщения,
+  принятые другим. При остановке приложения несброшенное дописывается.
+
+Без хранилища при рестарте приложения контекст теряется.
 """
 
+import asyncio
+import sys
 import time
-from collections import deque
+from collections import OrderedDict
 from typing import Dict
 from typing import List
+from typing import Optional
+from typing import Tuple
+
+from loguru import logger
+
+from app.config import settings
+from app.core.context_backends import ContextBackend
+from app.core.context_backends import History
+from app.core.context_backends import Message
+from app.core.context_backends import create_context_backend
+
+# Фиксированная часть памяти диалога: запись, кортеж истории и узел словаря.
+_CONVERSATION_OVERHEAD = 200
+
+
+def _message_size(message: Message) -> int:
+    """Память сообщения: пара и строка текста (роли интернированы)."""
+    return sys.getsizeof(message) + sys.getsizeof(message[1])
+
+
+class _Conversation:
+    """История одного пользователя."""
+
+    __slots__ = ("messages", "last_activity", "touched_at", "size")
+
+    def __init__(self, last_activity: float, messages: Tuple[Message, ...] = ()):
+        self.messages = messages
+        self.last_activity = last_activity
+        # Время записи в память или чтения из хранилища — по нему упорядочен кэш.
+        self.touched_at = last_activity
+        self.size = _CONVERSATION_OVERHEAD + sum(_message_size(message) for message in messages)
+
+
+class _PendingWrite:
+    """Несброшенные изменения истории пользователя."""
+
+    __slots__ = ("clear", "messages", "last_activity")
+
+    def __init__(self):
+        # Удалить историю в хранилище перед записью `messages`.
+        self.clear = False
+        self.messages: List[Message] = []
+        self.last_activity = 0.0
+
+    def merge_older(self, older: "_PendingWrite") -> None:
+        """Возвращает в очередь более ранние изменения, не сброшенные из-за ошибки."""
+        if self.clear:
+            # Очистка после них отменяет их.
+            return
+        self.clear = older.clear
+        self.messages = older.messages + self.messages
+        self.last_activity = max(self.last_activity, older.last_activity)
+
 
 class ContextManager:
     """Хранит последние сообщения пользователя для более связного диалога."""
-    def __init__(self, max_context: int = 5, ttl: int = 3600):
+    def __init__(
+        self,
+        max_context: int = 5,
+        ttl: int = 3600,
+        max_users: Optional[int] = None,
+        sweep_interval: Optional[float] = None,
+        backend: Optional[ContextBackend] = None,
+        cache_ttl: Optional[float] = None,
+        flush_interval: Optional[float] = None,
+        flush_batch: Optional[int] = None,
+    ):
         """Создаёт менеджер контекста.
 
         Args:
             max_context: Максимум сообщений в истории на пользователя.
             ttl: Время жизни контекста в секундах с момента активности.
+            max_users: Максимум пользователей с историей в памяти
+                (`CONTEXT_MAX_USERS`).
+            sweep_interval: Период фоновой очистки в секундах
+                (`CONTEXT_SWEEP_INTERVAL`).
+            backend: Хранилище истории; `None` — только память процесса.
+            cache_ttl: Сколько секунд копия из хранилища считается свежей
+                (`CONTEXT_CACHE_TTL`).
+            flush_interval: Период сброса изменений в хранилище в секундах
+                (`CONTEXT_FLUSH_INTERVAL`).
+            flush_batch: Число изменённых диалогов, при котором сброс
+                начинается раньше (`CONTEXT_FLUSH_BATCH`).
         """
         self.max_context = max_context
         self.ttl = ttl
-        self.contexts = {}  # {user_id: deque([msg1, msg2, ...])}
-        self.timestamps = {}  # {user_id: last_activity_time}
+        self.max_users = max(1, max_users or settings.CONTEXT_MAX_USERS)
+        self.sweep_interval = sweep_interval or settings.CONTEXT_SWEEP_INTERVAL
+        self.backend = backend
+        if backend is None:
+            # Без хранилища копия в памяти единственная и живёт весь TTL.
+            self.cache_ttl = ttl
+        else:
+            if cache_ttl is None:
+                cache_ttl = settings.CONTEXT_CACHE_TTL
+            self.cache_ttl = min(ttl, cache_ttl)
+        self.flush_interval = flush_interval or settings.CONTEXT_FLUSH_INTERVAL
+        self.flush_batch = max(1, flush_batch or settings.CONTEXT_FLUSH_BATCH)
+        self.expired = 0
+        self.evicted = 0
+        self.loads = 0
+        self.flushed = 0
+        self.backend_errors = 0
+        self._conversations: "OrderedDict[str, _Conversation]" = OrderedDict()
+        # Изменения, ещё не сброшенные в хранилище.
+        self._pending: Dict[str, _PendingWrite] = {}
+        self._flush_requested = asyncio.Event()
+        self._messages = 0
+        self._memory_bytes = 0
+        self._sweeper: Optional[asyncio.Task] = None
+        self._flusher: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Запускает фоновые очистку и сброс, если они ещё не работают."""
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_periodically())
+        if self.backend is not None and (self._flusher is None or self._flusher.done()):
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    def _remove(self, user_id: str) -> bool:
+        conversation = self._conversations.pop(user_id, None)
+        if conversation is None:
+            return False
+        self._messages -= len(conversation.messages)
+        self._memory_bytes -= conversation.size
+        return True
+
+    def _cache(self, user_id: str, conversation: _Conversation) -> None:
+        self._remove(user_id)
+        self._conversations[user_id] = conversation
+        self._messages += len(conversation.messages)
+        self._memory_bytes += conversation.size
+
+        while len(self._conversations) > self.max_users:
+            evicted_user = next(iter(self._conversations))
+            self._remove(evicted_user)
+            self.evicted += 1
+
+    async def _load(self, user_id: str) -> Optional[History]:
+        self.loads += 1
+        try:
+            return await self.backend.load(user_id)
+        except Exception as e:
+            # Без истории ответить можно, без ответа — нет.
+            logger.warning(f"Context load failed, continuing without history: {e}")
+            self.backend_errors += 1
+            return None
+
+    async def _lookup(self, user_id: str, now: float) -> Optional[_Conversation]:
+        """Действующая история пользователя: из памяти или из хранилища."""
+        conversation = self._conversations.get(user_id)
+        if conversation is not None:
+            expired = now - conversation.last_activity > self.ttl
+            if not expired and now - conversation.touched_at <= self.cache_ttl:
+                return conversation
+            self._remove(user_id)
+            if expired:
+                self.expired += 1
+        if self.backend is None:
+            return None
+
+        pending = self._pending.get(user_id)
+        history = None if pending is not None and pending.clear else await self._load(user_id)
+        messages, last_activity = history if history is not None else ([], 0.0)
+        # Несброшенные сообщения этого воркера — в хранилище их ещё нет.
+        pending = self._pending.get(user_id)
+        if pending is not None:
+            if pending.clear:
+                messages = []
+            messages = messages + pending.messages
+            last_activity = max(last_activity, pending.last_activity)
+        if not messages or now - last_activity > self.ttl:
+            return None
+        conversation = _Conversation(
+            last_activity,
+            tuple((sys.intern(role), content) for role, content in messages[-self.max_context:]),
+        )
+        conversation.touched_at = now
+        self._cache(user_id, conversation)
+        return conversation
 
     async def add_message(self, user_id: str, role: str, content: str):
         """Добавление сообщения в контекст."""
-        if user_id not in self.contexts:
-            self.contexts[user_id] = deque(maxlen=self.max_context)
-        
-        self.contexts[user_id].append({"role": role, "content": content})
-        self.timestamps[user_id] = time.time()
+        self.start()
+        now = time.time()
+        conversation = await self._lookup(user_id, now)
+        if conversation is None:
+            conversation = _Conversation(now)
+            self._cache(user_id, conversation)
+        else:
+            self._conversations.move_to_end(user_id)
+        conversation.last_activity = conversation.touched_at = now
+
+        message = (sys.intern(role), content)
+        messages = conversation.messages + (message,)
+        added = _message_size(message)
+        dropped = messages[:-self.max_context] if len(messages) > self.max_context else ()
+        removed = sum(_message_size(item) for item in dropped)
+        conversation.messages = messages[len(dropped):]
+        conversation.size += added - removed
+        self._memory_bytes += added - removed
+        self._messages += 1 - len(dropped)
+
+        if self.backend is not None:
+            pending = self._pending.setdefault(user_id, _PendingWrite())
+            pending.messages.append(message)
+            pending.last_activity = now
+            if len(self._pending) >= self.flush_batch:
+                self._flush_requested.set()
 
     async def get_context(self, user_id: str) -> List[Dict]:
         """Получение истории для пользователя."""
-        await self.cleanup_expired()
-        if user_id in self.contexts:
-            return list(self.contexts[user_id])
-        return []
+        conversation = await self._lookup(user_id, time.time())
+        if conversation is None:
+            return []
+        return [{"role": role, "content": content} for role, content in conversation.messages]
 
     async def clear_context(self, user_id: str):
         """Очистка контекста."""
-        if user_id in self.contexts:
-            del self.contexts[user_id]
-        if user_id in self.timestamps:
-            del self.timestamps[user_id]
+        self._remove(user_id)
+        if self.backend is not None:
+            pending = self._pending[user_id] = _PendingWrite()
+            pending.clear = True
 
-    async def cleanup_expired(self):
-        """Удаление устаревших контекстов по TTL."""
+    async def cleanup_expired(self) -> int:
+        """Удаление устаревших контекстов из памяти.
+
+        Обходит только устаревшие записи в начале словаря. С хранилищем
+        удаляются и копии старше `cache_ttl`: их всё равно нужно перечитать.
+
+        Returns:
+            Количество удалённых контекстов.
+        """
         now = time.time()
-        expired_users = [
-            user_id for user_id, last_ts in self.timestamps.items()
-            if now - last_ts > self.ttl
-        ]
-        for user_id in expired_users:
-            await self.clear_context(user_id)
+        removed = 0
+        while self._conversations:
+            user_id, conversation = next(iter(self._conversations.items()))
+            if now - conversation.touched_at <= self.cache_ttl:
+                break
+            self._remove(user_id)
+            removed += 1
+            if now - conversation.last_activity > self.ttl:
+                self.expired += 1
+        return removed
+
+    async def flush(self) -> int:
+        """Дописывает новые сообщения в хранилище одной пачкой.
+
+        При ошибке изменения остаются в очереди до следующего сброса.
+
+        Returns:
+            Количество сброшенных диалогов.
+        """
+        if self.backend is None or not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        deleted = [user_id for user_id, write in pending.items() if write.clear]
+        appended = {
+            user_id: (write.messages, write.last_activity)
+            for user_id, write in pending.items()
+            if write.messages
+        }
+        try:
+            if deleted:
+                await self.backend.delete(deleted)
+            if appended:
+                await self.backend.append(appended)
+        except BaseException as e:
+            # Повтор безопасен: удаление идемпотентно, а пачка сообщений
+            # записывается в хранилище целиком или не записывается.
+            for user_id, write in pending.items():
+                newer = self._pending.setdefault(user_id, write)
+                if newer is not write:
+                    newer.merge_older(write)
+            if not isinstance(e, Exception):
+                # Остановка посреди сброса: пачку допишет `aclose`.
+                raise
+            logger.error(f"Context flush failed, {len(pending)} conversations kept for retry: {e}")
+            self.backend_errors += 1
+            return 0
+        self.flushed += len(pending)
+        return len(pending)
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            await self.flush()
+
+    async def _sweep_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                removed = await self.cleanup_expired()
+                if self.backend is not None:
+                    removed += await self.backend.cleanup_expired()
+            except Exception as e:
+                logger.error(f"Context cleanup failed: {e}")
+                continue
+            if removed:
+                logger.debug("Expired {} conversation contexts", removed)
+
+    async def aclose(self) -> None:
+        """Останавливает фоновые задачи, дописывает изменения и закрывает хранилище."""
+        for task in (self._sweeper, self._flusher):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._sweeper = self._flusher = None
+        if self.backend is not None:
+            await self.flush()
+            if self._pending:
+                logger.warning(
+                    "Conversation contexts not persisted on shutdown: {}", len(self._pending)
+                )
+            await self.backend.aclose()
+
+    def stats(self) -> Dict[str, int]:
+        """Размер хранилища и счётчики удалений для мониторинга.
+
+        `memory_bytes` — оценка по `sys.getsizeof` текстов и служебных
+        структур, поддерживается при каждом изменении.
+        """
+        return {
+            "users": len(self._conversations),
+            "messages": self._messages,
+            "memory_bytes": self._memory_bytes,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "loads": self.loads,
+            "pending_writes": len(self._pending),
+            "flushed": self.flushed,
+            "backend_errors": self.backend_errors,
+        }
+
+
+# Один менеджер на процесс: Telegram и Jivo делят лимит пользователей и
+# фоновую очистку.
+context_manager = ContextManager(
+    max_context=settings.MAX_CONTEXT_MESSAGES,
+    ttl=settings.CONTEXT_TTL,
+    backend=create_context_backend(),
+)
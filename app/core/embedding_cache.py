@@ -0,0 +1,186 @@
+"""Персистентный кэш embeddings на диске (SQLite).
+
+Ключ — sha256 от имени модели и нормализованного текста, значение —
+float32-вектор в формате `app.database.embedding_codec`. Кэш
+консультируется до любого запроса к embeddings API: повторные вопросы,
+неизменённые чанки и тестовые запросы не тратят API-вызовы.
+
+Размер ограничен `max_items`: при переполнении удаляются записи, которые
+дольше всех не использовались (LRU по колонке `last_used`).
+
+Ошибки SQLite не ломают pipeline: кэш логирует их и отключается.
+"""
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Dict
+from typing import Iterable
+from typing import Optional
+
+import numpy as np
+from loguru import logger
+
+from app.database.embedding_codec import EMBEDDING_VERSION_FLOAT32
+from app.database.embedding_codec import decode_embedding
+from app.database.embedding_codec import encode_embedding
+
+# При переполнении удаляем чуть больше, чем нужно, чтобы не чистить кэш
+# на каждой вставке.
+EVICTION_SLACK = 0.1
+SQL_PARAMS_PER_QUERY = 500
+
+
+class EmbeddingCache:
+    """LRU-кэш embeddings в SQLite с счётчиками попаданий и промахов."""
+
+    def __init__(self, path: str, max_items: int):
+        """Создаёт кэш; файл БД открывается при первом обращении.
+
+        Args:
+            path: Путь к SQLite-файлу кэша.
+            max_items: Максимум записей до LRU-вытеснения.
+        """
+        self.path = path
+        self.max_items = max(1, int(max_items))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._size = 0
+        self._disabled = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        """Ключ кэша: модель + текст с нормализованными Unicode и пробелами."""
+        normalized = " ".join(unicodedata.normalize("NFC", text).split())
+        return hashlib.sha256(f"{model}\n{normalized}".encode("utf-8")).hexdigest()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Открывает соединение и создаёт таблицу при необходимости."""
+        if self._conn is not None:
+            return self._conn
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embedding_cache ("
+            "key TEXT PRIMARY KEY, "
+            "dim INTEGER NOT NULL, "
+            "vector BLOB NOT NULL, "
+            "last_used REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_embedding_cache_last_used "
+            "ON embedding_cache (last_used)"
+        )
+        conn.commit()
+        self._size = conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+        self._conn = conn
+        return conn
+
+    def _disable(self, exc: Exception) -> None:
+        """Отключает кэш после ошибки SQLite, не прерывая обработку запроса."""
+        logger.warning("Embedding cache disabled after error: {}", exc)
+        self._disabled = True
+
+    def _get_many_sync(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        keys = list(keys)
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            conn = self._connect()
+            # Лимит SQLite на число параметров в одном запросе.
+            for start in range(0, len(keys), SQL_PARAMS_PER_QUERY):
+                part = keys[start:start + SQL_PARAMS_PER_QUERY]
+                placeholders = ",".join("?" * len(part))
+                rows = conn.execute(
+                    f"SELECT key, dim, vector FROM embedding_cache WHERE key IN ({placeholders})",
+                    part,
+                ).fetchall()
+                for key, dim, vector in rows:
+                    found[key] = decode_embedding(vector, EMBEDDING_VERSION_FLOAT32, dim)
+            if found:
+                now = time.time()
+                conn.executemany(
+                    "UPDATE embedding_cache SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                conn.commit()
+        return found
+
+    def _put_many_sync(self, items: Dict[str, np.ndarray]) -> None:
+        with self._lock:
+            conn = self._connect()
+            now = time.time()
+            rows = []
+            for key, vector in items.items():
+                blob, dim = encode_embedding(vector, EMBEDDING_VERSION_FLOAT32)
+                rows.append((key, dim, blob, now))
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO embedding_cache (key, dim, vector, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._size += conn.total_changes - before
+            if self._size > self.max_items:
+                self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """Удаляет давно не использованные записи сверх `max_items`."""
+        # Другие воркеры тоже пишут в файл, поэтому размер уточняем по БД.
+        self._size = conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+        excess = self._size - self.max_items
+        if excess <= 0:
+            return
+        excess += int(self.max_items * EVICTION_SLACK)
+        conn.execute(
+            "DELETE FROM embedding_cache WHERE key IN ("
+            "SELECT key FROM embedding_cache ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+        self._size = max(0, self._size - excess)
+        self.evictions += excess
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        """Возвращает найденные векторы по ключам и обновляет счётчики."""
+        keys = list(dict.fromkeys(keys))
+        if self._disabled or not keys:
+            return {}
+        try:
+            found = await asyncio.to_thread(self._get_many_sync, keys)
+        except (sqlite3.Error, OSError, ValueError) as exc:
+            self._disable(exc)
+            return {}
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    async def put_many(self, items: Dict[str, np.ndarray]) -> None:
+        """Сохраняет векторы; существующие ключи не перезаписываются."""
+        if self._disabled or not items:
+            return
+        try:
+            await asyncio.to_thread(self._put_many_sync, items)
+        except (sqlite3.Error, OSError, ValueError) as exc:
+            self._disable(exc)
+
+    def stats(self) -> Dict[str, int]:
+        """Счётчики кэша для логов и мониторинга."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": self._size,
+        }
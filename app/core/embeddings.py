@@ -0,0 +1,256 @@
+"""Общий асинхронный клиент embeddings API.
+
+Один экземпляр `embeddings_client` используется и `RAGEngine`, и
+`QuestionsDB`, чтобы:
+- не блокировать event loop синхронными HTTP-вызовами;
+- переиспользовать пул HTTP-соединений вместо клиента на каждый запрос;
+- ограничивать число одновременных запросов к провайдеру.
+
+Перед любым запросом к API проверяется персистентный `EmbeddingCache`
+(если включён `EMBEDDING_CACHE_ENABLED`).
+
+Для пересборки индекса есть `embed_many`: тексты отправляются пачками
+(API принимает список), пачки идут параллельно с ограничением, а при
+rate limit запрос повторяется с экспоненциальной задержкой.
+
+Клиент пересоздаётся автоматически, если админка поменяла провайдера или
+ключ в runtime.
+"""
+
+import asyncio
+import random
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Set
+from typing import Tuple
+
+import httpx
+import numpy as np
+from loguru import logger
+from openai import APIConnectionError
+from openai import APITimeoutError
+from openai import AsyncOpenAI
+from openai import InternalServerError
+from openai import RateLimitError
+
+from app.config import settings
+from app.core.embedding_cache import EmbeddingCache
+from app.core.metrics import record_provider_error
+
+# Временные ошибки провайдера, после которых пачку имеет смысл повторить.
+RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+
+class EmbeddingsClient:
+    """Асинхронный embeddings-клиент с пулом соединений и лимитом конкурентности."""
+
+    def __init__(self, cache: Optional[EmbeddingCache] = None):
+        """Создаёт клиента; `cache` — опциональный персистентный кэш векторов."""
+        self.cache = cache
+        self._client: Optional[AsyncOpenAI] = None
+        self._client_key: Optional[Tuple] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._closing: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def _provider_credentials() -> Tuple[Optional[str], Optional[str]]:
+        """Возвращает `(api_key, base_url)` текущего провайдера."""
+        if settings.LLM_PROVIDER == "proxiapi":
+            return settings.PROXIAPI_API_KEY, settings.PROXIAPI_API_BASE
+        return settings.OPENAI_API_KEY, settings.OPENAI_API_BASE
+
+    def _close_stale_client(self, client: AsyncOpenAI) -> None:
+        """Закрывает в фоне клиента, заменённого после смены настроек или loop."""
+        task = asyncio.get_running_loop().create_task(self._close_client(client))
+        # Ссылка на задачу держится до завершения, иначе её соберёт GC.
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    @staticmethod
+    async def _close_client(client: AsyncOpenAI) -> None:
+        try:
+            await client.close()
+        except Exception as e:
+            # Соединения прежнего event loop могут быть уже недоступны.
+            logger.debug("Stale embeddings client close failed: {}", e)
+
+    def _get_client(self) -> AsyncOpenAI:
+        """Возвращает закэшированного клиента, пересоздавая его при смене настроек."""
+        api_key, base_url = self._provider_credentials()
+        # Пул соединений httpx привязан к event loop, поэтому loop входит в ключ.
+        key = (api_key, base_url, id(asyncio.get_running_loop()))
+        if self._client is not None and self._client_key == key:
+            return self._client
+        if self._client is not None:
+            self._close_stale_client(self._client)
+
+        concurrency = max(1, settings.EMBEDDING_MAX_CONCURRENCY)
+        http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                settings.EMBEDDING_TIMEOUT,
+                connect=settings.EMBEDDING_CONNECT_TIMEOUT,
+            ),
+            limits=httpx.Limits(
+                max_connections=concurrency,
+                max_keepalive_connections=concurrency,
+            ),
+        )
+        self._client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=http_client,
+            max_retries=settings.EMBEDDING_MAX_RETRIES,
+        )
+        self._client_key = key
+        self._semaphore = asyncio.Semaphore(concurrency)
+        logger.debug("Embeddings client created for provider={}", settings.LLM_PROVIDER)
+        return self._client
+
+    async def embed(self, text: str) -> np.ndarray:
+        """Возвращает embedding текста как float32-вектор."""
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(settings.EMBEDDING_MODEL, text)
+            cached = await self.cache.get_many([cache_key])
+            if cache_key in cached:
+                return cached[cache_key]
+
+        client = self._get_client()
+        async with self._semaphore:
+            try:
+                response = await client.embeddings.create(
+                    input=text,
+                    model=settings.EMBEDDING_MODEL,
+                )
+            except Exception:
+                record_provider_error("llm", "embeddings")
+                raise
+        vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+
+        if cache_key is not None:
+            await self.cache.put_many({cache_key: vector})
+        return vector
+
+    async def _embed_batch(self, client: AsyncOpenAI, texts: Sequence[str]) -> np.ndarray:
+        """Один запрос со списком текстов; повторяет его при rate limit."""
+        attempts = max(1, settings.EMBEDDING_RETRY_ATTEMPTS)
+        for attempt in range(1, attempts + 1):
+            try:
+                async with self._semaphore:
+                    response = await client.embeddings.create(
+                        input=list(texts),
+                        model=settings.EMBEDDING_MODEL,
+                    )
+                break
+            except RETRYABLE_ERRORS as exc:
+                record_provider_error("llm", "embeddings")
+                if attempt >= attempts:
+                    raise
+                delay = settings.EMBEDDING_RETRY_BASE_DELAY * (2 ** (attempt - 1))
+                delay += random.uniform(0, delay / 2)
+                logger.warning(
+                    "Embeddings batch failed (attempt {}/{}), retry in {:.1f}s: {}",
+                    attempt,
+                    attempts,
+                    delay,
+                    exc,
+                )
+                await asyncio.sleep(delay)
+
+        # Порядок в ответе гарантируется полем `index`, а не позицией.
+        data = sorted(response.data, key=lambda item: item.index)
+        return np.asarray([item.embedding for item in data], dtype=np.float32)
+
+    async def embed_many(
+        self,
+        texts: Sequence[str],
+        batch_size: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+    ) -> np.ndarray:
+        """Возвращает матрицу embeddings для списка текстов.
+
+        Args:
+            texts: Тексты в нужном порядке.
+            batch_size: Текстов в одном запросе (`EMBEDDING_BATCH_SIZE`).
+            concurrency: Параллельных пачек (`EMBEDDING_REBUILD_CONCURRENCY`);
+                меньше общего лимита, чтобы пересборка не вытесняла запросы ботов.
+            on_progress: Колбэк `(готово, всего)` после каждой пачки.
+
+        Returns:
+            float32-матрица формы `(len(texts), dimension)`.
+        """
+        if len(texts) == 0:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        cached: Dict[str, np.ndarray] = {}
+        keys: List[Optional[str]] = [None] * len(texts)
+        pending = list(texts)
+        if self.cache is not None:
+            keys = [self.cache.make_key(settings.EMBEDDING_MODEL, text) for text in texts]
+            cached = await self.cache.get_many(keys)
+            pending = [text for text, key in zip(texts, keys) if key not in cached]
+
+        fresh = await self._embed_pending(pending, batch_size, concurrency, on_progress)
+
+        if self.cache is not None:
+            pending_keys = [key for key in keys if key not in cached]
+            await self.cache.put_many(dict(zip(pending_keys, fresh)))
+            fresh_iter = iter(fresh)
+            return np.stack([
+                cached[key] if key in cached else next(fresh_iter)
+                for key in keys
+            ])
+        return fresh
+
+    async def _embed_pending(
+        self,
+        texts: Sequence[str],
+        batch_size: Optional[int],
+        concurrency: Optional[int],
+        on_progress: Optional[Callable[[int, int], None]],
+    ) -> np.ndarray:
+        """Запрашивает embeddings у API пачками с ограниченным параллелизмом."""
+        total = len(texts)
+        if total == 0:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        # Пачки повторяет только `_embed_batch`: встроенные ретраи SDK поверх
+        # него умножали бы число попыток и сбивали бы backoff при rate limit.
+        client = self._get_client().with_options(max_retries=0)
+        size = max(1, batch_size or settings.EMBEDDING_BATCH_SIZE)
+        concurrency = concurrency or settings.EMBEDDING_REBUILD_CONCURRENCY
+        batch_limit = asyncio.Semaphore(max(1, concurrency))
+        batches = [texts[start:start + size] for start in range(0, total, size)]
+        results: List[Optional[np.ndarray]] = [None] * len(batches)
+        done = 0
+
+        async def run_batch(position: int) -> None:
+            nonlocal done
+            async with batch_limit:
+                results[position] = await self._embed_batch(client, batches[position])
+            done += len(batches[position])
+            if on_progress is not None:
+                on_progress(done, total)
+
+        await asyncio.gather(*(run_batch(i) for i in range(len(batches))))
+        return np.vstack(results)
+
+    async def aclose(self) -> None:
+        """Закрывает пул HTTP-соединений."""
+        if self._client is not None:
+            await self._client.close()
+        self._client = None
+        self._client_key = None
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
+
+
+embeddings_client = EmbeddingsClient(
+    cache=EmbeddingCache(settings.EMBEDDING_CACHE_PATH, settings.EMBEDDING_CACHE_MAX_ITEMS)
+    if settings.EMBEDDING_CACHE_ENABLED
+    else None
+)
@@ -0,0 +1,206 @@
+"""Фабрика FAISS индексов для базы знаний.
+
+Тип индекса задаётся `RAG_INDEX_TYPE`:
+- `flat` — точный перебор, подходит для баз в тысячи чанков;
+- `hnsw` — граф HNSW (`RAG_HNSW_M`, `RAG_HNSW_EF_CONSTRUCTION`), точность
+  поиска регулируется `RAG_HNSW_EF_SEARCH`;
+- `ivfpq` — инвертированные списки с product quantization
+  (`RAG_IVF_NLIST`, `RAG_PQ_M`, `RAG_PQ_NBITS`), требует обучения на
+  векторах при пересборке; точность — `RAG_IVF_NPROBE`.
+
+IVF-PQ имеет смысл только на больших базах: если векторов слишком мало
+для обучения квантизаторов, строится `flat`.
+
+После сборки приближённого индекса `evaluate_recall` сравнивает его с
+точным перебором на зашумлённых векторах базы и возвращает recall@k и
+задержки.
+"""
+
+import math
+import time
+from typing import Dict
+
+import faiss
+import numpy as np
+from loguru import logger
+
+from app.config import settings
+
+METRIC_COSINE = "cosine"
+METRIC_L2 = "l2"
+
+INDEX_FLAT = "flat"
+INDEX_HNSW = "hnsw"
+INDEX_IVFPQ = "ivfpq"
+
+# Порог FAISS, ниже которого k-means предупреждает о нехватке точек.
+MIN_TRAIN_POINTS_PER_CENTROID = 39
+
+# Относительная норма шума, которым `evaluate_recall` отводит запросы от
+# векторов базы: запрос похож на чанк, но не совпадает с ним.
+EVAL_QUERY_NOISE = 0.3
+
+
+def _faiss_metric(metric: str) -> int:
+    if metric == METRIC_COSINE:
+        return faiss.METRIC_INNER_PRODUCT
+    return faiss.METRIC_L2
+
+
+def index_metric(index) -> str:
+    """Метрика загруженного FAISS индекса."""
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        return METRIC_COSINE
+    return METRIC_L2
+
+
+def index_type(index) -> str:
+    """Тип загруженного FAISS индекса в терминах `RAG_INDEX_TYPE`."""
+    if isinstance(index, faiss.IndexHNSW):
+        return INDEX_HNSW
+    if isinstance(index, faiss.IndexIVF):
+        return INDEX_IVFPQ
+    return INDEX_FLAT
+
+
+def _ivf_nlist(count: int) -> int:
+    """Число inverted lists: из настроек или ~4·√N."""
+    if settings.RAG_IVF_NLIST > 0:
+        return settings.RAG_IVF_NLIST
+    return max(1, int(4 * math.sqrt(count)))
+
+
+def effective_index_type(count: int) -> str:
+    """Тип индекса, который будет построен для `count` векторов.
+
+    Для `ivfpq` проверяется, что векторов хватает на обучение и грубого
+    квантизатора, и кодовых книг PQ; иначе используется `flat`.
+    """
+    configured = settings.RAG_INDEX_TYPE
+    if configured != INDEX_IVFPQ:
+        return configured
+
+    centroids = max(_ivf_nlist(count), 2 ** settings.RAG_PQ_NBITS)
+    if count < centroids * MIN_TRAIN_POINTS_PER_CENTROID:
+        return INDEX_FLAT
+    return INDEX_IVFPQ
+
+
+def _index_description(kind: str, count: int, dimension: int) -> str:
+    """Строка для `faiss.index_factory`."""
+    if kind == INDEX_HNSW:
+        return f"HNSW{settings.RAG_HNSW_M}"
+    if kind == INDEX_IVFPQ:
+        if dimension % settings.RAG_PQ_M != 0:
+            raise ValueError(
+                f"RAG_PQ_M={settings.RAG_PQ_M} must divide embedding dimension {dimension}"
+            )
+        return f"IVF{_ivf_nlist(count)},PQ{settings.RAG_PQ_M}x{settings.RAG_PQ_NBITS}"
+    return "Flat"
+
+
+def prepare_vectors(vectors: np.ndarray, metric: str) -> np.ndarray:
+    """Копия векторов в float32; для cosine — L2-нормализованная."""
+    prepared = np.array(vectors, dtype="float32", copy=True)
+    if metric == METRIC_COSINE:
+        faiss.normalize_L2(prepared)
+    return prepared
+
+
+def apply_search_params(index) -> None:
+    """Выставляет efSearch / nprobe из настроек."""
+    kind = index_type(index)
+    if kind == INDEX_HNSW:
+        index.hnsw.efSearch = settings.RAG_HNSW_EF_SEARCH
+    elif kind == INDEX_IVFPQ:
+        faiss.extract_index_ivf(index).nprobe = settings.RAG_IVF_NPROBE
+
+
+def build_index(vectors: np.ndarray, metric: str):
+    """Строит и, если нужно, обучает индекс `RAG_INDEX_TYPE` по векторам.
+
+    Args:
+        vectors: Исходные векторы чанков.
+        metric: `cosine` или `l2`.
+    """
+    prepared = prepare_vectors(vectors, metric)
+    count, dimension = prepared.shape
+    kind = effective_index_type(count)
+    if kind != settings.RAG_INDEX_TYPE:
+        logger.warning(
+            "Too few vectors ({}) to train {}, building {} index",
+            count,
+            settings.RAG_INDEX_TYPE,
+            kind,
+        )
+
+    description = _index_description(kind, count, dimension)
+    index = faiss.index_factory(dimension, description, _faiss_metric(metric))
+    if kind == INDEX_HNSW:
+        index.hnsw.efConstruction = settings.RAG_HNSW_EF_CONSTRUCTION
+    if not index.is_trained:
+        started_at = time.monotonic()
+        index.train(prepared)
+        logger.info("Trained {} index in {:.1f}s", kind, time.monotonic() - started_at)
+    index.add(prepared)
+    apply_search_params(index)
+    return index
+
+
+def _search_latency_ms(index, queries: np.ndarray, top_k: int):
+    """Ищет каждый запрос отдельно (как в боте) и возвращает (ids, p50, p95)."""
+    ids = np.empty((len(queries), top_k), dtype=np.int64)
+    timings = []
+    for i, query in enumerate(queries):
+        started_at = time.perf_counter()
+        _, found = index.search(query.reshape(1, -1), top_k)
+        timings.append((time.perf_counter() - started_at) * 1000)
+        ids[i] = found[0]
+    return ids, float(np.percentile(timings, 50)), float(np.percentile(timings, 95))
+
+
+def evaluate_recall(
+    index,
+    vectors: np.ndarray,
+    metric: str,
+    top_k: int,
+    sample_size: int,
+) -> Dict[str, float]:
+    """Сравнивает индекс с точным перебором на запросах около векторов базы.
+
+    Запросы — случайные векторы базы с гауссовым шумом нормы
+    `EVAL_QUERY_NOISE` от нормы вектора: сами векторы базы индекс находит
+    почти всегда, и recall на них завышен. Эталон — `IndexFlat` той же
+    метрики.
+
+    Returns:
+        `recall_at_k` и p50/p95 задержки одного запроса для индекса и эталона.
+    """
+    prepared = prepare_vectors(vectors, metric)
+    top_k = min(top_k, len(prepared))
+    rng = np.random.default_rng(0)
+    picked = rng.choice(len(prepared), size=min(sample_size, len(prepared)), replace=False)
+    queries = prepared[picked]
+    norms = np.linalg.norm(queries, axis=1, keepdims=True)
+    scale = norms * EVAL_QUERY_NOISE / math.sqrt(prepared.shape[1])
+    noise = rng.standard_normal(queries.shape).astype("float32") * scale
+    queries = prepare_vectors(queries + noise, metric)
+
+    baseline = faiss.IndexFlat(prepared.shape[1], _faiss_metric(metric))
+    baseline.add(prepared)
+    expected, flat_p50, flat_p95 = _search_latency_ms(baseline, queries, top_k)
+    found, p50, p95 = _search_latency_ms(index, queries, top_k)
+
+    hits = sum(
+        len(set(row_found) & set(row_expected))
+        for row_found, row_expected in zip(found, expected)
+    )
+    return {
+        "top_k": top_k,
+        "queries": len(queries),
+        "recall_at_k": hits / (len(queries) * top_k),
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "flat_p50_ms": flat_p50,
+        "flat_p95_ms": flat_p95,
+    }
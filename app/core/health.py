@@ -0,0 +1,159 @@
+"""Проверки состояния сервиса для `/health` и `/ready`.
+
+`/health` (liveness) проверяет то, без чего бот не может отвечать:
+- `faiss_index` — индекс загружен, непуст и число векторов совпадает с
+  числом чанков в метаданных;
+- `database` — SQLite отвечает на запрос за `HEALTH_DB_TIMEOUT` секунд
+  (зависшая блокировка БД даёт таймаут);
+- `llm_api` — провайдер LLM доступен (`GET /models`, токены не тратятся).
+  Результат кэшируется на `HEALTH_PROVIDER_TTL` секунд, чтобы частые
+  проверки Docker и балансировщика не нагружали провайдера.
+
+Ошибка индекса или БД делает сервис `unhealthy` (HTTP 503), недоступность
+провайдера — только `degraded`: перезапуск контейнера её не исправит, а
+бот продолжает отвечать запасным сообщением.
+
+`/ready` (readiness) сообщает, завершился ли прогрев: компоненты
+отмечаются через `mark_ready()` по мере запуска.
+"""
+
+import asyncio
+import time
+from typing import Dict
+from typing import Optional
+
+from loguru import logger
+
+from app.config import settings
+from app.core.ai_client import AIClient
+from app.core.rag_engine import get_rag_engine
+from app.database.questions_db import ping_database
+
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+
+HEALTH_HEALTHY = "healthy"
+HEALTH_DEGRADED = "degraded"
+HEALTH_UNHEALTHY = "unhealthy"
+
+COMPONENT_DATABASE = "database"
+COMPONENT_FAISS_INDEX = "faiss_index"
+COMPONENT_TELEGRAM_BOT = "telegram_bot"
+
+# Компоненты, без которых сервис не принимает трафик.
+WARMUP_COMPONENTS = (COMPONENT_DATABASE, COMPONENT_FAISS_INDEX, COMPONENT_TELEGRAM_BOT)
+
+_started_at = time.monotonic()
+_ready_components: Dict[str, float] = {}
+
+_provider_result: Optional[Dict] = None
+_provider_checked_at = 0.0
+_provider_lock = asyncio.Lock()
+
+
+def mark_ready(component: str) -> None:
+    """Отмечает, что компонент прогрет и готов к работе."""
+    if component not in _ready_components:
+        _ready_components[component] = time.monotonic() - _started_at
+        logger.info("Component {} ready in {:.1f}s", component, _ready_components[component])
+
+
+def _round(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds, 1) if seconds is not None else None
+
+
+def _elapsed_ms(started_at: float) -> float:
+    return round((time.perf_counter() - started_at) * 1000, 1)
+
+
+def check_index() -> Dict:
+    """Индекс загружен и согласован с метаданными."""
+    stats = get_rag_engine().stats()
+    if not stats["loaded"]:
+        return {"status": STATUS_ERROR, "error": stats.get("error", "index not loaded")}
+    if stats["vectors"] == 0:
+        return {"status": STATUS_ERROR, "error": "index is empty", **stats}
+    if stats["vectors"] != stats["chunks"]:
+        return {"status": STATUS_ERROR, "error": "index size does not match metadata", **stats}
+    return {"status": STATUS_OK, **stats}
+
+
+async def check_database() -> Dict:
+    """SQLite отвечает на запрос за `HEALTH_DB_TIMEOUT` секунд."""
+    started_at = time.perf_counter()
+    try:
+        await asyncio.wait_for(ping_database(), timeout=settings.HEALTH_DB_TIMEOUT)
+    except asyncio.TimeoutError:
+        return {
+            "status": STATUS_ERROR,
+            "error": "query timed out",
+            "latency_ms": _elapsed_ms(started_at),
+        }
+    except Exception as e:
+        return {"status": STATUS_ERROR, "error": str(e), "latency_ms": _elapsed_ms(started_at)}
+    return {"status": STATUS_OK, "latency_ms": _elapsed_ms(started_at)}
+
+
+async def _probe_provider() -> Dict:
+    """Запрос списка моделей у текущего провайдера без повторов."""
+    started_at = time.perf_counter()
+    client = AIClient._build_client().with_options(
+        timeout=settings.HEALTH_PROVIDER_TIMEOUT,
+        max_retries=0,
+    )
+    try:
+        await client.models.list()
+    except Exception as e:
+        logger.warning(f"LLM provider health check failed: {e}")
+        return {"status": STATUS_ERROR, "error": str(e), "latency_ms": _elapsed_ms(started_at)}
+    finally:
+        await client.close()
+    return {"status": STATUS_OK, "latency_ms": _elapsed_ms(started_at)}
+
+
+async def check_llm_provider() -> Dict:
+    """Доступность провайдера LLM, не чаще раза в `HEALTH_PROVIDER_TTL` секунд."""
+    global _provider_result, _provider_checked_at
+
+    async with _provider_lock:
+        age = time.monotonic() - _provider_checked_at
+        if _provider_result is None or age >= settings.HEALTH_PROVIDER_TTL:
+            _provider_result = await _probe_provider()
+            _provider_checked_at = time.monotonic()
+            age = 0.0
+    return {**_provider_result, "provider": settings.LLM_PROVIDER, "checked_s_ago": round(age, 1)}
+
+
+async def get_health() -> Dict:
+    """Результаты всех проверок и общий статус."""
+    database, llm_api = await asyncio.gather(check_database(), check_llm_provider())
+    checks = {
+        "llm_api": llm_api,
+        "database": database,
+        "faiss_index": check_index(),
+    }
+    if checks["database"]["status"] != STATUS_OK or checks["faiss_index"]["status"] != STATUS_OK:
+        status = HEALTH_UNHEALTHY
+    elif checks["llm_api"]["status"] != STATUS_OK:
+        status = HEALTH_DEGRADED
+    else:
+        status = HEALTH_HEALTHY
+    return {"status": status, "checks": checks}
+
+
+def get_readiness() -> Dict:
+    """Состояние прогрева: какие компоненты готовы и за сколько секунд."""
+    if get_rag_engine().index is not None:
+        mark_ready(COMPONENT_FAISS_INDEX)
+    components = {
+        name: {
+            "ready": name in _ready_components,
+            "ready_after_s": _round(_ready_components.get(name)),
+        }
+        for name in WARMUP_COMPONENTS
+    }
+    return {
+        "ready": all(item["ready"] for item in components.values()),
+        "uptime_s": round(time.monotonic() - _started_at, 1),
+        "components": components,
+    }
@@ -0,0 +1,218 @@
+"""Лексический BM25-индекс чанков базы знаний.
+
+Дополняет векторный поиск там, где embeddings слабы: точные названия
+курсов, цены, даты, коды. Токенизация и стемминг выполняются локально,
+без внешних зависимостей:
+- текст приводится к нижнему регистру, `ё` заменяется на `е`;
+- токены — последовательности букв и цифр, числа сохраняются как есть;
+- частые служебные слова отбрасываются;
+- русские слова приводятся к основе упрощённым стеммером Портера
+  (Snowball, вариант для русского языка).
+
+Индекс строится целиком по метаданным чанков при сборке или загрузке
+FAISS индекса и хранится в том же снимке `IndexSnapshot`.
+"""
+
+import math
+import re
+from functools import lru_cache
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Sequence
+
+import numpy as np
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[0-9a-zа-я]+")
+_CYRILLIC_RE = re.compile(r"[а-я]")
+
+_STOP_WORDS = frozenset("""
+а без более бы был была были было быть в вам вас весь во вот все всего всех вы
+где да даже для до его ее ей ему если есть еще же за здесь и из или им их к как
+ко когда кто ли либо мне может мы на над надо наш не него нее нет ни них но ну о
+об однако он она они оно от очень по под при с со так также такой там те тем то
+того тоже той только том ты у уже хотя чего чей чем что чтобы чье чья эта эти это
+я
+the a an and or of to in on for is are
+""".split())
+
+_VOWELS = "аеиоуыэюя"
+
+_PERFECTIVE_GERUND_1 = ("в", "вши", "вшись")
+_PERFECTIVE_GERUND_2 = ("ив", "ивши", "ившись", "ыв", "ывши", "ывшись")
+_ADJECTIVE = (
+    "ее", "ие", "ые", "ое", "ими", "ыми", "ей", "ий", "ый", "ой", "ем", "им",
+    "ым", "ом", "его", "ого", "ему", "ому", "их", "ых", "ую", "юю", "ая", "яя",
+    "ою", "ею",
+)
+_PARTICIPLE_1 = ("ем", "нн", "вш", "ющ", "щ")
+_PARTICIPLE_2 = ("ивш", "ывш", "ующ")
+_REFLEXIVE = ("ся", "сь")
+_VERB_1 = (
+    "ла", "на", "ете", "йте", "ли", "й", "л", "ем", "н", "ло", "но", "ет",
+    "ют", "ны", "ть", "ешь", "нно",
+)
+_VERB_2 = (
+    "ила", "ыла", "ена", "ейте", "уйте", "ите", "или", "ыли", "ей", "уй", "ил",
+    "ыл", "им", "ым", "ен", "ило", "ыло", "ено", "ят", "ует", "уют", "ит", "ыт",
+    "ены", "ить", "ыть", "ишь", "ую", "ю",
+)
+_NOUN = (
+    "а", "ев", "ов", "ие", "ье", "е", "иями", "ями", "ами", "еи", "ии", "и",
+    "ией", "ей", "ой", "ий", "й", "иям", "ям", "ием", "ем", "ам", "ом", "о",
+    "у", "ах", "иях", "ях", "ы", "ь", "ию", "ью", "ю", "ия", "ья", "я",
+)
+_SUPERLATIVE = ("ейше", "ейш")
+_DERIVATIONAL = ("ость", "ост")
+
+
+def _strip_suffix(word: str, suffixes_after_a: Sequence[str], suffixes: Sequence[str]) -> str:
+    """Удаляет самое длинное подходящее окончание.
+
+    Окончания из `suffixes_after_a` удаляются только после `а`/`я`
+    (сама буква остаётся). Возвращает слово без изменений, если ничего
+    не подошло.
+    """
+    best = 0
+    for suffix in suffixes_after_a:
+        if len(suffix) > best and word.endswith(suffix) and word[:-len(suffix)][-1:] in ("а", "я"):
+            best = len(suffix)
+    for suffix in suffixes:
+        if len(suffix) > best and word.endswith(suffix):
+            best = len(suffix)
+    return word[:-best] if best else word
+
+
+def _region_start(word: str, start: int) -> int:
+    """Начало региона R1/R2: после первой согласной, следующей за гласной."""
+    for i in range(start + 1, len(word)):
+        if word[i] not in _VOWELS and word[i - 1] in _VOWELS:
+            return i + 1
+    return len(word)
+
+
+@lru_cache(maxsize=100_000)
+def stem_russian(word: str) -> str:
+    """Основа русского слова по алгоритму Snowball (Портер) для русского."""
+    rv_start = next((i + 1 for i, ch in enumerate(word) if ch in _VOWELS), len(word))
+    r2_start = _region_start(word, _region_start(word, 0))
+    prefix, rv = word[:rv_start], word[rv_start:]
+
+    # Шаг 1: деепричастие, иначе возвратность + прилагательное/глагол/существительное.
+    stripped = _strip_suffix(rv, _PERFECTIVE_GERUND_1, _PERFECTIVE_GERUND_2)
+    if stripped == rv:
+        rv = _strip_suffix(rv, (), _REFLEXIVE)
+        stripped = _strip_suffix(rv, (), _ADJECTIVE)
+        if stripped != rv:
+            stripped = _strip_suffix(stripped, _PARTICIPLE_1, _PARTICIPLE_2)
+        else:
+            stripped = _strip_suffix(rv, _VERB_1, _VERB_2)
+            if stripped == rv:
+                stripped = _strip_suffix(rv, (), _NOUN)
+    rv = stripped
+
+    # Шаг 2.
+    if rv.endswith("и"):
+        rv = rv[:-1]
+
+    # Шаг 3: словообразовательное окончание, только в R2.
+    for suffix in _DERIVATIONAL:
+        if rv.endswith(suffix) and rv_start + len(rv) - len(suffix) >= r2_start:
+            rv = rv[:-len(suffix)]
+            break
+
+    # Шаг 4.
+    if rv.endswith("нн"):
+        rv = rv[:-1]
+    else:
+        without_superlative = _strip_suffix(rv, (), _SUPERLATIVE)
+        if without_superlative != rv:
+            rv = without_superlative
+            if rv.endswith("нн"):
+                rv = rv[:-1]
+        elif rv.endswith("ь"):
+            rv = rv[:-1]
+
+    return prefix + rv
+
+
+def tokenize(text: str) -> List[str]:
+    """Нормализованные термы текста для BM25."""
+    terms = []
+    for token in _TOKEN_RE.findall(text.lower().replace("ё", "е")):
+        if token in _STOP_WORDS:
+            continue
+        if _CYRILLIC_RE.search(token):
+            token = stem_russian(token)
+        terms.append(token)
+    return terms
+
+
+class LexicalHit(NamedTuple):
+    """Результат BM25-поиска по одному чанку."""
+
+    doc_id: int
+    score: float
+    matched_terms: int
+    query_terms: int
+
+
+class BM25Index:
+    """Инвертированный индекс с ранжированием Okapi BM25.
+
+    Постинги каждого терма хранятся numpy-массивами, поэтому запрос
+    обрабатывается векторно: по одной операции на терм запроса.
+    """
+
+    def __init__(self, texts: Sequence[str]):
+        """Строит индекс по текстам; `doc_id` — позиция текста в `texts`."""
+        postings: Dict[str, Dict[int, int]] = {}
+        lengths = np.zeros(len(texts), dtype=np.float32)
+        for doc_id, text in enumerate(texts):
+            terms = tokenize(text)
+            lengths[doc_id] = len(terms)
+            for term in terms:
+                doc_tf = postings.setdefault(term, {})
+                doc_tf[doc_id] = doc_tf.get(doc_id, 0) + 1
+
+        self.size = len(texts)
+        average_length = float(lengths.mean()) if self.size and lengths.sum() else 1.0
+        self._length_norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / average_length)
+        self._postings: Dict[str, tuple] = {}
+        for term, doc_tf in postings.items():
+            doc_ids = np.fromiter(doc_tf.keys(), dtype=np.int64, count=len(doc_tf))
+            tfs = np.fromiter(doc_tf.values(), dtype=np.float32, count=len(doc_tf))
+            idf = math.log(1 + (self.size - len(doc_tf) + 0.5) / (len(doc_tf) + 0.5))
+            self._postings[term] = (doc_ids, tfs, idf)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def search(self, query: str, top_k: int) -> List[LexicalHit]:
+        """Лучшие по BM25 чанки, содержащие хотя бы один терм запроса."""
+        query_terms = set(tokenize(query))
+        if not query_terms or self.size == 0:
+            return []
+
+        scores = np.zeros(self.size, dtype=np.float32)
+        matched = np.zeros(self.size, dtype=np.int32)
+        for term in query_terms:
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            doc_ids, tfs, idf = posting
+            scores[doc_ids] += idf * tfs * (BM25_K1 + 1) / (tfs + self._length_norm[doc_ids])
+            matched[doc_ids] += 1
+
+        candidates = np.flatnonzero(matched)
+        if len(candidates) > top_k:
+            top = np.argpartition(-scores[candidates], top_k - 1)[:top_k]
+            candidates = candidates[top]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [
+            LexicalHit(int(doc_id), float(scores[doc_id]), int(matched[doc_id]), len(query_terms))
+            for doc_id in candidates
+        ]
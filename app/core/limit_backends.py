@@ -0,0 +1,344 @@
+"""Хранилища состояния rate limiter и спам-фильтра.
+
+`RateLimiter` и `SpamFilter` (см. `app.core.spam_filter`) не хранят
+состояние сами, а работают через `LimitsBackend`. Бэкенд выбирается
+`LIMITS_BACKEND`:
+- `memory` — память процесса, O(1) на запрос и не больше
+  `LIMITS_MEMORY_MAX_KEYS` ключей; быстро, но при нескольких воркерах
+  uvicorn у каждого свой лимит;
+- `sqlite` — общий файл `LIMITS_SQLITE_PATH` в режиме WAL: все воркеры
+  видят одни и те же окна, последние сообщения и чёрный список.
+
+Операции атомарны: `hit` проверяет и записывает запрос в скользящем
+окне одной операцией (в SQLite — одной транзакцией `BEGIN IMMEDIATE`),
+поэтому два воркера не могут одновременно пропустить запрос сверх лимита.
+"""
+
+import abc
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Set
+
+from loguru import logger
+
+from app.config import settings
+
+# Как часто (в вызовах `hit`) SQLite-бэкенд удаляет просроченные записи всех ключей.
+SQLITE_SWEEP_EVERY = 1000
+
+# Сколько простаивающих ключей in-memory бэкенд удаляет за один вызов.
+MEMORY_SWEEP_BATCH = 8
+
+# Последние сообщения пользователя, молчавшего дольше, забываются.
+RECENT_IDLE_SECONDS = 3600
+
+
+class LimitsBackend(abc.ABC):
+    """Интерфейс хранилища для rate limiter и спам-фильтра."""
+
+    @abc.abstractmethod
+    async def hit(self, key: str, limit: int, window: float) -> bool:
+        """Учитывает запрос в скользящем окне, если лимит не исчерпан.
+
+        Args:
+            key: Ключ пользователя.
+            limit: Максимум запросов в окне.
+            window: Длина окна в секундах.
+
+        Returns:
+            `True`, если запрос разрешён и учтён; `False` — лимит исчерпан
+            (запрос не учитывается).
+        """
+
+    @abc.abstractmethod
+    async def push_recent(self, key: str, value: str, keep: int) -> List[str]:
+        """Добавляет значение в список последних и возвращает до `keep`
+        последних значений ключа (от старых к новым)."""
+
+    @abc.abstractmethod
+    async def add_flag(self, key: str) -> None:
+        """Помечает ключ (например, пользователя в чёрном списке)."""
+
+    @abc.abstractmethod
+    async def has_flag(self, key: str) -> bool:
+        """Помечен ли ключ."""
+
+    async def aclose(self) -> None:
+        """Освобождает ресурсы бэкенда."""
+
+
+class _WindowCounter:
+    """Счётчики скользящего окна одного ключа: текущий и предыдущий интервал."""
+
+    __slots__ = ("window_start", "current", "previous", "last_seen")
+
+    def __init__(self, now: float):
+        self.window_start = now
+        self.current = 0
+        self.previous = 0
+        self.last_seen = now
+
+
+class _RecentValues:
+    """Последние значения ключа в кольцевом буфере фиксированной длины."""
+
+    __slots__ = ("values", "next", "last_seen")
+
+    def __init__(self, keep: int, now: float):
+        self.values: List[Optional[str]] = [None] * keep
+        self.next = 0
+        self.last_seen = now
+
+    def push(self, value: str) -> List[str]:
+        """Записывает значение поверх самого старого и возвращает буфер от
+        старых к новым."""
+        self.values[self.next] = value
+        self.next = (self.next + 1) % len(self.values)
+        ordered = self.values[self.next:] + self.values[:self.next]
+        return [item for item in ordered if item is not None]
+
+
+class MemoryLimitsBackend(LimitsBackend):
+    """Состояние в памяти процесса с ограниченным объёмом.
+
+    Лимит считается скользящим окном на двух счётчиках (текущий и
+    предыдущий интервал длиной `window`): вклад предыдущего интервала
+    убывает линейно, так что на запись приходится O(1) времени и памяти
+    независимо от лимита. Это приближение точного журнала запросов:
+    при равномерном потоке погрешность мала, а всплеск на границе
+    интервалов не превышает лимит более чем на долю предыдущего окна.
+
+    Записи хранятся в порядке последнего обращения (`OrderedDict`), поэтому
+    простаивающие ключи лежат в начале: каждый вызов удаляет до
+    `MEMORY_SWEEP_BATCH` таких ключей, не обходя весь словарь. Сверх
+    `max_keys` вытесняются давно не активные ключи.
+    """
+
+    def __init__(self, max_keys: Optional[int] = None, clock: Callable[[], float] = time.monotonic):
+        """Создаёт бэкенд.
+
+        Args:
+            max_keys: Максимум ключей в каждой структуре (`LIMITS_MEMORY_MAX_KEYS`).
+            clock: Источник времени в секундах (подменяется в бенчмарке).
+        """
+        self.max_keys = max(1, max_keys or settings.LIMITS_MEMORY_MAX_KEYS)
+        self._clock = clock
+        self._counters: "OrderedDict[str, _WindowCounter]" = OrderedDict()
+        self._recent: "OrderedDict[str, _RecentValues]" = OrderedDict()
+        self._flags: Set[str] = set()
+        self.swept = 0
+        self.evicted = 0
+
+    def _sweep(self, records: OrderedDict, now: float, idle: float) -> None:
+        """Удаляет из начала до `MEMORY_SWEEP_BATCH` ключей без обращений за `idle`
+        секунд и вытесняет самые старые сверх `max_keys`."""
+        for _ in range(MEMORY_SWEEP_BATCH):
+            if not records:
+                break
+            record = next(iter(records.values()))
+            if now - record.last_seen < idle:
+                break
+            records.popitem(last=False)
+            self.swept += 1
+        while len(records) > self.max_keys:
+            records.popitem(last=False)
+            self.evicted += 1
+
+    async def hit(self, key: str, limit: int, window: float) -> bool:
+        now = self._clock()
+        record = self._counters.get(key)
+        if record is None:
+            record = self._counters[key] = _WindowCounter(now)
+        else:
+            self._counters.move_to_end(key)
+            record.last_seen = now
+        # Через два окна без запросов оба счётчика гарантированно пусты.
+        self._sweep(self._counters, now, 2 * window)
+
+        elapsed = now - record.window_start
+        if elapsed >= window:
+            intervals = int(elapsed // window)
+            record.previous = record.current if intervals == 1 else 0
+            record.current = 0
+            record.window_start += intervals * window
+            elapsed -= intervals * window
+
+        estimate = record.previous * (window - elapsed) / window + record.current
+        if estimate >= limit:
+            return False
+        record.current += 1
+        return True
+
+    async def push_recent(self, key: str, value: str, keep: int) -> List[str]:
+        now = self._clock()
+        record = self._recent.get(key)
+        if record is None or len(record.values) != keep:
+            record = self._recent[key] = _RecentValues(keep, now)
+        self._recent.move_to_end(key)
+        record.last_seen = now
+        self._sweep(self._recent, now, RECENT_IDLE_SECONDS)
+        return record.push(value)
+
+    async def add_flag(self, key: str) -> None:
+        self._flags.add(key)
+
+    async def has_flag(self, key: str) -> bool:
+        return key in self._flags
+
+    def stats(self) -> Dict[str, int]:
+        """Размеры структур и число удалённых ключей."""
+        return {
+            "rate_limit_keys": len(self._counters),
+            "recent_keys": len(self._recent),
+            "flags": len(self._flags),
+            "swept": self.swept,
+            "evicted": self.evicted,
+        }
+
+
+class SQLiteLimitsBackend(LimitsBackend):
+    """Состояние в общем SQLite-файле, разделяемом воркерами.
+
+    Запросы выполняются в отдельном потоке через одно соединение на
+    процесс; межпроцессную атомарность обеспечивает `BEGIN IMMEDIATE`,
+    который сразу берёт блокировку записи.
+    """
+
+    def __init__(self, path: str, busy_timeout: Optional[int] = None):
+        """Создаёт бэкенд; файл и таблицы создаются при первом обращении.
+
+        Args:
+            path: Путь к файлу SQLite.
+            busy_timeout: Ожидание блокировки в мс (`SQLITE_BUSY_TIMEOUT`).
+        """
+        self.path = path
+        self.busy_timeout = settings.SQLITE_BUSY_TIMEOUT if busy_timeout is None else busy_timeout
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._hits_since_sweep = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is not None:
+            return self._conn
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # isolation_level=None: транзакциями управляем явно (BEGIN IMMEDIATE).
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout)}")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_hits ("
+            "key TEXT NOT NULL, "
+            "ts REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_rate_limit_hits_key_ts ON rate_limit_hits (key, ts)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_rate_limit_hits_ts ON rate_limit_hits (ts)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS recent_values ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "key TEXT NOT NULL, "
+            "value TEXT NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_recent_values_key_id ON recent_values (key, id)"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS flags (key TEXT PRIMARY KEY)")
+        self._conn = conn
+        return conn
+
+    def _hit_sync(self, key: str, limit: int, window: float) -> bool:
+        with self._lock:
+            conn = self._connect()
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._hits_since_sweep += 1
+                if self._hits_since_sweep >= SQLITE_SWEEP_EVERY:
+                    # Окна неактивных пользователей не чистятся их запросами.
+                    conn.execute("DELETE FROM rate_limit_hits WHERE ts <= ?", (now - window,))
+                    self._hits_since_sweep = 0
+                else:
+                    conn.execute(
+                        "DELETE FROM rate_limit_hits WHERE key = ? AND ts <= ?",
+                        (key, now - window),
+                    )
+                count = conn.execute(
+                    "SELECT COUNT(*) FROM rate_limit_hits WHERE key = ?", (key,)
+                ).fetchone()[0]
+                allowed = count < limit
+                if allowed:
+                    conn.execute("INSERT INTO rate_limit_hits (key, ts) VALUES (?, ?)", (key, now))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return allowed
+
+    def _push_recent_sync(self, key: str, value: str, keep: int) -> List[str]:
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("INSERT INTO recent_values (key, value) VALUES (?, ?)", (key, value))
+                conn.execute(
+                    "DELETE FROM recent_values WHERE key = ? AND id NOT IN ("
+                    "SELECT id FROM recent_values WHERE key = ? ORDER BY id DESC LIMIT ?)",
+                    (key, key, keep),
+                )
+                rows = conn.execute(
+                    "SELECT value FROM recent_values WHERE key = ? ORDER BY id", (key,)
+                ).fetchall()
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return [row[0] for row in rows]
+
+    def _add_flag_sync(self, key: str) -> None:
+        with self._lock:
+            self._connect().execute("INSERT OR IGNORE INTO flags (key) VALUES (?)", (key,))
+
+    def _has_flag_sync(self, key: str) -> bool:
+        with self._lock:
+            row = self._connect().execute("SELECT 1 FROM flags WHERE key = ?", (key,)).fetchone()
+            return row is not None
+
+    async def hit(self, key: str, limit: int, window: float) -> bool:
+        return await asyncio.to_thread(self._hit_sync, key, limit, window)
+
+    async def push_recent(self, key: str, value: str, keep: int) -> List[str]:
+        return await asyncio.to_thread(self._push_recent_sync, key, value, keep)
+
+    async def add_flag(self, key: str) -> None:
+        await asyncio.to_thread(self._add_flag_sync, key)
+
+    async def has_flag(self, key: str) -> bool:
+        return await asyncio.to_thread(self._has_flag_sync, key)
+
+    async def aclose(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def create_limits_backend() -> LimitsBackend:
+    """Бэкенд по `LIMITS_BACKEND`."""
+    if settings.LIMITS_BACKEND == "sqlite":
+        logger.info("Rate limit and spam state stored in {}", settings.LIMITS_SQLITE_PATH)
+        return SQLiteLimitsBackend(settings.LIMITS_SQLITE_PATH)
+    return MemoryLimitsBackend()
@@ -0,0 +1,221 @@
+"""Метрики Prometheus для pipeline обработки сообщений.
+
+Экспортируются на `/metrics` (см. `app.main`):
+- `pipeline_stage_duration_seconds{channel, stage}` — гистограмма этапов
+  (embedding, dedup, rag, llm, send и др.) по данным `PipelineContext`;
+- `pipeline_duration_seconds{channel, outcome}` — полное время сообщения;
+- `pipeline_messages_total{channel, outcome}` — итоги обработки;
+- `rate_limit_rejections_total{channel}` и `spam_drops_total{channel}`;
+- `answer_cache_requests_total{channel, result}` — попадания кэша ответов;
+- `provider_errors_total{provider, operation}` — ошибки внешних API;
+- `prompt_tokens{part}` и `prompt_truncations_total{part}` — токены частей
+  промпта и их урезание под бюджет;
+- `question_log_items_total{result}` и `question_log_queue_size` — фоновая
+  запись вопросов в аналитику (queued, dropped, written, failed);
+- `embedding_cache_*` и `answer_cache_size` — счётчики кэшей, читаются
+  при каждом запросе метрик;
+- `context_users`, `context_memory_bytes`, `context_expired` и
+  `context_evicted` — диалоговый контекст в памяти;
+  `context_pending_writes` и `context_backend_errors` — его хранилище.
+
+Этапы pipeline собираются наблюдателем `PipelineContext`, который
+подключает `setup_metrics()`, поэтому интеграциям достаточно размечать
+этапы через `pipeline.stage()`.
+Метрики живут в памяти процесса: при нескольких воркерах uvicorn
+каждый отдаёт свои значения.
+"""
+
+from typing import Iterator
+
+from prometheus_client import REGISTRY
+from prometheus_client import Counter
+from prometheus_client import Histogram
+from prometheus_client import generate_latest
+from prometheus_client.core import CounterMetricFamily
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+# От быстрых in-memory этапов до долгих ответов LLM.
+LATENCY_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+STAGE_DURATION = Histogram(
+    "pipeline_stage_duration_seconds",
+    "Длительность этапа обработки сообщения",
+    ["channel", "stage"],
+    buckets=LATENCY_BUCKETS,
+)
+PIPELINE_DURATION = Histogram(
+    "pipeline_duration_seconds",
+    "Полное время обработки сообщения",
+    ["channel", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+MESSAGES = Counter(
+    "pipeline_messages",
+    "Обработанные сообщения по итогу",
+    ["channel", "outcome"],
+)
+RATE_LIMIT_REJECTIONS = Counter(
+    "rate_limit_rejections",
+    "Сообщения, отклонённые rate limiter",
+    ["channel"],
+)
+SPAM_DROPS = Counter(
+    "spam_drops",
+    "Сообщения, отброшенные спам-фильтром",
+    ["channel"],
+)
+ANSWER_CACHE_REQUESTS = Counter(
+    "answer_cache_requests",
+    "Обращения к кэшу ответов (result=hit|miss)",
+    ["channel", "result"],
+)
+PROVIDER_ERRORS = Counter(
+    "provider_errors",
+    "Ошибки запросов к внешним API",
+    ["provider", "operation"],
+)
+PROMPT_TOKENS = Histogram(
+    "prompt_tokens",
+    "Входные токены промпта по частям (локальный подсчёт)",
+    ["part"],
+    buckets=(50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000),
+)
+PROMPT_TRUNCATIONS = Counter(
+    "prompt_truncations",
+    "Промпты, в которых часть урезана под бюджет токенов",
+    ["part"],
+)
+QUESTION_LOG_ITEMS = Counter(
+    "question_log_items",
+    "Вопросы в фоновой записи аналитики (result=queued|dropped|written|failed)",
+    ["result"],
+)
+
+
+def record_provider_error(provider: str, operation: str) -> None:
+    """Учитывает неудачный запрос к внешнему API (включая повторяемые)."""
+    PROVIDER_ERRORS.labels(provider=provider, operation=operation).inc()
+
+
+def record_question_log(result: str, count: int = 1) -> None:
+    """Учитывает вопросы, прошедшие через очередь аналитики."""
+    QUESTION_LOG_ITEMS.labels(result=result).inc(count)
+
+
+def record_prompt_usage(usage) -> None:
+    """Учитывает токены частей промпта (`PromptUsage`) и их урезание."""
+    for part in ("system", "context", "history", "question"):
+        PROMPT_TOKENS.labels(part=part).observe(getattr(usage, part))
+    for part in usage.truncated:
+        PROMPT_TRUNCATIONS.labels(part=part).inc()
+
+
+def observe_pipeline(pipeline) -> None:
+    """Переносит замеры завершённого `PipelineContext` в метрики."""
+    from app.core.pipeline import OUTCOME_ANSWERED
+    from app.core.pipeline import OUTCOME_CACHE_HIT
+    from app.core.pipeline import OUTCOME_RATE_LIMITED
+    from app.core.pipeline import OUTCOME_SPAM
+
+    channel = pipeline.channel
+    for stage, duration_ms in pipeline.timings.items():
+        STAGE_DURATION.labels(channel=channel, stage=stage).observe(duration_ms / 1000)
+    PIPELINE_DURATION.labels(channel=channel, outcome=pipeline.outcome).observe(
+        pipeline.total_ms / 1000
+    )
+    MESSAGES.labels(channel=channel, outcome=pipeline.outcome).inc()
+
+    if pipeline.outcome == OUTCOME_RATE_LIMITED:
+        RATE_LIMIT_REJECTIONS.labels(channel=channel).inc()
+    elif pipeline.outcome == OUTCOME_SPAM:
+        SPAM_DROPS.labels(channel=channel).inc()
+    elif pipeline.outcome == OUTCOME_CACHE_HIT:
+        ANSWER_CACHE_REQUESTS.labels(channel=channel, result="hit").inc()
+    elif pipeline.outcome == OUTCOME_ANSWERED and pipeline.answer_cache_checked:
+        ANSWER_CACHE_REQUESTS.labels(channel=channel, result="miss").inc()
+
+
+class _StatsCollector(Collector):
+    """Отдаёт счётчики кэшей и очереди аналитики из их `stats()` на момент
+    запроса метрик."""
+
+    def collect(self) -> Iterator:
+        from app.core.answer_cache import answer_cache
+        from app.core.context_manager import context_manager
+        from app.core.embeddings import embeddings_client
+        from app.database.question_log import question_log
+
+        cache = embeddings_client.cache
+        if cache is not None:
+            stats = cache.stats()
+            yield CounterMetricFamily(
+                "embedding_cache_hits", "Попадания в кэш embeddings", value=stats["hits"]
+            )
+            yield CounterMetricFamily(
+                "embedding_cache_misses", "Промахи кэша embeddings", value=stats["misses"]
+            )
+            yield CounterMetricFamily(
+                "embedding_cache_evictions",
+                "Вытеснения из кэша embeddings",
+                value=stats["evictions"],
+            )
+        yield GaugeMetricFamily(
+            "answer_cache_size", "Ответов в кэше", value=answer_cache.stats()["size"]
+        )
+        yield GaugeMetricFamily(
+            "question_log_queue_size",
+            "Вопросов в очереди аналитики",
+            value=question_log.stats()["pending"],
+        )
+        stats = context_manager.stats()
+        yield GaugeMetricFamily(
+            "context_users", "Пользователей с историей диалога", value=stats["users"]
+        )
+        yield GaugeMetricFamily(
+            "context_memory_bytes", "Оценка памяти истории диалогов", value=stats["memory_bytes"]
+        )
+        yield CounterMetricFamily(
+            "context_expired", "Контексты, удалённые по TTL", value=stats["expired"]
+        )
+        yield CounterMetricFamily(
+            "context_evicted",
+            "Контексты, вытесненные лимитом CONTEXT_MAX_USERS",
+            value=stats["evicted"],
+        )
+        yield GaugeMetricFamily(
+            "context_pending_writes",
+            "Диалоги, ожидающие сброса в хранилище",
+            value=stats["pending_writes"],
+        )
+        yield CounterMetricFamily(
+            "context_backend_errors",
+            "Ошибки чтения и записи хранилища контекста",
+            value=stats["backend_errors"],
+        )
+
+
+def render_metrics() -> bytes:
+    """Текущие метрики в текстовом формате Prometheus."""
+    return generate_latest(REGISTRY)
+
+
+_installed = False
+
+
+def setup_metrics() -> None:
+    """Подписывает метрики на pipeline и регистрирует счётчики кэшей.
+
+    Модули pipeline, кэшей и очереди импортируются здесь, а не на уровне модуля:
+    они сами пишут `provider_errors`, и прямой импорт был бы циклическим.
+    """
+    global _installed
+    if _installed:
+        return
+    from app.core.pipeline import add_pipeline_observer
+
+    add_pipeline_observer(observe_pipeline)
+    REGISTRY.register(_StatsCollector())
+    _installed = True
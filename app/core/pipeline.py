@@ -0,0 +1,118 @@
+"""Контекст обработки одного входящего сообщения.
+
+Telegram и Jivo проходят одинаковый pipeline: кэш ответов, RAG-поиск
+(`RAGEngine.search`) и аналитика вопросов (`QuestionsDB.add_question`).
+Всем нужен embedding одного и того же текста, поэтому он запрашивается
+здесь не более одного раза и только по требованию: если поиск обошёлся
+лексическим fast path, а кэш ответов не проверялся, embedding для
+аналитики посчитает фоновый писатель пачкой.
+
+Контекст также замеряет длительность этапов обработки (`stage()`) и по
+завершении (`finish()`) передаёт себя наблюдателям, подписанным через
+`add_pipeline_observer` — так собираются метрики и нагрузочные отчёты,
+не вмешиваясь в код интеграций.
+"""
+
+import asyncio
+import contextlib
+import time
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Callable
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+
+import numpy as np
+from loguru import logger
+
+from app.core.embeddings import EmbeddingsClient
+from app.core.embeddings import embeddings_client
+
+STAGE_RATE_LIMIT = "rate_limit"
+STAGE_SPAM = "spam"
+STAGE_EMBEDDING = "embedding"
+STAGE_DEDUP = "dedup"
+STAGE_CONTEXT = "context"
+STAGE_RAG = "rag"
+STAGE_LLM = "llm"
+STAGE_SEND = "send"
+
+OUTCOME_ANSWERED = "answered"
+OUTCOME_CACHE_HIT = "cache_hit"
+OUTCOME_RATE_LIMITED = "rate_limited"
+OUTCOME_SPAM = "spam"
+
+PipelineObserver = Callable[["PipelineContext"], None]
+
+_observers: List[PipelineObserver] = []
+
+
+def add_pipeline_observer(observer: PipelineObserver) -> None:
+    """Подписывает `observer` на завершённые сообщения."""
+    _observers.append(observer)
+
+
+def remove_pipeline_observer(observer: PipelineObserver) -> None:
+    """Отписывает наблюдателя (если он был подписан)."""
+    if observer in _observers:
+        _observers.remove(observer)
+
+
+@dataclass
+class PipelineContext:
+    """Состояние обработки сообщения пользователя в рамках одного запроса."""
+
+    user_id: str
+    channel: str
+    text: str
+    embeddings: EmbeddingsClient = field(default=embeddings_client, repr=False)
+    _embedding_task: Optional["asyncio.Future[np.ndarray]"] = field(
+        default=None, init=False, repr=False
+    )
+    started_at: float = field(default_factory=time.monotonic, init=False, repr=False)
+    timings: Dict[str, float] = field(default_factory=dict, init=False)
+    outcome: Optional[str] = field(default=None, init=False)
+    answer_cache_checked: bool = field(default=False, init=False)
+    total_ms: float = field(default=0.0, init=False)
+
+    async def get_embedding(self) -> np.ndarray:
+        """Возвращает embedding текста, запрашивая API не более одного раза.
+
+        Параллельные вызовы ждут один и тот же запрос.
+        """
+        if self._embedding_task is None:
+            self._embedding_task = asyncio.ensure_future(self.embeddings.embed(self.text))
+        return await self._embedding_task
+
+    @property
+    def embedding(self) -> Optional[np.ndarray]:
+        """Уже полученный embedding текста или `None`, если его не запрашивали."""
+        task = self._embedding_task
+        if task is None or not task.done() or task.cancelled() or task.exception() is not None:
+            return None
+        return task.result()
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Замеряет этап обработки; время копится в `timings[name]` (мс)."""
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record_stage(name, (time.monotonic() - started_at) * 1000)
+
+    def record_stage(self, name: str, duration_ms: float) -> None:
+        """Добавляет к этапу `name` уже измеренную длительность."""
+        self.timings[name] = self.timings.get(name, 0.0) + duration_ms
+
+    def finish(self, outcome: str) -> None:
+        """Фиксирует итог обработки и уведомляет наблюдателей."""
+        self.outcome = outcome
+        self.total_ms = (time.monotonic() - self.started_at) * 1000
+        for observer in list(_observers):
+            try:
+                observer(self)
+            except Exception as e:
+                logger.error(f"Pipeline observer failed: {e}")
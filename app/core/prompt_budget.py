@@ -0,0 +1,314 @@
+"""Бюджет токенов промпта для Chat API.
+
+`AIClient` собирает промпт из четырёх частей: системный промпт, контекст
+RAG, история диалога и вопрос пользователя. `PromptBuilder` считает их
+токены локально и укладывает в `PROMPT_TOKEN_BUDGET`, отдавая бюджет
+частям по убыванию приоритета, поэтому при нехватке первой урезается
+младшая:
+1. вопрос — не урезается (его длину ограничивает спам-фильтр);
+2. системный промпт — не больше `PROMPT_SYSTEM_TOKENS`, обрезается хвост
+   уже отрендеренного шаблона, поэтому плейсхолдер не разрывается;
+3. контекст RAG — не больше `PROMPT_CONTEXT_TOKENS`: фрагменты идут по
+   убыванию релевантности, не вошедшие отбрасываются (если не входит
+   даже первый, он обрезается);
+4. история — не больше `PROMPT_HISTORY_TOKENS`: отбрасываются самые
+   старые сообщения.
+
+Если шаблон промпта подставляет контекст сам (`{rag_context}`), отдельное
+сообщение с контекстом не отправляется: контекст укладывается в бюджет и
+подставляется в шаблон. Если ради бюджета пришлось урезать сам шаблон,
+место подстановки могло пропасть — тогда шаблон рендерится без контекста,
+а контекст идёт отдельным сообщением.
+
+`PROMPT_TOKEN_BUDGET=0` отключает урезание, токены только считаются.
+
+По умолчанию токены оцениваются по длине текста (`CHARS_PER_TOKEN`) с
+запасом для русского текста: `tiktoken` в `requirements.txt` закомментирован,
+чтобы не утяжелять образ. Если его установить, он считает точно для моделей,
+кодировку которых знает. Подсчёт приблизительный в обоих случаях: служебные
+токены разметки Chat API учтены константой на сообщение.
+"""
+
+import math
+import string
+from functools import lru_cache
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+from loguru import logger
+
+from app.config import settings
+from app.core.rag_engine import CONTEXT_SEPARATOR
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Оценка без tiktoken: символов на токен (для русского текста — с запасом).
+CHARS_PER_TOKEN = 3.0
+
+# Служебные токены роли и разметки каждого сообщения Chat API.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Кодировка для моделей, которых tiktoken не знает по имени.
+FALLBACK_ENCODING = "o200k_base"
+
+PART_SYSTEM = "system"
+PART_CONTEXT = "context"
+PART_HISTORY = "history"
+
+CONTEXT_HEADER = (
+    "Контекст для ответа (используй только его факты; "
+    "если данных недостаточно, честно скажи об этом):\n\n"
+)
+EMPTY_CONTEXT = "Контекст не найден."
+
+
+@lru_cache(maxsize=None)
+def _load_encoding(model: str):
+    """Кодировка tiktoken для модели или `None`, если подсчёт будет оценочным."""
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding(FALLBACK_ENCODING)
+    except Exception as e:
+        # Файлы кодировки скачиваются при первом обращении: без сети считаем оценкой.
+        logger.warning(f"tiktoken encoding unavailable, estimating tokens by length: {e}")
+        return None
+
+
+class TokenCounter:
+    """Локальный подсчёт токенов: `tiktoken` или оценка по длине текста."""
+
+    def __init__(self, model: Optional[str] = None):
+        self._model = model
+
+    @property
+    def model(self) -> str:
+        """Явно заданная модель или текущая `AI_MODEL` (её можно сменить на лету)."""
+        return self._model or settings.AI_MODEL
+
+    @property
+    def exact(self) -> bool:
+        """Считает ли `tiktoken`, а не оценка."""
+        return _load_encoding(self.model) is not None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        encoding = _load_encoding(self.model)
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Начало текста не длиннее `max_tokens` токенов."""
+        if max_tokens <= 0:
+            return ""
+        encoding = _load_encoding(self.model)
+        if encoding is not None:
+            tokens = encoding.encode(text, disallowed_special=())
+            if len(tokens) <= max_tokens:
+                return text
+            return encoding.decode(tokens[:max_tokens])
+        limit = int(max_tokens * CHARS_PER_TOKEN)
+        if len(text) <= limit:
+            return text
+        cut = text[:limit]
+        # Не рвём слово, если пробел недалеко от границы.
+        space = max(cut.rfind(" "), cut.rfind("\n"))
+        return cut[:space] if space > limit * 0.8 else cut
+
+
+class PromptUsage(NamedTuple):
+    """Токены частей промпта после укладки в бюджет."""
+
+    system: int
+    context: int
+    history: int
+    question: int
+    budget: int
+    truncated: Tuple[str, ...]
+    exact: bool
+
+    @property
+    def total(self) -> int:
+        return self.system + self.context + self.history + self.question
+
+
+class PromptBuilder:
+    """Собирает сообщения Chat API в пределах бюджета токенов."""
+
+    def __init__(
+        self,
+        counter: Optional[TokenCounter] = None,
+        budget: Optional[int] = None,
+        system_tokens: Optional[int] = None,
+        context_tokens: Optional[int] = None,
+        history_tokens: Optional[int] = None,
+    ):
+        self.counter = counter or TokenCounter()
+        self.budget = budget if budget is not None else settings.PROMPT_TOKEN_BUDGET
+        self.system_tokens = system_tokens or settings.PROMPT_SYSTEM_TOKENS
+        self.context_tokens = context_tokens or settings.PROMPT_CONTEXT_TOKENS
+        self.history_tokens = history_tokens or settings.PROMPT_HISTORY_TOKENS
+
+    def _message_tokens(self, content: str) -> int:
+        return self.counter.count(content) + MESSAGE_OVERHEAD_TOKENS
+
+    def _fit_text(self, text: str, limit: float) -> str:
+        if self._message_tokens(text) <= limit:
+            return text
+        return self.counter.truncate(text, int(limit) - MESSAGE_OVERHEAD_TOKENS)
+
+    def _context_overhead(self, embedded: bool) -> int:
+        """Токены вокруг текста контекста: заголовок и разметка отдельного сообщения."""
+        return 0 if embedded else self._message_tokens(CONTEXT_HEADER)
+
+    def _fit_context(self, rag_context: str, limit: float, embedded: bool) -> Tuple[str, bool]:
+        """Самые релевантные фрагменты контекста, вошедшие в `limit`, и признак урезания."""
+        chunks = [chunk.strip() for chunk in rag_context.split(CONTEXT_SEPARATOR) if chunk.strip()]
+        available = limit - self._context_overhead(embedded)
+        separator = self.counter.count(CONTEXT_SEPARATOR)
+        kept: List[str] = []
+        used = 0
+        for chunk in chunks:
+            cost = self.counter.count(chunk) + (separator if kept else 0)
+            if used + cost > available:
+                if not kept:
+                    kept.append(self.counter.truncate(chunk, int(available)))
+                break
+            kept.append(chunk)
+            used += cost
+        fitted = CONTEXT_SEPARATOR.join(chunk for chunk in kept if chunk)
+        return fitted, fitted != CONTEXT_SEPARATOR.join(chunks)
+
+    def _fit_history(self, history: Sequence[Dict], limit: float) -> List[Dict]:
+        """Самые свежие сообщения истории, вошедшие в `limit`."""
+        kept: List[Dict] = []
+        used = 0
+        for message in reversed(history):
+            cost = self._message_tokens(message["content"])
+            if used + cost > limit:
+                break
+            kept.append(message)
+            used += cost
+        kept.reverse()
+        return kept
+
+    @staticmethod
+    def _embeds_context(system_prompt: str) -> bool:
+        """Подставляет ли шаблон промпта контекст RAG сам (`{rag_context}`)."""
+        try:
+            fields = {name for _, name, _, _ in string.Formatter().parse(system_prompt) if name}
+            system_prompt.format(rag_context="", conversation_history="", user_question="")
+        except Exception:
+            # Шаблон с ошибкой отправляется как есть, см. `_render_system_prompt`.
+            return False
+        return "rag_context" in fields
+
+    @staticmethod
+    def _render_system_prompt(system_prompt: str, rag_context: str) -> str:
+        # Backward-compatible: if placeholders are absent or broken, keep original prompt.
+        try:
+            return system_prompt.format(
+                rag_context=rag_context,
+                conversation_history="",
+                user_question="",
+            )
+        except Exception:
+            return system_prompt
+
+    def build(
+        self,
+        user_question: str,
+        rag_context: str,
+        conversation_history: Sequence[Dict],
+        system_prompt: str,
+    ) -> Tuple[List[Dict], PromptUsage]:
+        """Собирает сообщения: промпт, RAG-контекст, история, вопрос.
+
+        Контекст идёт отдельным сообщением, если шаблон промпта не
+        подставляет его сам.
+
+        Returns:
+            Сообщения для Chat API и токены их частей.
+        """
+        rag_context = rag_context.strip() if rag_context else ""
+        history = list(conversation_history)
+        question_tokens = self._message_tokens(user_question)
+        truncated = []
+        embedded = self._embeds_context(system_prompt)
+        # Урезается отрендеренный текст шаблона, а не сам шаблон: так
+        # плейсхолдер не разорвать.
+        rendered_prompt = self._render_system_prompt(system_prompt, "")
+
+        if self.budget > 0:
+            remaining = self.budget - question_tokens
+            # Контекст отправляется всегда, даже пустой.
+            context_reserve = self.counter.count(EMPTY_CONTEXT) + self._context_overhead(embedded)
+            system_limit = min(self.system_tokens, remaining - context_reserve)
+            if embedded and self._message_tokens(rendered_prompt) > system_limit:
+                # Урезанный шаблон может потерять место подстановки контекста.
+                embedded = False
+                context_reserve = self._message_tokens(CONTEXT_HEADER + EMPTY_CONTEXT)
+                system_limit = min(self.system_tokens, remaining - context_reserve)
+
+            fitted_prompt = self._fit_text(rendered_prompt, system_limit)
+            if fitted_prompt != rendered_prompt:
+                truncated.append(PART_SYSTEM)
+            rendered_prompt = fitted_prompt
+            remaining -= self._message_tokens(rendered_prompt)
+
+            if rag_context:
+                rag_context, context_truncated = self._fit_context(
+                    rag_context, min(self.context_tokens, remaining), embedded
+                )
+                if context_truncated:
+                    truncated.append(PART_CONTEXT)
+            remaining -= self.counter.count(rag_context or EMPTY_CONTEXT)
+            remaining -= self._context_overhead(embedded)
+
+            fitted_history = self._fit_history(history, min(self.history_tokens, remaining))
+            if len(fitted_history) < len(history):
+                truncated.append(PART_HISTORY)
+            history = fitted_history
+
+        system_tokens = self._message_tokens(rendered_prompt)
+        if embedded:
+            system_message = self._render_system_prompt(system_prompt, rag_context or EMPTY_CONTEXT)
+            context_messages = []
+            context_tokens = self._message_tokens(system_message) - system_tokens
+        else:
+            system_message = rendered_prompt
+            # Always inject retrieval context explicitly.
+            context_message = CONTEXT_HEADER + (rag_context or EMPTY_CONTEXT)
+            context_messages = [{"role": "system", "content": context_message}]
+            context_tokens = self._message_tokens(context_message)
+        messages = [
+            {"role": "system", "content": system_message},
+            *context_messages,
+            *history,
+            {"role": "user", "content": user_question},
+        ]
+        usage = PromptUsage(
+            system=system_tokens,
+            context=context_tokens,
+            history=sum(self._message_tokens(message["content"]) for message in history),
+            question=question_tokens,
+            budget=self.budget,
+            truncated=tuple(truncated),
+            exact=self.counter.exact,
+        )
+        return messages, usage
+
+
+prompt_builder = PromptBuilder()
@@ -4,62 +4,179 @@
 - разбиение базы знаний в формате Markdown на чанки;
 - получение embeddings через OpenAI-совместимый API;
 - построение/загрузку FAISS индекса и выдачу релевантных фрагментов.
+
+Пересборка инкрементальная: каждый чанк получает хеш содержимого, а его
+вектор сохраняется в `embeddings.npy`. При следующей пересборке заново
+запрашиваются embeddings только для новых/изменённых чанков.
+
+В процессе используется один движок (`get_rag_engine()`). Индекс и
+метаданные хранятся в неизменяемом снимке `IndexSnapshot`, который
+подменяется целиком после пересборки: читатели не блокируются и никогда
+не видят наполовину загруженное состояние. Файл-маркер `version.json`
+позволяет другим воркерам заметить пересборку и перечитать индекс.
+
+Метрика индекса задаётся `RAG_INDEX_METRIC`: `cosine` — `IndexFlatIP` по
+L2-нормализованным векторам, где score — cosine similarity и фрагменты
+ниже `RAG_MIN_SCORE` отбрасываются; `l2` — прежний `IndexFlatL2`. Индекс
+с другой метрикой при загрузке перестраивается из сохранённых векторов
+без обращений к embeddings API.
+
+Тип индекса (`flat`, `hnsw`, `ivfpq`) задаётся `RAG_INDEX_TYPE`, см.
+`app.core.faiss_index`; при смене типа индекс так же перестраивается из
+сохранённых векторов.
+
+При `RAG_HYBRID_SEARCH` рядом с FAISS в снимке хранится BM25-индекс
+(`app.core.lexical_index`): результаты векторного и лексического поиска
+объединяются reciprocal rank fusion. Лексическое совпадение учитывается,
+только если в чанке есть не меньше `RAG_LEXICAL_MIN_MATCH` термов
+запроса — как векторное только выше `RAG_MIN_SCORE`; если ни одно не
+проходит порог, поиск возвращает пустой список. Если лексическое совпадение
+однозначно (все термы запроса в одном чанке с большим отрывом), поиск
+обходится без embedding запроса.
 """
 
+import asyncio
+import contextlib
+import hashlib
 import json
 import os
+import time
 import faiss
 import numpy as np
+from typing import Any
+from typing import Awaitable
+from typing import Callable
 from typing import Dict
 from typing import List
-from openai import OpenAI
+from typing import NamedTuple
+from typing import Optional
 from loguru import logger
 
+try:
+    import fcntl
+except ImportError:  # Windows: межпроцессной блокировки нет
+    fcntl = None
+
 from app.config import settings
+from app.core.embeddings import EmbeddingsClient
+from app.core.embeddings import embeddings_client
+from app.core.faiss_index import INDEX_FLAT
+from app.core.faiss_index import METRIC_COSINE
+from app.core.faiss_index import METRIC_L2
+from app.core.faiss_index import apply_search_params
+from app.core.faiss_index import build_index
+from app.core.faiss_index import effective_index_type
+from app.core.faiss_index import evaluate_recall
+from app.core.faiss_index import index_metric
+from app.core.faiss_index import index_type
+from app.core.lexical_index import BM25Index
+from app.core.lexical_index import LexicalHit
+
+# Разделитель фрагментов в контексте для LLM; по нему `app.core.prompt_budget`
+# отбрасывает фрагменты, не вошедшие в бюджет токенов.
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+
+
+class IndexSnapshot(NamedTuple):
+    """Согласованная пара FAISS индекс + метаданные одной сборки."""
+
+    index: Any
+    metadata: List[Dict]
+    version: str
+    metric: str
+    lexical: Optional[BM25Index] = None
+
 
 class RAGEngine:
     """Индексатор и поисковик по базе знаний для RAG.
 
     Хранение:
     - FAISS индекс: `index.faiss`
-    - метаданные чанков: `metadata.json`
+    - метаданные чанков: `metadata.json` (включая хеш содержимого `hash`)
+    - векторы чанков в порядке метаданных: `embeddings.npy`
+    - маркер версии сборки: `version.json` (пишется последним)
 
     Примечание: индекс пересоздаётся из Markdown-файла базы знаний и
     используется для семантического поиска фрагментов, которые затем
     подаются в LLM как контекст.
     """
-    def __init__(self, knowledge_base_path: str, index_path: str):
-        """Создаёт объект RAGEngine и загружает индекс при наличии."""
+    def __init__(
+        self,
+        knowledge_base_path: str,
+        index_path: str,
+        embeddings: Optional[EmbeddingsClient] = None,
+    ):
+        """Создаёт объект RAGEngine и загружает индекс при наличии.
+
+        Args:
+            knowledge_base_path: Путь к Markdown-файлу базы знаний.
+            index_path: Директория FAISS индекса и метаданных.
+            embeddings: Клиент embeddings; по умолчанию общий для процесса.
+        """
         self.kb_path = knowledge_base_path
         self.index_path = index_path
-        self.index = None
-        self.metadata = []
+        self.embeddings = embeddings or embeddings_client
+        self._snapshot: Optional[IndexSnapshot] = None
+        self._marker_mtime: Optional[int] = None
+        self._last_reload_check = 0.0
+        self._reload_task: Optional[asyncio.Task] = None
+        self._rebuild_lock = asyncio.Lock()
+        self._load_error: Optional[str] = None
         
         if os.path.exists(os.path.join(self.index_path, "index.faiss")):
-            self.load_index()
+            try:
+                self.load_index()
+            except (OSError, ValueError, RuntimeError) as e:
+                # Движок создаётся при импорте модулей: ошибка чтения не
+                # должна ронять процесс. Индекс остаётся незагруженным,
+                # а `/health` показывает причину.
+                self._load_error = str(e)
+                logger.error(f"Failed to load FAISS index: {e}")
         else:
             logger.warning("FAISS index not found. Please rebuild index.")
 
-    @staticmethod
-    def _build_client() -> OpenAI:
-        """Создаёт embeddings-клиента по текущему провайдеру."""
-        if settings.LLM_PROVIDER == "proxiapi":
-            return OpenAI(
-                api_key=settings.PROXIAPI_API_KEY,
-                base_url=settings.PROXIAPI_API_BASE
-            )
-        return OpenAI(
-            api_key=settings.OPENAI_API_KEY,
-            base_url=settings.OPENAI_API_BASE
-        )
-
-    def _get_embedding(self, text: str) -> List[float]:
-        """Возвращает embedding для текста через OpenAI embeddings API."""
-        response = self._build_client().embeddings.create(
-            input=text,
-            model="text-embedding-3-small"
-        )
-        return response.data[0].embedding
+    @property
+    def index(self):
+        """FAISS индекс текущего снимка (или `None`, если индекса нет)."""
+        snapshot = self._snapshot
+        return snapshot.index if snapshot is not None else None
+
+    @property
+    def metadata(self) -> List[Dict]:
+        """Метаданные чанков текущего снимка."""
+        snapshot = self._snapshot
+        return snapshot.metadata if snapshot is not None else []
+
+    @property
+    def index_version(self) -> Optional[str]:
+        """Отпечаток содержимого индекса: меняется при каждой пересборке с
+        другим набором чанков (используется, например, кэшем ответов)."""
+        snapshot = self._snapshot
+        return snapshot.version if snapshot is not None else None
+
+    def stats(self) -> Dict[str, Any]:
+        """Размеры текущего снимка для health-проверок.
+
+        Индекс и метаданные берутся из одного снимка, поэтому не могут
+        разойтись из-за параллельной пересборки.
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            if self._load_error is not None:
+                return {"loaded": False, "error": self._load_error}
+            return {"loaded": False}
+        return {
+            "loaded": True,
+            "vectors": int(snapshot.index.ntotal),
+            "chunks": len(snapshot.metadata),
+            "version": snapshot.version,
+            "metric": snapshot.metric,
+            "index_type": index_type(snapshot.index),
+        }
+
+    async def _get_embedding(self, text: str) -> np.ndarray:
+        """Возвращает embedding для текста через общий embeddings-клиент."""
+        return await self.embeddings.embed(text)
 
     @staticmethod
     def _is_md_heading(line: str) -> bool:
@@ -243,76 +360,606 @@ class RAGEngine:
 
         return [c for c in chunks if c.strip()]
 
-    def rebuild_index(self) -> None:
-        """Пересоздаёт FAISS индекс из Markdown-файла базы знаний."""
+    @staticmethod
+    def _chunk_hash(text: str) -> str:
+        """Хеш чанка; модель embeddings входит в ключ, чтобы смена модели
+        инвалидировала сохранённые векторы."""
+        payload = f"{settings.EMBEDDING_MODEL}\n{text}".encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()
+
+    @staticmethod
+    def _compute_index_version(metadata: List[Dict], metric: str, kind: str) -> str:
+        """Версия индекса — хеш от метрики, типа индекса и хешей чанков в
+        порядке индекса.
+
+        Тип входит в версию, потому что приближённый индекс может вернуть
+        другие фрагменты: смена `RAG_INDEX_TYPE` сбрасывает кеш ответов.
+        Для `l2` метрика и для `flat` тип в хеш не входят: версия совпадает
+        с версией сборок, сделанных до появления этих настроек.
+        """
+        digest = hashlib.sha256()
+        if metric != METRIC_L2:
+            digest.update(f"metric={metric}\n".encode("utf-8"))
+        if kind != INDEX_FLAT:
+            digest.update(f"index_type={kind}\n".encode("utf-8"))
+        for item in metadata:
+            digest.update((item.get("hash") or item["text"]).encode("utf-8"))
+            digest.update(b"\n")
+        return digest.hexdigest()[:16]
+
+    def _load_cached_embeddings(self) -> Dict[str, np.ndarray]:
+        """Возвращает векторы прошлой сборки по хешу чанка.
+
+        Пустой словарь, если сохранённых векторов нет или они не
+        согласованы с метаданными (например, индекс собран старой версией).
+        """
+        metadata_file = os.path.join(self.index_path, "metadata.json")
+        embeddings_file = os.path.join(self.index_path, "embeddings.npy")
+        if not (os.path.exists(metadata_file) and os.path.exists(embeddings_file)):
+            return {}
+
+        try:
+            with open(metadata_file, "r", encoding="utf-8") as f:
+                metadata = json.load(f)
+            vectors = np.load(embeddings_file)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Embedding cache is unreadable, full rebuild: {e}")
+            return {}
+
+        if len(metadata) != len(vectors):
+            logger.warning("Embedding cache does not match metadata, full rebuild.")
+            return {}
+
+        return {
+            item["hash"]: vectors[i]
+            for i, item in enumerate(metadata)
+            if item.get("hash")
+        }
+
+    async def rebuild_index(
+        self,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+        on_saving: Optional[Callable[[], None]] = None,
+    ) -> bool:
+        """Пересоздаёт FAISS индекс из Markdown-файла базы знаний.
+
+        Векторы неизменённых чанков берутся из `embeddings.npy`; в
+        embeddings API пачками (`EMBEDDING_BATCH_SIZE`) с ограниченным
+        параллелизмом (`EMBEDDING_REBUILD_CONCURRENCY`) уходят только
+        новые и изменённые чанки. Удалённые чанки просто не попадают
+        в новый индекс.
+
+        Поиск во время пересборки продолжает работать по старому снимку;
+        новый подменяет его одной операцией после записи на диск.
+
+        Сборку и запись снимка (в потоке) прервать нельзя: если задачу
+        отменили на этом шаге, блокировка держится до конца записи, новый
+        снимок применяется, и только затем пробрасывается `CancelledError`.
+        Иначе следующая пересборка писала бы те же `*.tmp` параллельно, а
+        «отменённая» сборка всё равно попала бы на диск.
+
+        Args:
+            on_progress: Колбэк `(готово, всего)` по мере получения embeddings.
+            on_saving: Колбэк перед записью снимка — после него отмена уже
+                не откатывает пересборку.
+
+        Returns:
+            `False`, если файла базы знаний нет или он пуст.
+        """
+        async with self._rebuild_lock:
+            return await self._rebuild_index(on_progress, on_saving)
+
+    async def _rebuild_index(
+        self,
+        on_progress: Optional[Callable[[int, int], None]],
+        on_saving: Optional[Callable[[], None]],
+    ) -> bool:
+        """Тело `rebuild_index`, выполняется под блокировкой пересборки."""
         logger.info(f"Rebuilding index from {self.kb_path}")
         if not os.path.exists(self.kb_path):
             logger.error(f"Knowledge base file not found: {self.kb_path}")
-            return
+            return False
 
-        with open(self.kb_path, "r", encoding="utf-8") as f:
-            content = f.read()
+        # CPU- и диск-операции выполняются в потоке, чтобы не блокировать
+        # event loop ботов; сетевые запросы embeddings — асинхронные.
+        chunks = await asyncio.to_thread(self._read_chunks)
+        if not chunks:
+            logger.error("Knowledge base is empty, index not rebuilt.")
+            return False
+
+        hashes = [self._chunk_hash(chunk) for chunk in chunks]
+        cached = await asyncio.to_thread(self._load_cached_embeddings)
+
+        # Одинаковые чанки отправляем один раз.
+        missing: Dict[str, str] = {}
+        for chunk_hash, chunk in zip(hashes, chunks):
+            if chunk_hash not in cached:
+                missing.setdefault(chunk_hash, chunk)
 
-        chunks = self._chunk_text(content)
-        embeddings = []
-        self.metadata = []
+        def report_progress(done: int, total: int) -> None:
+            logger.info("Embedded {}/{} chunks", done, total)
+            if on_progress is not None:
+                on_progress(done, total)
 
-        for i, chunk in enumerate(chunks):
-            emb = self._get_embedding(chunk)
-            embeddings.append(emb)
-            self.metadata.append({
+        if missing:
+            fresh = await self.embeddings.embed_many(
+                list(missing.values()),
+                on_progress=report_progress,
+            )
+            cached.update(zip(missing.keys(), fresh))
+        elif on_progress is not None:
+            on_progress(0, 0)
+
+        embeddings_np = np.stack([cached[chunk_hash] for chunk_hash in hashes]).astype("float32")
+        reused = len(chunks) - sum(1 for chunk_hash in hashes if chunk_hash in missing)
+        logger.info(
+            "Chunks: total={} reused={} embedded={}",
+            len(chunks),
+            reused,
+            len(missing),
+        )
+
+        metadata = [
+            {
                 "chunk_id": f"kb_{i:03d}",
                 "text": chunk,
-                "source": "knowledge_base.md"
-            })
+                "source": "knowledge_base.md",
+                "hash": chunk_hash
+            }
+            for i, (chunk, chunk_hash) in enumerate(zip(chunks, hashes))
+        ]
+
+        if on_saving is not None:
+            on_saving()
+        saving = asyncio.ensure_future(
+            asyncio.to_thread(self._build_and_save_snapshot_locked, metadata, embeddings_np)
+        )
+        try:
+            snapshot = await asyncio.shield(saving)
+        except asyncio.CancelledError:
+            # Поток не остановить: дожидаемся записи под блокировкой и
+            # применяем снимок, который уже лежит на диске.
+            logger.warning("Index rebuild cancelled while saving, finishing the write")
+            snapshot = await saving
+            self._apply_rebuilt_snapshot(snapshot)
+            raise
+        self._apply_rebuilt_snapshot(snapshot)
+        return True
+
+    def _apply_rebuilt_snapshot(self, snapshot: IndexSnapshot) -> None:
+        """Подменяет снимок поиска только что записанным."""
+        self._snapshot = snapshot
+        self._marker_mtime = self._get_marker_mtime()
+        logger.info(f"Index rebuilt successfully, version={snapshot.version}.")
+
+    def _read_chunks(self) -> List[str]:
+        """Читает Markdown базы знаний и разбивает его на чанки."""
+        with open(self.kb_path, "r", encoding="utf-8") as f:
+            content = f.read()
+        return self._chunk_text(content)
 
-        embeddings_np = np.array(embeddings).astype('float32')
-        dimension = embeddings_np.shape[1]
-        
-        self.index = faiss.IndexFlatL2(dimension)
-        self.index.add(embeddings_np)
+    def _build_and_save_snapshot(
+        self,
+        metadata: List[Dict],
+        embeddings_np: np.ndarray,
+    ) -> IndexSnapshot:
+        """Строит FAISS индекс по векторам и сохраняет сборку на диск.
+
+        В `embeddings.npy` остаются исходные (ненормализованные) векторы,
+        чтобы сборку можно было перестроить под любую метрику.
+        """
+        metric = settings.RAG_INDEX_METRIC
+        started_at = time.monotonic()
+        index = build_index(embeddings_np, metric)
+        logger.info(
+            "Built {} index over {} vectors in {:.1f}s",
+            index_type(index),
+            index.ntotal,
+            time.monotonic() - started_at,
+        )
+        snapshot = IndexSnapshot(
+            index,
+            metadata,
+            self._compute_index_version(metadata, metric, index_type(index)),
+            metric,
+            self._build_lexical_index(metadata),
+        )
+
+        evaluation = None
+        if index_type(index) != INDEX_FLAT and settings.RAG_INDEX_EVAL_QUERIES > 0:
+            evaluation = evaluate_recall(
+                index,
+                embeddings_np,
+                metric,
+                top_k=settings.TOP_K_RESULTS,
+                sample_size=settings.RAG_INDEX_EVAL_QUERIES,
+            )
+            logger.info(
+                "Index quality vs flat: recall@{}={:.3f} p50={:.3f}ms p95={:.3f}ms "
+                "(flat p50={:.3f}ms p95={:.3f}ms, {} queries)",
+                evaluation["top_k"],
+                evaluation["recall_at_k"],
+                evaluation["p50_ms"],
+                evaluation["p95_ms"],
+                evaluation["flat_p50_ms"],
+                evaluation["flat_p95_ms"],
+                evaluation["queries"],
+            )
+
+        self._write_index_files(snapshot, embeddings_np, evaluation)
+        return snapshot
+
+    def _build_and_save_snapshot_locked(
+        self,
+        metadata: List[Dict],
+        embeddings_np: np.ndarray,
+    ) -> IndexSnapshot:
+        """`_build_and_save_snapshot` под межпроцессной блокировкой записи индекса."""
+        with self._index_file_lock():
+            return self._build_and_save_snapshot(metadata, embeddings_np)
+
+    @staticmethod
+    def _build_lexical_index(metadata: List[Dict]) -> Optional[BM25Index]:
+        """BM25-индекс по текстам чанков (если гибридный поиск включён)."""
+        if not settings.RAG_HYBRID_SEARCH:
+            return None
+        return BM25Index([item["text"] for item in metadata])
+
+    @staticmethod
+    def _needs_conversion(snapshot: IndexSnapshot) -> bool:
+        """Собран ли индекс с другой метрикой или другим типом, чем в настройках."""
+        if snapshot.metric != settings.RAG_INDEX_METRIC:
+            return True
+        return index_type(snapshot.index) != effective_index_type(snapshot.index.ntotal)
+
+    def _convert_snapshot(self, snapshot: IndexSnapshot) -> IndexSnapshot:
+        """Перестраивает сборку под текущие настройки без запросов к API.
+
+        Векторы берутся из `embeddings.npy`, а если его нет (индекс собран
+        старой версией) — восстанавливаются из самого плоского индекса.
+        Если восстановить векторы нельзя, остаётся прежний индекс.
+        """
+        logger.info(
+            "Converting {} {} index to {} {}",
+            snapshot.metric,
+            index_type(snapshot.index),
+            settings.RAG_INDEX_METRIC,
+            effective_index_type(snapshot.index.ntotal),
+        )
+        cached = self._load_cached_embeddings()
+        hashes = [item.get("hash") for item in snapshot.metadata]
+        if cached and all(chunk_hash in cached for chunk_hash in hashes):
+            embeddings_np = np.stack([cached[chunk_hash] for chunk_hash in hashes])
+            embeddings_np = embeddings_np.astype("float32")
+        elif index_type(snapshot.index) == INDEX_FLAT:
+            embeddings_np = snapshot.index.reconstruct_n(0, snapshot.index.ntotal)
+        else:
+            logger.warning("embeddings.npy is missing, rebuild the index to apply new settings.")
+            return snapshot
+        return self._build_and_save_snapshot(snapshot.metadata, embeddings_np)
 
-        # Важно: сохраняем индекс и метаданные атомарно в одну директорию,
+    def _replace_file(self, name: str, write: Callable[[str], None]) -> None:
+        """Пишет файл во временный и атомарно подменяет им `name`.
+
+        Имя временного файла своё у каждого процесса: воркеры, пишущие
+        индекс одновременно, не портят файлы друг друга, а какая сборка
+        осталась на диске, решает маркер версии.
+        """
+        target = os.path.join(self.index_path, name)
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        write(tmp_path)
+        os.replace(tmp_path, target)
+
+    def _write_index_files(
+        self,
+        snapshot: IndexSnapshot,
+        embeddings_np: np.ndarray,
+        evaluation: Optional[Dict] = None,
+    ) -> None:
+        """Сохраняет сборку на диск; маркер версии пишется последним.
+
+        В маркер также попадают тип индекса и, для приближённых индексов,
+        результат сравнения с точным перебором (`evaluation`).
+
+        Каждый файл подменяется атомарно, а читатели сверяют версию из
+        маркера с метаданными, поэтому другой воркер не загрузит смесь
+        старых и новых файлов.
+        """
+        # Важно: сохраняем индекс и метаданные в одну директорию,
         # чтобы при рестарте сервиса можно было быстро восстановиться.
-        if not os.path.exists(self.index_path):
-            os.makedirs(self.index_path)
-        
-        faiss.write_index(self.index, os.path.join(self.index_path, "index.faiss"))
-        with open(os.path.join(self.index_path, "metadata.json"), "w", encoding="utf-8") as f:
-            json.dump(self.metadata, f, ensure_ascii=False, indent=4)
-        
-        logger.info("Index rebuilt successfully.")
+        os.makedirs(self.index_path, exist_ok=True)
+
+        def write_embeddings(path: str) -> None:
+            with open(path, "wb") as f:
+                np.save(f, embeddings_np)
+
+        def write_metadata(path: str) -> None:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(snapshot.metadata, f, ensure_ascii=False, indent=4)
+
+        def write_marker(path: str) -> None:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        "version": snapshot.version,
+                        "metric": snapshot.metric,
+                        "index_type": index_type(snapshot.index),
+                        "evaluation": evaluation,
+                        "built_at": time.time()
+                    },
+                    f
+                )
+
+        self._replace_file("index.faiss", lambda path: faiss.write_index(snapshot.index, path))
+        self._replace_file("embeddings.npy", write_embeddings)
+        self._replace_file("metadata.json", write_metadata)
+        self._replace_file("version.json", write_marker)
+
+    def _get_marker_mtime(self) -> Optional[int]:
+        """mtime маркера версии в наносекундах или `None`, если его нет."""
+        try:
+            return os.stat(os.path.join(self.index_path, "version.json")).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _read_snapshot(self) -> IndexSnapshot:
+        """Читает индекс и метаданные с диска и проверяет их согласованность.
+
+        Raises:
+            ValueError: файлы относятся к разным сборкам (идёт запись).
+        """
+        index = faiss.read_index(os.path.join(self.index_path, "index.faiss"))
+        with open(os.path.join(self.index_path, "metadata.json"), "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+        apply_search_params(index)
+        metric = index_metric(index)
+        version = self._compute_index_version(metadata, metric, index_type(index))
+
+        if index.ntotal != len(metadata):
+            raise ValueError(
+                f"Index has {index.ntotal} vectors but metadata has {len(metadata)} chunks"
+            )
+        marker_file = os.path.join(self.index_path, "version.json")
+        if os.path.exists(marker_file):
+            with open(marker_file, "r", encoding="utf-8") as f:
+                marker_version = json.load(f).get("version")
+            if marker_version != version:
+                raise ValueError(f"Index files do not match version marker {marker_version}")
+
+        return IndexSnapshot(index, metadata, version, metric, self._build_lexical_index(metadata))
+
+    @contextlib.contextmanager
+    def _index_file_lock(self):
+        """Межпроцессная блокировка `index.lock` на время записи индекса."""
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.index_path, exist_ok=True)
+        with open(os.path.join(self.index_path, "index.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
 
     def load_index(self) -> None:
-        """Загрузка индекса с диска."""
-        self.index = faiss.read_index(os.path.join(self.index_path, "index.faiss"))
-        with open(os.path.join(self.index_path, "metadata.json"), "r", encoding="utf-8") as f:
-            self.metadata = json.load(f)
-        logger.info("Index loaded from disk.")
+        """Загрузка индекса с диска.
 
-    async def search(self, query: str, top_k: int = 3) -> List[Dict]:
-        """Семантический поиск релевантных фрагментов."""
-        if self.index is None:
-            return []
+        Если индекс собран с другой метрикой (например, старый L2) или
+        другого типа, он сразу перестраивается под `RAG_INDEX_METRIC` /
+        `RAG_INDEX_TYPE` и перезаписывается. Конвертирует один воркер под
+        файловой блокировкой; остальные дожидаются её и перечитывают уже
+        сконвертированный индекс.
+        """
+        marker_mtime = self._get_marker_mtime()
+        try:
+            snapshot = self._read_snapshot()
+            stale = self._needs_conversion(snapshot)
+        except ValueError:
+            # Другой воркер сейчас пишет индекс: перечитаем после него.
+            stale = True
+        if stale:
+            with self._index_file_lock():
+                # Пока ждали блокировку, индекс мог сконвертировать другой воркер.
+                marker_mtime = self._get_marker_mtime()
+                snapshot = self._read_snapshot()
+                if self._needs_conversion(snapshot):
+                    snapshot = self._convert_snapshot(snapshot)
+                    marker_mtime = self._get_marker_mtime()
+        self._snapshot = snapshot
+        self._marker_mtime = marker_mtime
+        logger.info(f"Index loaded from disk, version={self.index_version}.")
+
+    def _schedule_reload_check(self) -> None:
+        """Не чаще `RAG_RELOAD_CHECK_INTERVAL` проверяет маркер версии и,
+        если индекс пересобран другим процессом, перечитывает его в фоне."""
+        now = time.monotonic()
+        if now - self._last_reload_check < settings.RAG_RELOAD_CHECK_INTERVAL:
+            return
+        self._last_reload_check = now
+
+        marker_mtime = self._get_marker_mtime()
+        if marker_mtime is None or marker_mtime == self._marker_mtime:
+            return
+        if self._reload_task is not None and not self._reload_task.done():
+            return
+        self._reload_task = asyncio.create_task(self._reload_from_disk(marker_mtime))
+
+    async def _reload_from_disk(self, marker_mtime: int) -> None:
+        """Читает новую сборку в отдельном потоке и подменяет снимок."""
+        try:
+            snapshot = await asyncio.to_thread(self._read_snapshot)
+        except (OSError, ValueError, RuntimeError) as e:
+            # Запись ещё не закончена; попробуем при следующей проверке.
+            logger.warning(f"Index reload postponed: {e}")
+            return
 
-        query_emb = np.array([self._get_embedding(query)]).astype('float32')
-        distances, indices = self.index.search(query_emb, top_k)
+        self._marker_mtime = marker_mtime
+        if snapshot.version != self.index_version:
+            self._snapshot = snapshot
+            logger.info(f"Index reloaded from disk, version={snapshot.version}.")
 
-        results = []
+    @staticmethod
+    def _is_decisive(hits: List[LexicalHit]) -> bool:
+        """Однозначно ли лексическое совпадение для ответа без векторного поиска.
+
+        Лучший чанк должен содержать все термы запроса (не меньше
+        `RAG_LEXICAL_FAST_PATH_MIN_TERMS`) и опережать второй по BM25 не
+        меньше чем в `RAG_LEXICAL_FAST_PATH_RATIO` раз.
+        """
+        if not hits:
+            return False
+        best = hits[0]
+        if best.query_terms < settings.RAG_LEXICAL_FAST_PATH_MIN_TERMS:
+            return False
+        if best.matched_terms < best.query_terms:
+            return False
+        if len(hits) == 1:
+            return True
+        return best.score >= hits[1].score * settings.RAG_LEXICAL_FAST_PATH_RATIO
+
+    @staticmethod
+    def _lexical_search(snapshot: IndexSnapshot, query: str, top_k: int) -> List[LexicalHit]:
+        """BM25-кандидаты, в которых есть не меньше `RAG_LEXICAL_MIN_MATCH` термов запроса."""
+        hits = snapshot.lexical.search(query, top_k)
+        relevant = [
+            hit for hit in hits
+            if hit.matched_terms >= hit.query_terms * settings.RAG_LEXICAL_MIN_MATCH
+        ]
+        if len(relevant) < len(hits):
+            logger.debug(
+                "Dropped {} lexical hits below RAG_LEXICAL_MIN_MATCH={}",
+                len(hits) - len(relevant),
+                settings.RAG_LEXICAL_MIN_MATCH,
+            )
+        return relevant
+
+    @staticmethod
+    def _vector_search(snapshot: IndexSnapshot, embedding: np.ndarray, top_k: int) -> List[tuple]:
+        """Пары `(позиция чанка, score)` из FAISS, отфильтрованные по `RAG_MIN_SCORE`."""
+        query_emb = np.array([embedding]).astype('float32')
+        is_cosine = snapshot.metric == METRIC_COSINE
+        if is_cosine:
+            faiss.normalize_L2(query_emb)
+        scores, indices = snapshot.index.search(query_emb, top_k)
+
+        hits = []
+        dropped = 0
         for i, idx in enumerate(indices[0]):
-            if idx != -1 and idx < len(self.metadata):
-                # Ограничение текущей реализации: в IndexFlatL2 меньше = лучше.
-                # Если понадобится cosine similarity, нужно перейти на IndexFlatIP
-                # и нормализовать эмбеддинги.
-                results.append({
-                    "text": self.metadata[idx]["text"],
-                    "score": float(distances[0][i]),
-                    "metadata": self.metadata[idx]
-                })
-        return results
-
-    async def get_context_for_query(self, query: str) -> str:
-        """Формирование контекста для GPT."""
-        results = await self.search(query, top_k=settings.TOP_K_RESULTS)
+            if idx != -1 and idx < len(snapshot.metadata):
+                score = float(scores[0][i])
+                if is_cosine and score < settings.RAG_MIN_SCORE:
+                    dropped += 1
+                    continue
+                hits.append((int(idx), score))
+        if dropped:
+            logger.debug(
+                "Dropped {} chunks below RAG_MIN_SCORE={}",
+                dropped,
+                settings.RAG_MIN_SCORE,
+            )
+        return hits
+
+    @staticmethod
+    def _fuse(vector_hits: List[tuple], lexical_hits: List[LexicalHit], top_k: int) -> List[tuple]:
+        """Reciprocal rank fusion: `score = Σ 1 / (RAG_RRF_K + rank)`.
+
+        Оба списка уже отфильтрованы по своим порогам релевантности, поэтому
+        чанк попадает в результат, только если прошёл хотя бы один из них.
+        """
+        fused: Dict[int, float] = {}
+        for rank, (idx, _) in enumerate(vector_hits, start=1):
+            fused[idx] = fused.get(idx, 0.0) + 1.0 / (settings.RAG_RRF_K + rank)
+        for rank, hit in enumerate(lexical_hits, start=1):
+            fused[hit.doc_id] = fused.get(hit.doc_id, 0.0) + 1.0 / (settings.RAG_RRF_K + rank)
+        return sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+    @staticmethod
+    def _make_result(snapshot: IndexSnapshot, idx: int, score: float) -> Dict:
+        """Элемент результата `search` для чанка на позиции `idx`."""
+        return {
+            "text": snapshot.metadata[idx]["text"],
+            "score": score,
+            "metadata": snapshot.metadata[idx]
+        }
+
+    async def search(
+        self,
+        query: str,
+        top_k: int = 3,
+        embedding: Optional[np.ndarray] = None,
+        embed: Optional[Callable[[], Awaitable[np.ndarray]]] = None,
+    ) -> List[Dict]:
+        """Поиск релевантных фрагментов.
+
+        `embedding` — уже посчитанный вектор запроса; если не передан,
+        он запрашивается через `embed` (например, `PipelineContext.get_embedding`)
+        или у embeddings API — и только если не сработал лексический fast path.
+
+        Без гибридного поиска для cosine-индекса `score` — cosine
+        similarity (больше = лучше), фрагменты ниже `RAG_MIN_SCORE`
+        отбрасываются; для L2 `score` — расстояние (меньше = лучше).
+        В гибридном режиме `score` — RRF-оценка (больше = лучше), а в
+        fast path — BM25; в обоих случаях учитываются только чанки выше
+        `RAG_MIN_SCORE` или с долей термов запроса не ниже
+        `RAG_LEXICAL_MIN_MATCH`, и при отсутствии таких результат пуст.
+        """
+        self._schedule_reload_check()
+        # Снимок берём один раз: индекс и метаданные гарантированно из одной сборки.
+        snapshot = self._snapshot
+        if snapshot is None:
+            return []
+
+        lexical_hits: List[LexicalHit] = []
+        if snapshot.lexical is not None:
+            candidates = max(top_k, settings.RAG_HYBRID_CANDIDATES)
+            lexical_hits = self._lexical_search(snapshot, query, candidates)
+            if settings.RAG_LEXICAL_FAST_PATH and self._is_decisive(lexical_hits):
+                logger.debug("Lexical fast path: {} hits", min(top_k, len(lexical_hits)))
+                return [
+                    self._make_result(snapshot, hit.doc_id, hit.score)
+                    for hit in lexical_hits[:top_k]
+                ]
+
+        if embedding is None:
+            embedding = await embed() if embed is not None else await self._get_embedding(query)
+
+        if snapshot.lexical is None:
+            return [
+                self._make_result(snapshot, idx, score)
+                for idx, score in self._vector_search(snapshot, embedding, top_k)
+            ]
+
+        vector_hits = self._vector_search(snapshot, embedding, candidates)
+        return [
+            self._make_result(snapshot, idx, score)
+            for idx, score in self._fuse(vector_hits, lexical_hits, top_k)
+        ]
+
+    async def get_context_for_query(
+        self,
+        query: str,
+        embedding: Optional[np.ndarray] = None,
+        embed: Optional[Callable[[], Awaitable[np.ndarray]]] = None,
+    ) -> str:
+        """Формирование контекста для GPT; аргументы — как у `search`."""
+        results = await self.search(
+            query, top_k=settings.TOP_K_RESULTS, embedding=embedding, embed=embed
+        )
         context_parts = [r["text"] for r in results]
-        return "\n\n---\n\n".join(context_parts)
+        return CONTEXT_SEPARATOR.join(context_parts)
+
+
+_engine: Optional[RAGEngine] = None
+
+
+def get_rag_engine() -> RAGEngine:
+    """Возвращает общий для процесса RAGEngine (создаётся при первом вызове).
+
+    Telegram, Jivo и админка работают с одним экземпляром, поэтому индекс
+    загружается один раз, а пересборка из админки сразу видна ботам.
+    """
+    global _engine
+    if _engine is None:
+        _engine = RAGEngine(settings.KNOWLEDGE_BASE_PATH, settings.FAISS_INDEX_PATH)
+    return _engine
@@ -0,0 +1,154 @@
+"""Фоновые задачи пересборки индекса базы знаний.
+
+Пересборка запускается из админки и может длиться долго, поэтому роут не
+ждёт её завершения: `RebuildJobManager.start()` создаёт задачу и сразу
+возвращает её описание с `job_id`, а админка опрашивает статус.
+
+Гарантии:
+- одновременно выполняется не больше одной пересборки;
+- задачу можно отменить, пока не началась запись нового снимка; бот при
+  этом продолжает работать на старом индексе. Запись на диск не
+  прерывается: после её начала `cancel()` отказывает, а задача, прерванная
+  на этом шаге иначе (остановка приложения), завершается со статусом
+  реального исхода — снимок уже записан и применён.
+"""
+
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+
+from loguru import logger
+
+from app.core.rag_engine import RAGEngine
+
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+
+@dataclass
+class RebuildJob:
+    """Состояние одной пересборки индекса."""
+
+    id: str
+    status: str = JOB_RUNNING
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    done: int = 0
+    total: int = 0
+    error: Optional[str] = None
+    saving: bool = False
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    def to_dict(self) -> Dict:
+        """Описание задачи для JSON-ответа админки."""
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "done": self.done,
+            "total": self.total,
+            "error": self.error,
+            "saving": self.saving,
+        }
+
+
+class RebuildJobManager:
+    """Запускает пересборку в фоне и хранит историю последних задач."""
+
+    def __init__(self, rag: RAGEngine, history_size: int = 20):
+        """Создаёт менеджер для движка `rag`.
+
+        Args:
+            rag: Движок, индекс которого пересобирается.
+            history_size: Сколько завершённых задач хранить для запросов статуса.
+        """
+        self.rag = rag
+        self.history_size = max(1, history_size)
+        self._jobs: "OrderedDict[str, RebuildJob]" = OrderedDict()
+        self._current: Optional[RebuildJob] = None
+
+    @property
+    def current(self) -> Optional[RebuildJob]:
+        """Выполняющаяся задача или `None`."""
+        if self._current is not None and self._current.status == JOB_RUNNING:
+            return self._current
+        return None
+
+    def start(self) -> Tuple[RebuildJob, bool]:
+        """Запускает пересборку, если она ещё не идёт.
+
+        Returns:
+            Пара `(задача, создана_ли_новая)`; если пересборка уже идёт,
+            возвращается текущая задача.
+        """
+        running = self.current
+        if running is not None:
+            return running, False
+
+        job = RebuildJob(id=uuid.uuid4().hex)
+        self._jobs[job.id] = job
+        while len(self._jobs) > self.history_size:
+            self._jobs.popitem(last=False)
+
+        self._current = job
+        job.task = asyncio.create_task(self._run(job))
+        logger.info("Index rebuild job {} started", job.id)
+        return job, True
+
+    def get(self, job_id: str) -> Optional[RebuildJob]:
+        """Возвращает задачу по идентификатору."""
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """Отменяет выполняющуюся задачу.
+
+        Returns:
+            `True`, если отмена запрошена; `False`, если задача не
+            выполняется или уже записывает снимок.
+        """
+        job = self._jobs.get(job_id)
+        if job is None or job.status != JOB_RUNNING or job.task is None or job.saving:
+            return False
+        job.task.cancel()
+        return True
+
+    async def _run(self, job: RebuildJob) -> None:
+        """Выполняет пересборку и фиксирует итоговый статус задачи."""
+
+        def on_progress(done: int, total: int) -> None:
+            job.done = done
+            job.total = total
+
+        def on_saving() -> None:
+            job.saving = True
+
+        try:
+            if await self.rag.rebuild_index(on_progress=on_progress, on_saving=on_saving):
+                job.status = JOB_SUCCEEDED
+            else:
+                job.status = JOB_FAILED
+                job.error = "Файл базы знаний не найден или пуст."
+        except asyncio.CancelledError:
+            if job.saving:
+                # rebuild_index дописал и применил снимок до проброса отмены.
+                job.status = JOB_SUCCEEDED
+                logger.warning("Index rebuild job {} cancelled after the index was saved", job.id)
+            else:
+                job.status = JOB_CANCELLED
+                logger.warning("Index rebuild job {} cancelled", job.id)
+        except Exception as e:
+            job.status = JOB_FAILED
+            job.error = str(e)
+            logger.error(f"Index rebuild job {job.id} failed: {e}")
+        finally:
+            job.finished_at = time.time()
+            job.task = None
@@ -4,68 +4,90 @@
 - `RateLimiter`: ограничивает частоту запросов пользователем;
 - `SpamFilter`: отсекает повторяющиеся или слишком короткие/длинные
   сообщения, чтобы не нагружать LLM и RAG.
+
+Состояние хранится в `LimitsBackend` (см. `app.core.limit_backends`):
+в памяти процесса или в общем SQLite, чтобы лимиты соблюдались при
+нескольких воркерах. Telegram и Jivo используют общие экземпляры
+`rate_limiter` и `spam_filter`.
 """
 
-import time
-from typing import Dict, List
+import hashlib
+
+from loguru import logger
+
 from app.config import settings
+from app.core.limit_backends import LimitsBackend
+from app.core.limit_backends import create_limits_backend
+
+# Столько одинаковых сообщений подряд считается спамом.
+REPEATED_MESSAGES = 3
+
 
 class RateLimiter:
-    """Базовый rate limiter на уровне процесса (in-memory)."""
-    def __init__(self, max_requests: int = 20, window: int = 3600):
+    """Rate limiter со скользящим окном поверх `LimitsBackend`."""
+
+    def __init__(self, backend: LimitsBackend, max_requests: int = 20, window: int = 3600):
+        self.backend = backend
         self.max_requests = max_requests
         self.window = window
-        self.requests = {}  # {user_id: [timestamp1, timestamp2, ...]}
 
-    async def check_limit(self, user_id: str) -> bool:
-        """Проверка лимита запросов."""
-        now = time.time()
-        if user_id not in self.requests:
+    async def acquire(self, user_id: str) -> bool:
+        """Проверяет лимит и, если он не исчерпан, учитывает запрос.
+
+        Проверка и учёт выполняются одной атомарной операцией бэкенда.
+        При ошибке хранилища запрос пропускается: лучше ответить сверх
+        лимита, чем не отвечать никому.
+        """
+        try:
+            return await self.backend.hit(user_id, self.max_requests, self.window)
+        except Exception as e:
+            logger.warning(f"Rate limit check failed, allowing request: {e}")
             return True
-        
-        # Очистка старых запросов
-        self.requests[user_id] = [
-            ts for ts in self.requests[user_id]
-            if now - ts < self.window
-        ]
-        
-        return len(self.requests[user_id]) < self.max_requests
-
-    async def increment(self, user_id: str) -> None:
-        """Регистрирует факт запроса для пользователя."""
-        now = time.time()
-        if user_id not in self.requests:
-            self.requests[user_id] = []
-        self.requests[user_id].append(now)
+
 
 class SpamFilter:
-    """Фильтр спама по эвристикам (также in-memory)."""
-    def __init__(self):
-        self.last_messages = {}  # {user_id: [msg1, msg2, msg3]}
-        self.blacklist = set()
+    """Фильтр спама по эвристикам поверх `LimitsBackend`."""
+
+    def __init__(self, backend: LimitsBackend):
+        self.backend = backend
+
+    @staticmethod
+    def _fingerprint(message: str) -> str:
+        """Отпечаток сообщения: для сравнения повторов текст хранить не нужно."""
+        return hashlib.sha1(message.encode("utf-8")).hexdigest()
 
     async def is_spam(self, user_id: str, message: str) -> bool:
         """Проверка сообщения на спам."""
-        if user_id in self.blacklist:
-            return True
-            
         # Слишком короткое или длинное
         if len(message) < 3 or len(message) > 2000:
             return True
-            
-        # Повторяющиеся сообщения
-        if user_id not in self.last_messages:
-            self.last_messages[user_id] = []
-        
-        self.last_messages[user_id].append(message)
-        if len(self.last_messages[user_id]) > 3:
-            self.last_messages[user_id].pop(0)
-            
-        if len(self.last_messages[user_id]) == 3 and len(set(self.last_messages[user_id])) == 1:
-            return True
-            
-        return False
+
+        try:
+            if await self.backend.has_flag(user_id):
+                return True
+
+            # Повторяющиеся сообщения
+            recent = await self.backend.push_recent(
+                user_id, self._fingerprint(message), REPEATED_MESSAGES
+            )
+        except Exception as e:
+            logger.warning(f"Spam check failed, allowing message: {e}")
+            return False
+
+        return len(recent) == REPEATED_MESSAGES and len(set(recent)) == 1
 
     async def add_to_blacklist(self, user_id: str):
         """Блокировка пользователя."""
-        self.blacklist.add(user_id)
+        await self.backend.add_flag(user_id)
+
+
+limits_backend = create_limits_backend()
+
+# Общие для всех каналов экземпляры: лимит считается на пользователя, а не
+# на модуль, который принял сообщение.
+rate_limiter = RateLimiter(
+    limits_backend,
+    max_requests=settings.RATE_LIMIT_REQUESTS,
+    window=settings.RATE_LIMIT_WINDOW,
+)
+spam_filter = SpamFilter(limits_backend)
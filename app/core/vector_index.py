@@ -0,0 +1,151 @@
+"""In-memory индекс нормализованных векторов для cosine-поиска.
+
+Используется там, где нужен быстрый ответ на вопрос «есть ли уже похожий
+вектор»: все векторы хранятся одной float32-матрицей, заранее
+нормализованной по L2, поэтому поиск ближайшего соседа сводится к одному
+матричному умножению вместо цикла по строкам БД.
+"""
+
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+import numpy as np
+
+
+class VectorIndex:
+    """Плотная матрица L2-нормализованных векторов с целочисленными ключами.
+
+    Матрица растёт удвоением ёмкости, поэтому добавление амортизированно
+    O(1), удаление — O(1) перестановкой с последней строкой, а поиск —
+    одно умножение `matrix @ query`.
+    """
+
+    def __init__(self, initial_capacity: int = 1024):
+        """Создаёт пустой индекс; размерность определяется первым вектором."""
+        self._initial_capacity = max(1, int(initial_capacity))
+        self._vectors: Optional[np.ndarray] = None
+        self._keys = np.empty(0, dtype=np.int64)
+        self._positions: Dict[int, int] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, key: int) -> bool:
+        return key in self._positions
+
+    @property
+    def dimension(self) -> Optional[int]:
+        """Размерность векторов или `None`, если индекс пуст."""
+        if self._vectors is None:
+            return None
+        return self._vectors.shape[1]
+
+    @staticmethod
+    def normalize(vectors: np.ndarray) -> np.ndarray:
+        """Приводит векторы к float32 и единичной L2-норме (нулевые не трогает)."""
+        matrix = np.asarray(vectors, dtype=np.float32)
+        single = matrix.ndim == 1
+        if single:
+            matrix = matrix.reshape(1, -1)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix = matrix / norms
+        return matrix[0] if single else matrix
+
+    def _reserve(self, required: int, dimension: int) -> None:
+        """Гарантирует ёмкость матрицы не меньше `required` строк."""
+        if self._vectors is None:
+            capacity = max(self._initial_capacity, required)
+            self._vectors = np.zeros((capacity, dimension), dtype=np.float32)
+            self._keys = np.zeros(capacity, dtype=np.int64)
+            return
+
+        if dimension != self._vectors.shape[1]:
+            raise ValueError(
+                f"Vector dimension {dimension} does not match index "
+                f"dimension {self._vectors.shape[1]}"
+            )
+
+        capacity = self._vectors.shape[0]
+        if required <= capacity:
+            return
+        while capacity < required:
+            capacity *= 2
+
+        vectors = np.zeros((capacity, dimension), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        keys = np.zeros(capacity, dtype=np.int64)
+        keys[:self._size] = self._keys[:self._size]
+        self._vectors = vectors
+        self._keys = keys
+
+    def add(self, key: int, vector: np.ndarray) -> None:
+        """Добавляет один вектор под ключом `key`."""
+        self.add_many([key], np.asarray(vector).reshape(1, -1))
+
+    def add_many(self, keys: Sequence[int], vectors: np.ndarray) -> None:
+        """Добавляет пачку векторов одной операцией копирования."""
+        if len(keys) == 0:
+            return
+        matrix = self.normalize(np.asarray(vectors).reshape(len(keys), -1))
+        required = self._size + len(keys)
+        self._reserve(required, matrix.shape[1])
+        self._vectors[self._size:required] = matrix
+        self._keys[self._size:required] = np.asarray(keys, dtype=np.int64)
+        for offset, key in enumerate(keys):
+            self._positions[int(key)] = self._size + offset
+        self._size = required
+
+    def remove(self, key: int) -> bool:
+        """Удаляет вектор по ключу за O(1): на его место встаёт последний.
+
+        Returns:
+            `True`, если ключ был в индексе.
+        """
+        position = self._positions.pop(int(key), None)
+        if position is None:
+            return False
+        last = self._size - 1
+        if position != last:
+            self._vectors[position] = self._vectors[last]
+            moved_key = int(self._keys[last])
+            self._keys[position] = moved_key
+            self._positions[moved_key] = position
+        self._size = last
+        return True
+
+    def nearest(self, vector: np.ndarray) -> Optional[Tuple[int, float]]:
+        """Возвращает `(key, cosine_similarity)` ближайшего вектора.
+
+        Возвращает `None`, если индекс пуст.
+        """
+        if self._size == 0:
+            return None
+        query = self.normalize(vector)
+        scores = self._vectors[:self._size] @ query
+        best = int(np.argmax(scores))
+        return int(self._keys[best]), float(scores[best])
+
+    def search(self, vector: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """Возвращает до `k` пар `(key, cosine_similarity)` по убыванию сходства."""
+        if self._size == 0 or k <= 0:
+            return []
+        query = self.normalize(vector)
+        scores = self._vectors[:self._size] @ query
+        if k < self._size:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(self._size)
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(self._keys[i]), float(scores[i])) for i in top]
+
+    def clear(self) -> None:
+        """Удаляет все векторы из индекса."""
+        self._vectors = None
+        self._keys = np.empty(0, dtype=np.int64)
+        self._positions = {}
+        self._size = 0
@@ -0,0 +1,60 @@
+"""Компактный бинарный формат хранения embeddings в БД.
+
+Вектор хранится как «сырые» little-endian байты float32 (или float16),
+а размерность и версия формата — в отдельных колонках. Декодирование
+выполняется через `np.frombuffer` без копирования и без `pickle`.
+
+Версии формата:
+- `EMBEDDING_VERSION_PICKLE` (0 / NULL) — исторический pickle float64;
+- `EMBEDDING_VERSION_FLOAT32` (1) — `<f4`;
+- `EMBEDDING_VERSION_FLOAT16` (2) — `<f2`.
+"""
+
+from typing import Tuple
+
+import numpy as np
+
+EMBEDDING_VERSION_PICKLE = 0
+EMBEDDING_VERSION_FLOAT32 = 1
+EMBEDDING_VERSION_FLOAT16 = 2
+
+_DTYPES = {
+    EMBEDDING_VERSION_FLOAT32: np.dtype("<f4"),
+    EMBEDDING_VERSION_FLOAT16: np.dtype("<f2"),
+}
+_VERSIONS_BY_NAME = {
+    "float32": EMBEDDING_VERSION_FLOAT32,
+    "float16": EMBEDDING_VERSION_FLOAT16,
+}
+
+
+def version_for_dtype(dtype_name: str) -> int:
+    """Возвращает версию формата по имени типа (`float32`/`float16`)."""
+    try:
+        return _VERSIONS_BY_NAME[dtype_name]
+    except KeyError:
+        raise ValueError(f"Unsupported embedding dtype: {dtype_name}") from None
+
+
+def encode_embedding(vector: np.ndarray, version: int) -> Tuple[bytes, int]:
+    """Кодирует вектор в байты формата `version`.
+
+    Returns:
+        Пара `(blob, dimension)` для записи в БД.
+    """
+    if version not in _DTYPES:
+        raise ValueError(f"Unsupported embedding version: {version}")
+    array = np.asarray(vector, dtype=_DTYPES[version]).reshape(-1)
+    return array.tobytes(), int(array.shape[0])
+
+
+def decode_embedding(blob: bytes, version: int, dimension: int) -> np.ndarray:
+    """Декодирует байты в read-only numpy-массив без копирования."""
+    if version not in _DTYPES:
+        raise ValueError(f"Unsupported embedding version: {version}")
+    array = np.frombuffer(blob, dtype=_DTYPES[version])
+    if array.shape[0] != dimension:
+        raise ValueError(
+            f"Embedding blob has {array.shape[0]} values, expected {dimension}"
+        )
+    return array
@@ -1,7 +1,7 @@
 """ORM-модели для БД вопросов.
 
 Используется SQLAlchemy для хранения уникальных вопросов и связанных
-embeddings в бинарном виде (pickle).
+embeddings в компактном бинарном виде (см. `app.database.embedding_codec`).
 """
 
 from datetime import datetime
@@ -13,14 +13,18 @@ Base = declarative_base()
 class UniqueQuestion(Base):
     """Сущность уникального вопроса.
 
-    `embedding` хранится как pickle-байты, чтобы избежать отдельной
-    векторной БД на данном этапе.
+    `embedding` хранится как little-endian float32/float16 байты;
+    `embedding_dim` и `embedding_version` описывают, как их декодировать.
+    Строки со старым pickle-форматом имеют `embedding_version` 0 или NULL
+    и конвертируются скриптом `migrate_questions_db.py`.
     """
     __tablename__ = "unique_questions"
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     question = Column(String, nullable=False)
-    embedding = Column(LargeBinary, nullable=False)  # Pickle or binary
-    source = Column(String, nullable=False)  # "telegram" or "jivo"
-    created_at = Column(DateTime, default=datetime.utcnow)
+    embedding = Column(LargeBinary, nullable=False)  # Raw little-endian float32/float16
+    embedding_dim = Column(Integer, nullable=True)
+    embedding_version = Column(Integer, nullable=True)  # См. embedding_codec
+    source = Column(String, nullable=False, index=True)  # "telegram" or "jivo"
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     count = Column(Integer, default=1)
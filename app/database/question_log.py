@@ -0,0 +1,145 @@
+"""Фоновая запись вопросов в аналитику.
+
+Обработчики Telegram и Jivo не ждут записи: `question_log.submit()`
+кладёт вопрос в ограниченную очередь и сразу возвращает управление, а
+фоновый писатель забирает вопросы пачками до `QUESTION_LOG_BATCH_SIZE`
+и передаёт их в `QuestionsDB.add_questions` — поиск повторов и все
+вставки/инкременты пачки выполняются одной транзакцией.
+
+Очередь ограничена `QUESTION_LOG_QUEUE_SIZE`: если БД не успевает,
+новые вопросы отбрасываются (счётчик `dropped`), а ответы пользователям
+не замедляются. При остановке приложения `aclose()` дописывает очередь,
+ожидая не дольше `QUESTION_LOG_SHUTDOWN_TIMEOUT` секунд.
+"""
+
+import asyncio
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import numpy as np
+from loguru import logger
+
+from app.config import settings
+from app.core.metrics import record_question_log
+from app.database.questions_db import QuestionRecord
+from app.database.questions_db import QuestionsDB
+
+
+class QuestionLog:
+    """Ограниченная очередь вопросов с пакетным фоновым писателем."""
+
+    def __init__(
+        self,
+        db: Optional[QuestionsDB] = None,
+        max_size: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+    ):
+        """Создаёт очередь; параметры по умолчанию берутся из настроек.
+
+        Args:
+            db: Хранилище вопросов.
+            max_size: Ёмкость очереди (`QUESTION_LOG_QUEUE_SIZE`).
+            batch_size: Вопросов в одной транзакции (`QUESTION_LOG_BATCH_SIZE`).
+            flush_interval: Сколько секунд копить неполную пачку
+                (`QUESTION_LOG_FLUSH_INTERVAL`).
+        """
+        self.db = db or QuestionsDB()
+        self.max_size = max(1, max_size or settings.QUESTION_LOG_QUEUE_SIZE)
+        self.batch_size = max(1, batch_size or settings.QUESTION_LOG_BATCH_SIZE)
+        self.flush_interval = (
+            settings.QUESTION_LOG_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        )
+        self.queued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self._queue: "asyncio.Queue[QuestionRecord]" = asyncio.Queue(maxsize=self.max_size)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Запускает фоновый писатель, если он ещё не работает."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def submit(self, question: str, source: str, embedding: Optional[np.ndarray] = None) -> bool:
+        """Ставит вопрос в очередь без ожидания.
+
+        Returns:
+            `False`, если очередь заполнена и вопрос отброшен.
+        """
+        self.start()
+        try:
+            self._queue.put_nowait(QuestionRecord(question, source, embedding))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            record_question_log("dropped")
+            if self.dropped == 1 or self.dropped % 100 == 0:
+                logger.warning(
+                    "Question log queue is full, dropped {} questions so far", self.dropped
+                )
+            return False
+        self.queued += 1
+        record_question_log("queued")
+        return True
+
+    async def _next_batch(self) -> List[QuestionRecord]:
+        """Ждёт первый вопрос и добирает пачку за `flush_interval`."""
+        batch = [await self._queue.get()]
+        if self._queue.qsize() < self.batch_size - 1 and self.flush_interval > 0:
+            await asyncio.sleep(self.flush_interval)
+        while len(batch) < self.batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _write(self, batch: List[QuestionRecord]) -> None:
+        """Пишет пачку; при ошибке пачка теряется, но писатель продолжает работу."""
+        try:
+            await self.db.add_questions(batch)
+            self.written += len(batch)
+            record_question_log("written", len(batch))
+        except Exception as e:
+            self.failed += len(batch)
+            record_question_log("failed", len(batch))
+            logger.error(f"Failed to write {len(batch)} questions: {e}")
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            await self._write(batch)
+
+    async def aclose(self, timeout: Optional[float] = None) -> None:
+        """Дописывает очередь и останавливает писатель."""
+        if self._task is None:
+            return
+        timeout = settings.QUESTION_LOG_SHUTDOWN_TIMEOUT if timeout is None else timeout
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                "Question log flush timed out, {} questions not written", self._queue.qsize()
+            )
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> Dict[str, int]:
+        """Счётчики очереди для мониторинга."""
+        return {
+            "queued": self.queued,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed,
+            "pending": self._queue.qsize(),
+        }
+
+
+# Одна очередь на процесс: Telegram и Jivo пишут через общий писатель.
+question_log = QuestionLog()
@@ -2,25 +2,76 @@
 
 Модуль отвечает за сохранение пользовательских вопросов в SQLite через
 SQLAlchemy (async) и использует embeddings для оценки уникальности.
+
+Для поиска похожих вопросов используется общий для процесса in-memory
+индекс (`VectorIndex`): он загружается из SQLite один раз, а затем
+догружает только новые строки по возрастанию `id`. SQLite остаётся
+источником истины — индекс лишь ускоряет поиск повтора.
 """
 
+import asyncio
 import pickle
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Sequence
 
 import numpy as np
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import select
+from sqlalchemy import inspect, or_, select, text, update
 
+from app.core.embeddings import EmbeddingsClient
+from app.core.embeddings import embeddings_client
+from app.core.vector_index import VectorIndex
+from app.database.embedding_codec import EMBEDDING_VERSION_PICKLE
+from app.database.embedding_codec import decode_embedding
+from app.database.embedding_codec import encode_embedding
+from app.database.embedding_codec import version_for_dtype
 from app.database.models import Base, UniqueQuestion
+from app.database.sqlite import create_sqlite_engine
 from app.config import settings
-from openai import OpenAI
 from loguru import logger
 
-DATABASE_URL = "sqlite+aiosqlite:///./data/database.db"
-
-engine = create_async_engine(DATABASE_URL, echo=False)
+# PRAGMA (WAL, synchronous, busy_timeout, mmap) и пул — см. `app.database.sqlite`.
+engine = create_sqlite_engine(settings.DATABASE_PATH)
 async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
+# Индекс общий для всех экземпляров QuestionsDB в процессе (Telegram, Jivo,
+# админка), иначе вставка из одного канала не была бы видна другому.
+_question_index = VectorIndex()
+_question_index_last_id = 0
+_question_index_lock = asyncio.Lock()
+
+# Колонки, добавленные после первого релиза: `create_all` не меняет
+# существующие таблицы, поэтому досоздаём их вручную.
+_ADDED_COLUMNS = {
+    "embedding_dim": "INTEGER",
+    "embedding_version": "INTEGER",
+}
+
+MIGRATION_BATCH_SIZE = 500
+
+
+class QuestionRecord(NamedTuple):
+    """Вопрос для записи в аналитику; `embedding` может быть ещё не посчитан."""
+
+    question: str
+    source: str
+    embedding: Optional[np.ndarray] = None
+
+
+async def ping_database() -> None:
+    """Лёгкий запрос к таблице вопросов для health-проверки.
+
+    Читается именно таблица, а не `SELECT 1`: так проверяется, что файл БД
+    открыт, схема создана и чтение не упирается в блокировку записи.
+    """
+    async with engine.connect() as conn:
+        await conn.execute(select(UniqueQuestion.id).limit(1))
+
+
 class QuestionsDB:
     """Асинхронный слой доступа к БД вопросов.
 
@@ -28,57 +79,231 @@ class QuestionsDB:
     если cosine similarity >= `settings.SIMILARITY_THRESHOLD`,
     то вопрос считается повтором и увеличивается счётчик.
     """
-    def __init__(self):
-        """Инициализирует OpenAI-клиент для вычисления embeddings."""
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+    def __init__(self, embeddings: Optional[EmbeddingsClient] = None):
+        """Сохраняет клиента embeddings (по умолчанию общий для процесса)."""
+        self.embeddings = embeddings or embeddings_client
 
     async def init_db(self):
-        """Создаёт таблицы в БД при первом запуске."""
+        """Создаёт таблицы в БД при первом запуске.
+
+        Оставшиеся pickle-embeddings конвертируются сразу: индекс вопросов
+        их не читает, и без миграции такие вопросы выпали бы из дедупликации.
+        """
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(self._add_missing_columns)
+            await conn.run_sync(self._add_missing_indexes)
+        converted = await self._convert_embeddings(legacy_only=True)
+        if converted:
+            logger.warning("Converted {} legacy pickle question embeddings", converted)
 
-    def _get_embedding(self, text: str) -> np.ndarray:
+    @staticmethod
+    def _add_missing_columns(sync_conn) -> None:
+        """Добавляет в `unique_questions` колонки, которых нет в старых БД."""
+        existing = {
+            column["name"]
+            for column in inspect(sync_conn).get_columns(UniqueQuestion.__tablename__)
+        }
+        for name, sql_type in _ADDED_COLUMNS.items():
+            if name not in existing:
+                sync_conn.execute(text(
+                    f"ALTER TABLE {UniqueQuestion.__tablename__} ADD COLUMN {name} {sql_type}"
+                ))
+                logger.info("Added column unique_questions.{}", name)
+
+    @staticmethod
+    def _add_missing_indexes(sync_conn) -> None:
+        """Создаёт индексы модели, которых нет в старых БД."""
+        for index in UniqueQuestion.__table__.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+    async def _get_embedding(self, text: str) -> np.ndarray:
         """Возвращает embedding в виде numpy-массива."""
-        response = self.client.embeddings.create(
-            input=text,
-            model="text-embedding-3-small"
+        return await self.embeddings.embed(text)
+
+    async def _sync_index(self, session: AsyncSession) -> None:
+        """Догружает в индекс строки, появившиеся после последней синхронизации.
+
+        При первом вызове загружается вся таблица; дальше запрос по
+        первичному ключу `id > last_id` обычно возвращает 0 строк и
+        подхватывает вставки других воркеров.
+        """
+        global _question_index_last_id
+
+        result = await session.execute(
+            select(
+                UniqueQuestion.id,
+                UniqueQuestion.embedding,
+                UniqueQuestion.embedding_dim,
+                UniqueQuestion.embedding_version,
+            )
+            .where(UniqueQuestion.id > _question_index_last_id)
+            .order_by(UniqueQuestion.id)
         )
-        return np.array(response.data[0].embedding)
-
-    def _cosine_similarity(self, v1: np.ndarray, v2: np.ndarray) -> float:
-        """Считает cosine similarity двух векторов."""
-        denom = np.linalg.norm(v1) * np.linalg.norm(v2)
-        if denom == 0:
-            return 0.0
-        return float(np.dot(v1, v2) / denom)
-
-    async def add_question(self, question: str, source: str) -> bool:
-        """Добавление вопроса с проверкой на уникальность."""
-        new_emb = self._get_embedding(question)
-        
-        async with async_session() as session:
-            result = await session.execute(select(UniqueQuestion))
-            questions = result.scalars().all()
-            
-            for q in questions:
-                existing_emb = pickle.loads(q.embedding)
-                similarity = self._cosine_similarity(new_emb, existing_emb)
-                
-                if similarity >= settings.SIMILARITY_THRESHOLD:
-                    # Не уникальный, инкрементируем счетчик
-                    q.count += 1
-                    await session.commit()
-                    return False
-            
-            # Уникальный, сохраняем
-            new_q = UniqueQuestion(
-                question=question,
-                embedding=pickle.dumps(new_emb),
-                source=source
+        rows = result.all()
+        if not rows:
+            return
+
+        keys = []
+        vectors = []
+        for row in rows:
+            if not row.embedding_version:
+                # Pickle не распаковываем на горячем пути: это небезопасно
+                # и медленно. Дальше такой строки не продвигаемся, чтобы
+                # вопрос не выпал из индекса навсегда: его подхватит
+                # следующая синхронизация после миграции.
+                logger.error(
+                    "Question {} has a legacy pickle embedding; "
+                    "run `python migrate_questions_db.py` to convert it",
+                    row.id,
+                )
+                break
+            keys.append(row.id)
+            vectors.append(
+                decode_embedding(row.embedding, row.embedding_version, row.embedding_dim)
             )
-            session.add(new_q)
-            await session.commit()
-            return True
+
+        if not keys:
+            return
+        _question_index.add_many(keys, np.stack(vectors))
+        _question_index_last_id = keys[-1]
+        if len(keys) > 1:
+            logger.info(
+                "Question index synced: +{} rows, total={}", len(keys), len(_question_index)
+            )
+
+    async def add_question(
+        self,
+        question: str,
+        source: str,
+        embedding: Optional[np.ndarray] = None,
+    ) -> bool:
+        """Добавление вопроса с проверкой на уникальность.
+
+        Если `embedding` уже посчитан (см. `PipelineContext`), повторный
+        запрос к API не выполняется.
+        """
+        return await self.add_questions([QuestionRecord(question, source, embedding)]) == 1
+
+    async def add_questions(self, records: Sequence[QuestionRecord]) -> int:
+        """Записывает пачку вопросов одной транзакцией.
+
+        Повторы внутри пачки сравниваются и с индексом, и друг с другом:
+        счётчики совпавших вопросов увеличиваются на число повторов, новые
+        уникальные вставляются вместе.
+
+        Returns:
+            Количество новых уникальных вопросов.
+        """
+        if not records:
+            return 0
+
+        vectors = [record.embedding for record in records]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            fresh = await self.embeddings.embed_many([records[i].question for i in missing])
+            for i, vector in zip(missing, fresh):
+                vectors[i] = vector
+
+        version = version_for_dtype(settings.QUESTION_EMBEDDING_DTYPE)
+        # Поиск и вставка под одной блокировкой, чтобы два одновременных
+        # одинаковых вопроса не сохранились оба как уникальные.
+        async with _question_index_lock:
+            async with async_session() as session:
+                await self._sync_index(session)
+
+                increments: Dict[int, int] = {}
+                new_questions: List[UniqueQuestion] = []
+                batch_index = VectorIndex(initial_capacity=len(records))
+                for record, vector in zip(records, vectors):
+                    match = _question_index.nearest(vector)
+                    if match is not None and match[1] >= settings.SIMILARITY_THRESHOLD:
+                        increments[match[0]] = increments.get(match[0], 0) + 1
+                        continue
+                    match = batch_index.nearest(vector)
+                    if match is not None and match[1] >= settings.SIMILARITY_THRESHOLD:
+                        new_questions[match[0]].count += 1
+                        continue
+
+                    blob, dimension = encode_embedding(vector, version)
+                    batch_index.add(len(new_questions), vector)
+                    new_questions.append(UniqueQuestion(
+                        question=record.question,
+                        embedding=blob,
+                        embedding_dim=dimension,
+                        embedding_version=version,
+                        source=record.source,
+                        count=1,
+                    ))
+
+                for question_id, repeats in increments.items():
+                    await session.execute(
+                        update(UniqueQuestion)
+                        .where(UniqueQuestion.id == question_id)
+                        .values(count=UniqueQuestion.count + repeats)
+                    )
+                session.add_all(new_questions)
+                await session.commit()
+                # В индекс строки попадут при следующей синхронизации: так
+                # не теряются вставки других воркеров с меньшим `id`.
+                return len(new_questions)
+
+    async def migrate_embeddings(self) -> int:
+        """Конвертирует сохранённые embeddings в формат из настроек.
+
+        Обрабатывает pickle-строки и строки в другом бинарном формате
+        (например, float32 -> float16) пачками по `MIGRATION_BATCH_SIZE`,
+        каждая пачка — одна транзакция.
+
+        Returns:
+            Количество сконвертированных строк.
+        """
+        await self.init_db()
+        return await self._convert_embeddings(legacy_only=False)
+
+    async def _convert_embeddings(self, legacy_only: bool) -> int:
+        """Конвертирует embeddings пачками; `legacy_only` — только pickle-строки."""
+        target_version = version_for_dtype(settings.QUESTION_EMBEDDING_DTYPE)
+        converted = 0
+        last_id = 0
+        legacy = or_(
+            UniqueQuestion.embedding_version.is_(None),
+            UniqueQuestion.embedding_version == EMBEDDING_VERSION_PICKLE,
+        )
+        pending = legacy if legacy_only else or_(
+            UniqueQuestion.embedding_version.is_(None),
+            UniqueQuestion.embedding_version != target_version,
+        )
+
+        while True:
+            async with async_session() as session:
+                result = await session.execute(
+                    select(UniqueQuestion)
+                    .where(UniqueQuestion.id > last_id)
+                    .where(pending)
+                    .order_by(UniqueQuestion.id)
+                    .limit(MIGRATION_BATCH_SIZE)
+                )
+                questions = result.scalars().all()
+                if not questions:
+                    break
+
+                for q in questions:
+                    if not q.embedding_version:
+                        # Единственное место, где допустим pickle: данные
+                        # записаны этим же приложением до смены формата.
+                        vector = np.asarray(pickle.loads(q.embedding), dtype=np.float32)
+                    else:
+                        vector = decode_embedding(q.embedding, q.embedding_version, q.embedding_dim)
+                    q.embedding, q.embedding_dim = encode_embedding(vector, target_version)
+                    q.embedding_version = target_version
+
+                await session.commit()
+                converted += len(questions)
+                last_id = questions[-1].id
+                logger.info("Converted {} question embeddings", converted)
+
+        return converted
 
     async def get_all_questions(self):
         """Возвращает все уникальные вопросы, отсортированные по времени."""
@@ -0,0 +1,63 @@
+"""Настройка async-движка SQLite для БД вопросов.
+
+Параметры соединения задаются в настройках и применяются PRAGMA при
+открытии каждого соединения пула:
+- `SQLITE_JOURNAL_MODE` — `wal` по умолчанию: читатели не блокируются
+  писателем, а фиксация транзакции — дозапись в журнал вместо
+  перезаписи страниц и удаления rollback-журнала;
+- `SQLITE_SYNCHRONOUS` — `normal`: в режиме WAL база остаётся
+  целостной при сбое питания, теряются лишь последние транзакции;
+- `SQLITE_BUSY_TIMEOUT` — сколько миллисекунд ждать блокировку записи,
+  прежде чем вернуть `database is locked`;
+- `SQLITE_MMAP_SIZE` — байт файла, читаемых через mmap (0 — выключено).
+
+По умолчанию SQLAlchemy открывает для aiosqlite новое соединение (и поток)
+на каждую сессию; `SQLITE_POOL_SIZE` > 0 включает пул соединений.
+"""
+
+from typing import Dict
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.pool import NullPool
+
+from app.config import settings
+
+
+def sqlite_pragmas() -> Dict[str, object]:
+    """PRAGMA, применяемые к каждому новому соединению."""
+    return {
+        "journal_mode": settings.SQLITE_JOURNAL_MODE,
+        "synchronous": settings.SQLITE_SYNCHRONOUS,
+        "busy_timeout": settings.SQLITE_BUSY_TIMEOUT,
+        "mmap_size": settings.SQLITE_MMAP_SIZE,
+    }
+
+
+def create_sqlite_engine(database_path: str) -> AsyncEngine:
+    """Создаёт async-движок для файла SQLite с PRAGMA и пулом из настроек."""
+    if settings.SQLITE_POOL_SIZE > 0:
+        pool_options = {
+            "poolclass": AsyncAdaptedQueuePool,
+            "pool_size": settings.SQLITE_POOL_SIZE,
+            "max_overflow": settings.SQLITE_MAX_OVERFLOW,
+        }
+    else:
+        pool_options = {"poolclass": NullPool}
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{database_path}",
+        echo=False,
+        **pool_options,
+    )
+    pragmas = sqlite_pragmas()
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _apply_pragmas(dbapi_connection, _connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return engine
@@ -5,6 +5,7 @@
 - rate limiting;
 - фильтрация спама;
 - запись вопросов для аналитики;
+- кэш ответов на повторяющиеся первые вопросы;
 - RAG-подбор контекста из Markdown базы знаний;
 - генерация ответа через LLM.
 """
@@ -12,22 +13,35 @@
 import httpx
 from fastapi import APIRouter, Request
 from app.config import settings
-from app.core.rag_engine import RAGEngine
-from app.core.ai_client import AIClient
-from app.core.context_manager import ContextManager
-from app.core.spam_filter import RateLimiter, SpamFilter
-from app.database.questions_db import QuestionsDB
+from app.core.rag_engine import get_rag_engine
+from app.core.ai_client import AIClient, FALLBACK_RESPONSE, is_cacheable_answer
+from app.core.answer_cache import answer_cache
+from app.core.context_manager import context_manager
+from app.core.metrics import record_provider_error
+from app.core.pipeline import (
+    OUTCOME_ANSWERED,
+    OUTCOME_CACHE_HIT,
+    OUTCOME_RATE_LIMITED,
+    OUTCOME_SPAM,
+    STAGE_CONTEXT,
+    STAGE_DEDUP,
+    STAGE_EMBEDDING,
+    STAGE_LLM,
+    STAGE_RAG,
+    STAGE_RATE_LIMIT,
+    STAGE_SEND,
+    STAGE_SPAM,
+    PipelineContext,
+)
+from app.core.spam_filter import rate_limiter, spam_filter
+from app.database.question_log import question_log
 from loguru import logger
 
 router = APIRouter()
 
 # Инициализация (в идеале через DI)
-rag = RAGEngine(settings.KNOWLEDGE_BASE_PATH, settings.FAISS_INDEX_PATH)
+rag = get_rag_engine()
 ai = AIClient()
-context_manager = ContextManager(max_context=settings.MAX_CONTEXT_MESSAGES)
-rate_limiter = RateLimiter(max_requests=settings.RATE_LIMIT_REQUESTS)
-spam_filter = SpamFilter()
-db = QuestionsDB()
 
 @router.post("/api/jivo/webhook")
 async def jivo_webhook(request: Request):
@@ -53,36 +67,72 @@ async def jivo_webhook(request: Request):
         return {"status": "ok"}
 
     # Логика аналогична Telegram
-    if not await rate_limiter.check_limit(client_id):
-        await send_jivo_message(message_data.get('client_id'), "Превышен лимит запросов.")
+    pipeline = PipelineContext(user_id=client_id, channel="jivo", text=text)
+
+    with pipeline.stage(STAGE_RATE_LIMIT):
+        allowed = await rate_limiter.acquire(client_id)
+    if not allowed:
+        with pipeline.stage(STAGE_SEND):
+            await send_jivo_message(message_data.get('client_id'), "Превышен лимит запросов.")
+        pipeline.finish(OUTCOME_RATE_LIMITED)
         return {"status": "ok"}
-    await rate_limiter.increment(client_id)
 
-    if await spam_filter.is_spam(client_id, text):
+    with pipeline.stage(STAGE_SPAM):
+        is_spam = await spam_filter.is_spam(client_id, text)
+    if is_spam:
+        pipeline.finish(OUTCOME_SPAM)
         return {"status": "ok"}
 
-    await db.add_question(text, "jivo")
-
-    history = await context_manager.get_context(client_id)
-    rag_context = await rag.get_context_for_query(text)
-    
-    response_text = await ai.generate_response(
-        user_question=text,
-        rag_context=rag_context,
-        conversation_history=history,
-        system_prompt=settings.SYSTEM_PROMPT
-    )
-
-    await context_manager.add_message(client_id, "user", text)
-    await context_manager.add_message(client_id, "assistant", response_text)
-
-    await send_jivo_message(message_data.get('client_id'), response_text)
+    with pipeline.stage(STAGE_CONTEXT):
+        history = await context_manager.get_context(client_id)
+
+    use_answer_cache = settings.ANSWER_CACHE_ENABLED and not history
+    pipeline.answer_cache_checked = use_answer_cache
+    response_text = None
+    if use_answer_cache:
+        # Кэш ответов семантический: без embedding его не проверить.
+        with pipeline.stage(STAGE_EMBEDDING):
+            query_embedding = await pipeline.get_embedding()
+        response_text = answer_cache.get(query_embedding, rag.index_version)
+    cache_hit = response_text is not None
+
+    if not cache_hit:
+        with pipeline.stage(STAGE_RAG):
+            # Embedding запрашивается, только если не сработал лексический fast path.
+            rag_context = await rag.get_context_for_query(text, embed=pipeline.get_embedding)
+
+        with pipeline.stage(STAGE_LLM):
+            response_text = await ai.generate_response(
+                user_question=text,
+                rag_context=rag_context,
+                conversation_history=history,
+                system_prompt=settings.SYSTEM_PROMPT
+            )
+
+    with pipeline.stage(STAGE_DEDUP):
+        # Аналитика пишется в фоне; если embedding не понадобился, его
+        # посчитает писатель пачкой, вне ответа пользователю.
+        question_log.submit(text, "jivo", embedding=pipeline.embedding)
+
+    # Пустой или ошибочный ответ не кэшируется и не попадает в историю.
+    if is_cacheable_answer(response_text):
+        if use_answer_cache and not cache_hit:
+            answer_cache.put(query_embedding, response_text, rag.index_version)
+        with pipeline.stage(STAGE_CONTEXT):
+            await context_manager.add_message(client_id, "user", text)
+            await context_manager.add_message(client_id, "assistant", response_text)
+    elif not response_text.strip():
+        response_text = FALLBACK_RESPONSE
+
+    with pipeline.stage(STAGE_SEND):
+        await send_jivo_message(message_data.get('client_id'), response_text)
+    pipeline.finish(OUTCOME_CACHE_HIT if cache_hit else OUTCOME_ANSWERED)
     
     return {"status": "ok"}
 
 async def send_jivo_message(client_id: str, text: str):
     """Отправляет сообщение в чат Jivo по `client_id`."""
-    url = "https://api.jivo.ru/bot/v1/message"
+    url = settings.JIVO_API_URL
     headers = {
         "Authorization": f"Bearer {settings.JIVO_BOT_TOKEN}",
         "Content-Type": "application/json"
@@ -96,6 +146,9 @@ async def send_jivo_message(client_id: str, text: str):
     }
     async with httpx.AsyncClient() as client:
         try:
-            await client.post(url, headers=headers, json=body)
+            response = await client.post(url, headers=headers, json=body)
+            # 4xx/5xx от Jivo — тоже неотправленный ответ.
+            response.raise_for_status()
         except Exception as e:
+            record_provider_error("jivo", "send")
             logger.error(f"Error sending message to Jivo: {e}")
@@ -2,11 +2,21 @@
 
 import asyncio
 import time
+from typing import AsyncIterator
+from typing import Awaitable
+from typing import Callable
+from typing import NamedTuple
+from typing import Optional
+from typing import TypeVar
 
 from aiogram import Bot
 from aiogram import Dispatcher
 from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import PRODUCTION
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.exceptions import TelegramNetworkError
+from aiogram.exceptions import TelegramRetryAfter
 from aiogram.filters import Command
 from aiogram.filters import CommandStart
 from aiogram.types import BotCommand
@@ -15,40 +25,74 @@ from loguru import logger
 
 from app.config import settings
 from app.core.ai_client import AIClient
-from app.core.context_manager import ContextManager
-from app.core.rag_engine import RAGEngine
-from app.core.spam_filter import RateLimiter
-from app.core.spam_filter import SpamFilter
-from app.database.questions_db import QuestionsDB
+from app.core.ai_client import FALLBACK_RESPONSE
+from app.core.ai_client import is_cacheable_answer
+from app.core.answer_cache import answer_cache
+from app.core.context_manager import context_manager
+from app.core.health import COMPONENT_TELEGRAM_BOT
+from app.core.health import mark_ready
+from app.core.metrics import record_provider_error
+from app.core.pipeline import OUTCOME_ANSWERED
+from app.core.pipeline import OUTCOME_CACHE_HIT
+from app.core.pipeline import OUTCOME_RATE_LIMITED
+from app.core.pipeline import OUTCOME_SPAM
+from app.core.pipeline import STAGE_CONTEXT
+from app.core.pipeline import STAGE_DEDUP
+from app.core.pipeline import STAGE_EMBEDDING
+from app.core.pipeline import STAGE_LLM
+from app.core.pipeline import STAGE_RAG
+from app.core.pipeline import STAGE_RATE_LIMIT
+from app.core.pipeline import STAGE_SEND
+from app.core.pipeline import STAGE_SPAM
+from app.core.pipeline import PipelineContext
+from app.core.rag_engine import get_rag_engine
+from app.core.spam_filter import rate_limiter
+from app.core.spam_filter import spam_filter
+from app.database.question_log import question_log
 
 TELEGRAM_REQUEST_TIMEOUT = 60
 SEND_MAX_RETRIES = 3
 SEND_RETRY_DELAYS = (1, 2, 4)
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+T = TypeVar("T")
 
 bot = Bot(
     token=settings.TELEGRAM_BOT_TOKEN,
-    session=AiohttpSession(timeout=TELEGRAM_REQUEST_TIMEOUT),
+    session=AiohttpSession(
+        api=(
+            TelegramAPIServer.from_base(settings.TELEGRAM_API_URL)
+            if settings.TELEGRAM_API_URL
+            else PRODUCTION
+        ),
+        timeout=TELEGRAM_REQUEST_TIMEOUT,
+    ),
 )
 dp = Dispatcher()
 
-rag = RAGEngine(settings.KNOWLEDGE_BASE_PATH, settings.FAISS_INDEX_PATH)
+rag = get_rag_engine()
 ai = AIClient()
-context_manager = ContextManager(max_context=settings.MAX_CONTEXT_MESSAGES)
-rate_limiter = RateLimiter(max_requests=settings.RATE_LIMIT_REQUESTS)
-spam_filter = SpamFilter()
-db = QuestionsDB()
 
 
-async def safe_answer(message: Message, text: str) -> bool:
-    """Send Telegram message with retries for transient network errors."""
+class StreamResult(NamedTuple):
+    """Итог потоковой отправки ответа в Telegram."""
+
+    text: str
+    sent: bool
+    first_token_ms: float
+    send_ms: float
+
+
+async def _send_with_retries(send: Callable[[], Awaitable[T]]) -> Optional[T]:
+    """Run a Telegram API call with retries for transient network errors."""
     for attempt in range(1, SEND_MAX_RETRIES + 1):
         try:
-            await message.answer(text, request_timeout=TELEGRAM_REQUEST_TIMEOUT)
-            return True
+            return await send()
         except TelegramNetworkError as exc:
+            record_provider_error("telegram", "send")
             if attempt >= SEND_MAX_RETRIES:
                 logger.error("Telegram send failed after {} attempts: {}", attempt, exc)
-                return False
+                return None
             delay = SEND_RETRY_DELAYS[min(attempt - 1, len(SEND_RETRY_DELAYS) - 1)]
             logger.warning(
                 "Telegram send failed (attempt {}/{}), retry in {}s: {}",
@@ -58,7 +102,89 @@ async def safe_answer(message: Message, text: str) -> bool:
                 exc,
             )
             await asyncio.sleep(delay)
-    return False
+    return None
+
+
+async def safe_answer(message: Message, text: str) -> bool:
+    """Send Telegram message with retries for transient network errors."""
+    result = await _send_with_retries(
+        lambda: message.answer(text, request_timeout=TELEGRAM_REQUEST_TIMEOUT)
+    )
+    return result is not None
+
+
+async def _safe_edit(sent_message: Message, text: str, final: bool) -> bool:
+    """Edit a streamed message; intermediate edits are skipped on flood control."""
+    try:
+        result = await _send_with_retries(lambda: sent_message.edit_text(text))
+        return result is not None
+    except TelegramRetryAfter as exc:
+        if not final:
+            return True
+        # Финальную правку нельзя пропустить, иначе ответ останется обрезанным.
+        await asyncio.sleep(exc.retry_after)
+        result = await _send_with_retries(lambda: sent_message.edit_text(text))
+        return result is not None
+    except TelegramBadRequest as exc:
+        # "message is not modified" и подобное не мешают доставке ответа.
+        logger.debug("Telegram edit skipped: {}", exc)
+        return True
+
+
+async def stream_answer(message: Message, deltas: AsyncIterator[str]) -> StreamResult:
+    """Send an LLM answer while it is generated, editing the message in place.
+
+    The first fragment is sent immediately, later edits are throttled to
+    `TELEGRAM_STREAM_EDIT_INTERVAL` seconds to stay within Telegram limits.
+    Text longer than `TELEGRAM_MESSAGE_LIMIT` continues in a new message.
+    """
+    started_at = time.monotonic()
+    text = ""
+    first_token_ms = 0.0
+    send_seconds = 0.0
+    segment_start = 0
+    current: Optional[Message] = None
+    shown = ""
+    last_flush_at = 0.0
+    delivered = True
+
+    async def flush(final: bool) -> None:
+        nonlocal segment_start, current, shown, last_flush_at, send_seconds, delivered
+        while delivered:
+            segment = text[segment_start:]
+            visible = segment[:TELEGRAM_MESSAGE_LIMIT]
+            if visible.strip() and visible != shown:
+                flush_started_at = time.monotonic()
+                if current is None:
+                    current = await _send_with_retries(lambda: message.answer(visible))
+                    delivered = current is not None
+                else:
+                    is_last_edit = final or len(segment) > TELEGRAM_MESSAGE_LIMIT
+                    delivered = await _safe_edit(current, visible, final=is_last_edit)
+                send_seconds += time.monotonic() - flush_started_at
+                shown = visible
+            last_flush_at = time.monotonic()
+            if len(segment) <= TELEGRAM_MESSAGE_LIMIT:
+                return
+            segment_start += TELEGRAM_MESSAGE_LIMIT
+            current = None
+            shown = ""
+
+    async for delta in deltas:
+        if not text:
+            first_token_ms = (time.monotonic() - started_at) * 1000
+        text += delta
+        since_flush = time.monotonic() - last_flush_at
+        if current is None or since_flush >= settings.TELEGRAM_STREAM_EDIT_INTERVAL:
+            await flush(final=False)
+
+    await flush(final=True)
+    return StreamResult(
+        text=text,
+        sent=delivered and bool(text.strip()),
+        first_token_ms=first_token_ms,
+        send_ms=send_seconds * 1000,
+    )
 
 
 @dp.message(CommandStart())
@@ -90,54 +216,111 @@ async def handle_message(message: Message):
     if not text:
         return
 
-    started_at = time.monotonic()
+    pipeline = PipelineContext(user_id=user_id, channel="telegram", text=text)
 
-    if not await rate_limiter.check_limit(user_id):
-        await safe_answer(message, "Превышен лимит запросов. Попробуйте позже.")
+    with pipeline.stage(STAGE_RATE_LIMIT):
+        allowed = await rate_limiter.acquire(user_id)
+    if not allowed:
+        with pipeline.stage(STAGE_SEND):
+            await safe_answer(message, "Превышен лимит запросов. Попробуйте позже.")
+        pipeline.finish(OUTCOME_RATE_LIMITED)
         return
-    await rate_limiter.increment(user_id)
 
-    if await spam_filter.is_spam(user_id, text):
+    with pipeline.stage(STAGE_SPAM):
+        is_spam = await spam_filter.is_spam(user_id, text)
+    if is_spam:
+        pipeline.finish(OUTCOME_SPAM)
         return
 
-    await db.add_question(text, "telegram")
+    with pipeline.stage(STAGE_CONTEXT):
+        history = await context_manager.get_context(user_id)
 
-    rag_started_at = time.monotonic()
-    history = await context_manager.get_context(user_id)
-    rag_context = await rag.get_context_for_query(text)
-    rag_ms = (time.monotonic() - rag_started_at) * 1000
+    # Кэш ответов только для первой реплики: с историей смысл вопроса другой.
+    use_answer_cache = settings.ANSWER_CACHE_ENABLED and not history
+    pipeline.answer_cache_checked = use_answer_cache
+    response_text = None
+    if use_answer_cache:
+        # Кэш ответов семантический: без embedding его не проверить.
+        with pipeline.stage(STAGE_EMBEDDING):
+            query_embedding = await pipeline.get_embedding()
+        response_text = answer_cache.get(query_embedding, rag.index_version)
+    cache_hit = response_text is not None
 
-    llm_started_at = time.monotonic()
-    response_text = await ai.generate_response(
-        user_question=text,
-        rag_context=rag_context,
-        conversation_history=history,
-        system_prompt=settings.SYSTEM_PROMPT,
-    )
-    llm_ms = (time.monotonic() - llm_started_at) * 1000
+    first_token_ms = 0.0
+    sent = None
+    if not cache_hit:
+        with pipeline.stage(STAGE_RAG):
+            # Embedding запрашивается, только если не сработал лексический fast path.
+            rag_context = await rag.get_context_for_query(text, embed=pipeline.get_embedding)
+
+        if settings.TELEGRAM_STREAMING:
+            # Генерация и отправка идут одновременно: время правок сообщения
+            # учитывается в этапе send и вычитается из llm.
+            llm_started_at = time.monotonic()
+            streamed = await stream_answer(
+                message,
+                ai.stream_response(
+                    user_question=text,
+                    rag_context=rag_context,
+                    conversation_history=history,
+                    system_prompt=settings.SYSTEM_PROMPT,
+                ),
+            )
+            stream_ms = (time.monotonic() - llm_started_at) * 1000
+            response_text = streamed.text
+            sent = streamed.sent
+            first_token_ms = streamed.first_token_ms
+            pipeline.record_stage(STAGE_LLM, stream_ms - streamed.send_ms)
+            pipeline.record_stage(STAGE_SEND, streamed.send_ms)
+        else:
+            with pipeline.stage(STAGE_LLM):
+                response_text = await ai.generate_response(
+                    user_question=text,
+                    rag_context=rag_context,
+                    conversation_history=history,
+                    system_prompt=settings.SYSTEM_PROMPT,
+                )
+
+    with pipeline.stage(STAGE_DEDUP):
+        # Аналитика пишется в фоне; если embedding не понадобился, его
+        # посчитает писатель пачкой, вне ответа пользователю.
+        question_log.submit(text, "telegram", embedding=pipeline.embedding)
 
-    await context_manager.add_message(user_id, "user", text)
-    await context_manager.add_message(user_id, "assistant", response_text)
+    # Пустой или оборванный ответ (поток прервался и дописан FALLBACK_RESPONSE)
+    # не кэшируется и не попадает в историю как реплика ассистента.
+    if is_cacheable_answer(response_text):
+        if use_answer_cache and not cache_hit:
+            answer_cache.put(query_embedding, response_text, rag.index_version)
+        with pipeline.stage(STAGE_CONTEXT):
+            await context_manager.add_message(user_id, "user", text)
+            await context_manager.add_message(user_id, "assistant", response_text)
+    elif not response_text.strip():
+        response_text = FALLBACK_RESPONSE
 
-    send_started_at = time.monotonic()
-    sent = await safe_answer(message, response_text)
-    send_ms = (time.monotonic() - send_started_at) * 1000
-    total_ms = (time.monotonic() - started_at) * 1000
+    # Пустой поток ничего не отправил (sent=False): отвечаем заглушкой.
+    if not sent:
+        with pipeline.stage(STAGE_SEND):
+            sent = await safe_answer(message, response_text)
+    pipeline.finish(OUTCOME_CACHE_HIT if cache_hit else OUTCOME_ANSWERED)
 
     logger.info(
-        "Telegram pipeline user={} sent={} rag_ms={:.0f} llm_ms={:.0f} send_ms={:.0f} total_ms={:.0f}",
+        "Telegram pipeline user={} sent={} cache_hit={} rag_ms={:.0f} llm_ms={:.0f} "
+        "first_token_ms={:.0f} send_ms={:.0f} total_ms={:.0f}",
         user_id,
         sent,
-        rag_ms,
-        llm_ms,
-        send_ms,
-        total_ms,
+        cache_hit,
+        pipeline.timings.get(STAGE_RAG, 0.0),
+        pipeline.timings.get(STAGE_LLM, 0.0),
+        first_token_ms,
+        pipeline.timings.get(STAGE_SEND, 0.0),
+        pipeline.total_ms,
     )
 
 
 async def start_bot():
     if settings.TELEGRAM_USE_WEBHOOK:
         logger.info("Telegram bot starting in Webhook mode")
+        mark_ready(COMPONENT_TELEGRAM_BOT)
     else:
         logger.info("Telegram bot starting in Polling mode")
         await bot.set_my_commands(
@@ -147,4 +330,6 @@ async def start_bot():
             ]
         )
         await bot.delete_webhook(drop_pending_updates=True)
+        # Токен и сеть проверены вызовами выше; дальше polling не возвращает управление.
+        mark_ready(COMPONENT_TELEGRAM_BOT)
         await dp.start_polling(bot)
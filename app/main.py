@@ -3,17 +3,31 @@
 Задачи модуля:
 - инициализация FastAPI и подключение роутеров;
 - запуск фоновых компонентов (например, Telegram-бота);
-- health endpoint для инфраструктуры/мониторинга.
+- health/readiness endpoints и метрики Prometheus для инфраструктуры/мониторинга.
 """
 
 import asyncio
 
 from fastapi import FastAPI
 from fastapi import Request
+from fastapi import Response
+from fastapi.responses import JSONResponse
 from loguru import logger
+from prometheus_client import CONTENT_TYPE_LATEST
 
 from app.admin.routes import router as admin_router
 from app.config import settings
+from app.core.context_manager import context_manager
+from app.core.embeddings import embeddings_client
+from app.core.health import COMPONENT_DATABASE
+from app.core.health import HEALTH_UNHEALTHY
+from app.core.health import get_health
+from app.core.health import get_readiness
+from app.core.health import mark_ready
+from app.core.metrics import render_metrics
+from app.core.metrics import setup_metrics
+from app.core.spam_filter import limits_backend
+from app.database.question_log import question_log
 from app.database.questions_db import QuestionsDB
 from app.integrations.jivo_webhook import router as jivo_router
 from app.integrations.telegram_bot import start_bot
@@ -29,6 +43,9 @@ app = FastAPI(
 app.include_router(admin_router)
 app.include_router(jivo_router)
 
+# Наблюдатель pipeline нужен до первого сообщения, поэтому не ждём startup.
+setup_metrics()
+
 @app.on_event("startup")
 async def startup_event():
     """Инициализация сервисов при старте приложения."""
@@ -37,24 +54,44 @@ async def startup_event():
     # База для аналитики уникальных вопросов.
     db = QuestionsDB()
     await db.init_db()
+    mark_ready(COMPONENT_DATABASE)
+    question_log.start()
+    context_manager.start()
     
     # Telegram-бот запускаем отдельной задачей, чтобы не блокировать API.
     asyncio.create_task(start_bot())
     
     logger.info("Application started successfully")
 
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Освобождение ресурсов при остановке приложения."""
+    # Дописываем вопросы до закрытия клиента embeddings: он может понадобиться.
+    await question_log.aclose()
+    await limits_backend.aclose()
+    await context_manager.aclose()
+    await embeddings_client.aclose()
+
 @app.get("/health")
 async def health_check():
-    """Простой health endpoint для инфраструктуры."""
-    return {
-        "status": "healthy",
-        "version": "1.0.0",
-        "checks": {
-            "llm_api": "ok",
-            "database": "ok",
-            "faiss_index": "ok"
-        }
-    }
+    """Health endpoint для инфраструктуры: 503, если индекс или БД неисправны."""
+    health = await get_health()
+    status_code = 503 if health["status"] == HEALTH_UNHEALTHY else 200
+    return JSONResponse({"version": "1.0.0", **health}, status_code=status_code)
+
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness endpoint: 503, пока не прогреты все компоненты."""
+    readiness = get_readiness()
+    return JSONResponse(readiness, status_code=200 if readiness["ready"] else 503)
+
+
+@app.get("/metrics")
+async def metrics():
+    """Метрики pipeline в формате Prometheus."""
+    return Response(render_metrics(), headers={"Content-Type": CONTENT_TYPE_LATEST})
 
 @app.post("/api/telegram/webhook")
 async def telegram_webhook(request: Request):
@@ -0,0 +1,162 @@
+"""Бенчмарк хранилищ диалогового контекста.
+
+Для каждого хранилища (`memory`, `sqlite`, `redis`) имитируется работа
+обработчиков: `--users` пользователей делают по `--rounds` обращений
+(`get_context`, затем два `add_message`). Затем создаётся новый
+`ContextManager` поверх того же хранилища — как после рестарта или в
+другом воркере — и читает историю всех пользователей.
+
+Отчёт:
+- `hot` — `get_context` из памяти (копия свежая), p50/p99 в мкс;
+- `add` — `add_message`: только память, запись в хранилище идёт фоном;
+- `cold` — `get_context` нового менеджера, чтение из хранилища;
+- `flush` — время финального сброса при `aclose`;
+- `restored` — у скольких пользователей история пережила «рестарт».
+
+Без `--redis-url` Redis-хранилище проверяется на заглушке из тестов
+(`tests.resp_stand_in`): минимальном RESP-сервере в том же процессе.
+
+Запуск из корня проекта:
+    python -m benchmarks.context_store
+    python -m benchmarks.context_store --users 5000 --redis-url redis://localhost:6379/15
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import numpy as np
+
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:offline-benchmark")
+
+from app.core.context_backends import ContextBackend  # noqa: E402
+from app.core.context_backends import RedisContextBackend  # noqa: E402
+from app.core.context_backends import SQLiteContextBackend  # noqa: E402
+from app.core.context_manager import ContextManager  # noqa: E402
+from tests.resp_stand_in import RespStandIn  # noqa: E402
+
+TTL = 3600
+MAX_CONTEXT = 5
+
+
+def _micros(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) * 1e6 if values else 0.0
+
+
+async def run(name: str, backend_factory, args: argparse.Namespace) -> Dict:
+    users = [f"jivo_{user_id}" for user_id in range(args.users)]
+    manager = ContextManager(
+        max_context=MAX_CONTEXT,
+        ttl=TTL,
+        max_users=args.users,
+        backend=backend_factory(),
+        cache_ttl=TTL,
+    )
+    hot: List[float] = []
+    add: List[float] = []
+    for round_id in range(args.rounds):
+        for user_id in users:
+            started_at = time.perf_counter()
+            await manager.get_context(user_id)
+            if round_id:
+                hot.append(time.perf_counter() - started_at)
+            started_at = time.perf_counter()
+            await manager.add_message(user_id, "user", f"Вопрос {round_id} о курсе")
+            await manager.add_message(user_id, "assistant", f"Ответ {round_id}: " + "текст " * 40)
+            add.append((time.perf_counter() - started_at) / 2)
+        # Даём фоновому сбросу поработать между «волнами» сообщений.
+        await asyncio.sleep(0)
+
+    started_at = time.perf_counter()
+    await manager.aclose()
+    flush_s = time.perf_counter() - started_at
+
+    restarted = ContextManager(
+        max_context=MAX_CONTEXT, ttl=TTL, max_users=args.users, backend=backend_factory()
+    )
+    cold: List[float] = []
+    restored = 0
+    for user_id in users:
+        started_at = time.perf_counter()
+        history = await restarted.get_context(user_id)
+        cold.append(time.perf_counter() - started_at)
+        restored += len(history) == min(MAX_CONTEXT, 2 * args.rounds)
+    await restarted.aclose()
+
+    return {
+        "backend": name,
+        "hot_p50_us": _micros(hot, 50),
+        "hot_p99_us": _micros(hot, 99),
+        "add_p50_us": _micros(add, 50),
+        "cold_p50_us": _micros(cold, 50),
+        "cold_p99_us": _micros(cold, 99),
+        "flush_ms": flush_s * 1000,
+        "restored": restored,
+    }
+
+
+def _print_report(rows: List[Dict], args: argparse.Namespace) -> None:
+    print(f"users={args.users} rounds={args.rounds} (мкс, кроме flush)")
+    header = (
+        f"{'backend':<10}{'hot p50':>9}{'hot p99':>9}{'add p50':>9}"
+        f"{'cold p50':>10}{'cold p99':>10}{'flush ms':>10}{'restored':>10}"
+    )
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(
+            f"{row['backend']:<10}{row['hot_p50_us']:>9.1f}{row['hot_p99_us']:>9.1f}"
+            f"{row['add_p50_us']:>9.1f}{row['cold_p50_us']:>10.1f}{row['cold_p99_us']:>10.1f}"
+            f"{row['flush_ms']:>10.1f}{row['restored']:>6}/{args.users}"
+        )
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк хранилищ диалогового контекста")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=3, help="Обращений каждого пользователя")
+    parser.add_argument(
+        "--redis-url",
+        help="Настоящий Redis вместо встроенной заглушки (ключи с префиксом bench:)",
+    )
+    args = parser.parse_args()
+
+    stand_in = None
+    redis_url = args.redis_url
+    if redis_url is None:
+        stand_in = RespStandIn()
+        redis_url = await stand_in.start()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as workdir:
+        backends = {
+            "memory": lambda: None,
+            "sqlite": lambda: SQLiteContextBackend(
+                os.path.join(workdir, "context.db"), ttl=TTL, max_messages=MAX_CONTEXT
+            ),
+            "redis": lambda: RedisContextBackend(
+                redis_url, ttl=TTL, max_messages=MAX_CONTEXT, prefix="bench:"
+            ),
+        }
+        for name, factory in backends.items():
+            backend: Optional[ContextBackend] = factory()
+            if backend is not None:
+                await backend.delete([f"jivo_{user_id}" for user_id in range(args.users)])
+                await backend.aclose()
+            rows.append(await run(name, factory, args))
+
+    if stand_in is not None:
+        await stand_in.stop()
+    _print_report(rows, args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,54 @@
+"""Детерминированный локальный эмбеддер для бенчмарков.
+
+Не зависит от `app`, поэтому его можно использовать и в заглушке
+embeddings API нагрузочного теста, которая стартует до загрузки настроек.
+"""
+
+import hashlib
+import re
+from typing import List
+
+import numpy as np
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def hashing_vector(text: str, dimension: int = 256) -> np.ndarray:
+    """Вектор текста — сумма знаковых хешей символьных триграмм слов.
+
+    Близкие по словам тексты получают близкие векторы (hashing trick),
+    а одинаковые тексты — одинаковые векторы в любом процессе. Вектор
+    L2-нормализован, как у embeddings API: иначе L2-поиск ранжировал бы
+    чанки по длине текста, а не по сходству. Текст без слов (например,
+    разделитель `---`) получает единичный вектор по хешу самого текста,
+    а не нулевой, который для L2 оказался бы ближе большинства чанков.
+    """
+    vector = np.zeros(dimension, dtype=np.float32)
+    for word in _WORD_RE.findall(text.lower().replace("ё", "е")):
+        padded = f"#{word}#"
+        for i in range(max(1, len(padded) - 2)):
+            digest = hashlib.blake2b(padded[i:i + 3].encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % dimension] += 1.0 if value >> 63 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+        vector[int.from_bytes(digest, "little") % dimension] = 1.0
+        return vector
+    return vector / norm
+
+
+class HashingEmbeddings:
+    """Локальная замена `EmbeddingsClient` на основе `hashing_vector`."""
+
+    def __init__(self, dimension: int = 256):
+        self.dimension = dimension
+
+    async def embed(self, text: str) -> np.ndarray:
+        return hashing_vector(text, self.dimension)
+
+    async def embed_many(self, texts: List[str], on_progress=None, **kwargs) -> np.ndarray:
+        vectors = np.stack([hashing_vector(text, self.dimension) for text in texts])
+        if on_progress is not None:
+            on_progress(len(texts), len(texts))
+        return vectors
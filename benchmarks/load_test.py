@@ -0,0 +1,539 @@
+"""Нагрузочный тест pipeline Telegram и Jivo с локальными заглушками API.
+
+Прогоняет тысячи синтетических пользователей через настоящие обработчики
+`handle_message` (через `Dispatcher.feed_update`) и `jivo_webhook` (через
+ASGI), а внешние сервисы заменяет локальным HTTP-сервером:
+- OpenAI: `/v1/embeddings` (детерминированные векторы) и
+  `/v1/chat/completions` (обычный и потоковый ответ);
+- Telegram Bot API: `sendMessage`, `editMessageText`;
+- Jivo: отправка сообщения бота.
+
+Для каждой заглушки задаются задержка и доля ошибок. Заглушки работают
+в отдельном процессе, чтобы не конкурировать с проверяемым кодом за
+GIL и event loop; отдельно выводится время обработки запросов на их
+стороне, чтобы задержку заглушек можно было отличить от задержки
+приложения. Все данные (индекс, SQLite, кэш embeddings) пишутся во
+временную директорию.
+
+Отчёт: пропускная способность, итоги обработки, end-to-end задержка и
+перцентили этапов pipeline (rate limit, spam, embedding, dedup, context,
+RAG, LLM, send) по каналам, лаг event loop и число запросов к заглушкам.
+
+Запуск из корня проекта:
+    python -m benchmarks.load_test --users 2000 --concurrency 200
+    python -m benchmarks.load_test --channels jivo --llm-latency 2 --llm-error-rate 0.05
+
+Остальные настройки приложения можно переопределить переменными
+окружения (например, `ANSWER_CACHE_ENABLED=false`).
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from collections import defaultdict
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import numpy as np
+from aiohttp import web
+
+from benchmarks.fake_embeddings import hashing_vector
+
+QUERIES_PATH = os.path.join(os.path.dirname(__file__), "retrieval_queries.json")
+STUB_ANSWER = (
+    "Спасибо за вопрос! Обучение в Школе проходит онлайн, подробности о "
+    "программе, стоимости и датах старта потока можно уточнить в хелп-чате. "
+) * 3
+STUB_ANSWER_CHUNKS = 20
+# Тело ответа OpenAI-заглушки при внесённой ошибке.
+OPENAI_STUB_ERROR = {"error": {"message": "stub failure", "type": "server_error"}}
+LOOP_LAG_INTERVAL = 0.05
+STAGE_ORDER = ("rate_limit", "spam", "context", "embedding", "rag", "llm", "dedup", "send")
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    return {
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "max": float(max(values)),
+    }
+
+
+class StubServer:
+    """HTTP-заглушки OpenAI, Telegram Bot API и Jivo; работает в дочернем процессе."""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.requests: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self._message_ids = 0
+
+    def stats(self) -> Dict:
+        """Счётчики запросов и ошибок и время обработки на стороне заглушек."""
+        return {
+            "requests": dict(self.requests),
+            "errors": dict(self.errors),
+            "latency_ms": {name: _percentiles(values) for name, values in self.latencies.items()},
+        }
+
+    @web.middleware
+    async def _measure(self, request: web.Request, handler) -> web.StreamResponse:
+        """Время обработки запроса заглушкой — от приёма до конца ответа."""
+        started_at = time.monotonic()
+        try:
+            return await handler(request)
+        finally:
+            name = request.match_info.get("method")
+            name = f"telegram.{name}" if name else request.match_info.route.name
+            self.latencies[name].append((time.monotonic() - started_at) * 1000)
+
+    async def serve(self, conn) -> None:
+        """Запускает сервер, отправляет порт в `conn` и работает до команды остановки."""
+        app = web.Application(middlewares=[self._measure])
+        app.router.add_post("/v1/embeddings", self._embeddings, name="openai.embeddings")
+        app.router.add_post("/v1/chat/completions", self._chat, name="openai.chat")
+        app.router.add_post("/jivo/message", self._jivo, name="jivo.message")
+        app.router.add_post("/bot{token}/{method}", self._telegram)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        conn.send(site._server.sockets[0].getsockname()[1])
+        await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+        await runner.cleanup()
+        conn.send(self.stats())
+
+    async def _delay_or_fail(self, name: str, latency: float, error_rate: float) -> bool:
+        """Имитирует задержку сервиса; `False`, если запрос должен упасть."""
+        self.requests[name] += 1
+        if latency > 0:
+            await asyncio.sleep(random.uniform(0.5, 1.5) * latency)
+        if random.random() < error_rate:
+            self.errors[name] += 1
+            return False
+        return True
+
+    async def _embeddings(self, request: web.Request) -> web.Response:
+        args = self.args
+        if not await self._delay_or_fail(
+            "openai.embeddings", args.embedding_latency, args.embedding_error_rate
+        ):
+            return web.json_response(OPENAI_STUB_ERROR, status=500)
+        payload = await request.json()
+        texts = payload["input"]
+        if isinstance(texts, str):
+            texts = [texts]
+        data = []
+        for i, text in enumerate(texts):
+            vector = hashing_vector(text)
+            if payload.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        return web.json_response({
+            "object": "list",
+            "data": data,
+            "model": payload.get("model", "stub"),
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        })
+
+    async def _chat(self, request: web.Request) -> web.StreamResponse:
+        args = self.args
+        payload = await request.json()
+        stream = bool(payload.get("stream"))
+        # Для потока задержка до первого токена — половина, остальное
+        # распределено между фрагментами.
+        first_latency = args.llm_latency / 2 if stream else args.llm_latency
+        if not await self._delay_or_fail("openai.chat", first_latency, args.llm_error_rate):
+            return web.json_response(OPENAI_STUB_ERROR, status=500)
+
+        created = int(time.time())
+        if not stream:
+            return web.json_response({
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": created,
+                "model": payload.get("model", "stub"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": STUB_ANSWER},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        step = max(1, len(STUB_ANSWER) // STUB_ANSWER_CHUNKS)
+        for start in range(0, len(STUB_ANSWER), step):
+            chunk = {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": payload.get("model", "stub"),
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": STUB_ANSWER[start:start + step]},
+                    "finish_reason": None,
+                }],
+            }
+            event = f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            await response.write(event.encode("utf-8"))
+            await asyncio.sleep(args.llm_latency / 2 / STUB_ANSWER_CHUNKS)
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def _telegram(self, request: web.Request) -> web.Response:
+        args = self.args
+        method = request.match_info["method"]
+        if not await self._delay_or_fail(
+            f"telegram.{method}", args.telegram_latency, args.telegram_error_rate
+        ):
+            return web.json_response(
+                {"ok": False, "error_code": 502, "description": "Bad Gateway: stub failure"},
+                status=502,
+            )
+        if request.content_type == "application/json":
+            data = await request.json()
+        else:
+            data = await request.post()
+        self._message_ids += 1
+        chat_id = int(data.get("chat_id", 0))
+        return web.json_response({
+            "ok": True,
+            "result": {
+                "message_id": int(data.get("message_id", self._message_ids)),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": data.get("text", ""),
+            },
+        })
+
+    async def _jivo(self, request: web.Request) -> web.Response:
+        args = self.args
+        await request.read()
+        if not await self._delay_or_fail("jivo.message", args.jivo_latency, args.jivo_error_rate):
+            return web.json_response({"ok": False}, status=500)
+        return web.json_response({"ok": True})
+
+
+def _serve_stubs(args: argparse.Namespace, conn) -> None:
+    """Точка входа дочернего процесса с заглушками."""
+    random.seed(args.seed)
+    asyncio.run(StubServer(args).serve(conn))
+
+
+class StubServices:
+    """Заглушки в отдельном процессе: своё ядро CPU, свой GIL и event loop.
+
+    Так задержки заглушек не смешиваются с задержками проверяемого кода;
+    их собственное время обработки запроса возвращается в `stats`.
+    """
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.port: Optional[int] = None
+        self._conn = None
+        self._process = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self) -> None:
+        context = multiprocessing.get_context("spawn")
+        self._conn, child_conn = context.Pipe()
+        self._process = context.Process(
+            target=_serve_stubs, args=(self.args, child_conn), daemon=True
+        )
+        self._process.start()
+        self.port = self._conn.recv()
+
+    def stop(self) -> Dict:
+        """Останавливает заглушки и возвращает их статистику."""
+        if self._process is None:
+            return {}
+        self._conn.send("stop")
+        stats = self._conn.recv()
+        self._process.join()
+        self._process = None
+        return stats
+
+
+class LoopLagMonitor:
+    """Измеряет, насколько `asyncio.sleep` просыпается позже заданного."""
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            started_at = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.samples.append((time.monotonic() - started_at - self.interval) * 1000)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+def _configure_environment(args: argparse.Namespace, stubs: StubServices, workdir: str) -> None:
+    """Направляет приложение на заглушки и временные файлы до импорта `app`."""
+    env = {
+        "OPENAI_API_KEY": "load-test",
+        "OPENAI_API_BASE": f"{stubs.base_url}/v1",
+        "LLM_PROVIDER": "openai",
+        "TELEGRAM_BOT_TOKEN": "42:load-test",
+        "TELEGRAM_API_URL": stubs.base_url,
+        "TELEGRAM_STREAMING": "true" if args.streaming else "false",
+        "JIVO_API_URL": f"{stubs.base_url}/jivo/message",
+        "JIVO_BOT_TOKEN": "load-test",
+        "DATABASE_PATH": os.path.join(workdir, "database.db"),
+        "FAISS_INDEX_PATH": os.path.join(workdir, "faiss_index"),
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embeddings.db"),
+        "LIMITS_BACKEND": args.limits_backend,
+        "LIMITS_SQLITE_PATH": os.path.join(workdir, "limits.db"),
+        "EMBEDDING_RETRY_BASE_DELAY": "0.05",
+    }
+    for name, value in env.items():
+        os.environ[name] = value
+    os.environ.setdefault(
+        "KNOWLEDGE_BASE_PATH", os.path.abspath(os.path.join("data", "knowledge_base.md"))
+    )
+
+
+def _user_messages(queries: List[str], count: int, rng: random.Random) -> List[str]:
+    """Реплики одного пользователя: частые вопросы и их вариации."""
+    prefixes = ("", "", "Подскажите, ", "Здравствуйте! ", "А ")
+    return [f"{rng.choice(prefixes)}{rng.choice(queries)}" for _ in range(count)]
+
+
+async def run(args: argparse.Namespace) -> Dict:
+    from fastapi import FastAPI
+    import httpx
+    from aiogram.types import Update
+    from loguru import logger
+
+    from app.core.pipeline import add_pipeline_observer
+    from app.core.rag_engine import get_rag_engine
+    from app.database.question_log import question_log
+    from app.database.questions_db import QuestionsDB
+    from app.integrations import telegram_bot
+    from app.integrations.jivo_webhook import router as jivo_router
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    await QuestionsDB().init_db()
+    if not await get_rag_engine().rebuild_index():
+        raise RuntimeError("Knowledge base index was not built")
+
+    stages: Dict[str, Dict[str, List[float]]] = defaultdict(lambda: defaultdict(list))
+    outcomes: Dict[str, Counter] = defaultdict(Counter)
+
+    def observe(pipeline) -> None:
+        outcomes[pipeline.channel][pipeline.outcome] += 1
+        for stage, duration_ms in pipeline.timings.items():
+            stages[pipeline.channel][stage].append(duration_ms)
+
+    add_pipeline_observer(observe)
+
+    with open(QUERIES_PATH, "r", encoding="utf-8") as f:
+        queries = [item["query"] for item in json.load(f)]
+
+    jivo_app = FastAPI()
+    jivo_app.include_router(jivo_router)
+    jivo_client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=jivo_app), base_url="http://jivo"
+    )
+
+    channels = [name.strip() for name in args.channels.split(",") if name.strip()]
+    end_to_end: Dict[str, List[float]] = defaultdict(list)
+    failures: Dict[str, Counter] = defaultdict(Counter)
+    update_ids = iter(range(1, 10 ** 9))
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def send_telegram(user_id: int, text: str) -> None:
+        update_id = next(update_ids)
+        update = Update.model_validate({
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "Load"},
+                "text": text,
+            },
+        }, context={"bot": telegram_bot.bot})
+        await telegram_bot.dp.feed_update(telegram_bot.bot, update)
+
+    async def send_jivo(user_id: int, text: str) -> None:
+        response = await jivo_client.post("/api/jivo/webhook", json={
+            "event_name": "chat.message",
+            "message": {"client_id": str(user_id), "text": text},
+        })
+        response.raise_for_status()
+
+    senders = {"telegram": send_telegram, "jivo": send_jivo}
+
+    async def simulate_user(user_id: int) -> None:
+        rng = random.Random(user_id)
+        channel = channels[user_id % len(channels)]
+        async with semaphore:
+            for text in _user_messages(queries, args.messages_per_user, rng):
+                started_at = time.monotonic()
+                try:
+                    await senders[channel](user_id, text)
+                except Exception as e:
+                    failures[channel][type(e).__name__] += 1
+                end_to_end[channel].append((time.monotonic() - started_at) * 1000)
+                if args.think_time > 0:
+                    await asyncio.sleep(rng.uniform(0, 2 * args.think_time))
+
+    lag = LoopLagMonitor()
+    lag.start()
+    started_at = time.monotonic()
+    await asyncio.gather(*(simulate_user(user_id) for user_id in range(1, args.users + 1)))
+    elapsed = time.monotonic() - started_at
+    await lag.stop()
+    # Аналитика пишется в фоне: дописываем очередь вне замера.
+    await question_log.aclose()
+
+    await jivo_client.aclose()
+    await telegram_bot.bot.session.close()
+
+    total_messages = sum(len(values) for values in end_to_end.values())
+    return {
+        "users": args.users,
+        "messages": total_messages,
+        "elapsed_s": elapsed,
+        "throughput_msg_s": total_messages / elapsed if elapsed else 0.0,
+        "channels": {
+            channel: {
+                "messages": len(end_to_end[channel]),
+                "outcomes": dict(outcomes[channel]),
+                "failures": dict(failures[channel]),
+                "end_to_end_ms": _percentiles(end_to_end[channel]),
+                "stages_ms": {
+                    stage: _percentiles(stages[channel][stage])
+                    for stage in STAGE_ORDER
+                    if stage in stages[channel]
+                },
+            }
+            for channel in channels
+        },
+        "loop_lag_ms": _percentiles(lag.samples),
+        "question_log": question_log.stats(),
+    }
+
+
+def _print_report(report: Dict) -> None:
+    print(
+        f"users={report['users']} messages={report['messages']} "
+        f"elapsed={report['elapsed_s']:.1f}s throughput={report['throughput_msg_s']:.1f} msg/s"
+    )
+    for channel, data in report["channels"].items():
+        print(
+            f"\n[{channel}] messages={data['messages']} "
+            f"outcomes={data['outcomes']} failures={data['failures']}"
+        )
+        print(f"  {'stage':<12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        rows = list(data["stages_ms"].items()) + [("end_to_end", data["end_to_end_ms"])]
+        for stage, values in rows:
+            print(
+                f"  {stage:<12}{values['p50']:>10.1f}{values['p95']:>10.1f}"
+                f"{values['p99']:>10.1f}{values['max']:>10.1f}"
+            )
+    lag = report["loop_lag_ms"]
+    print(
+        f"\nevent loop lag: p50={lag['p50']:.1f}ms p95={lag['p95']:.1f}ms "
+        f"p99={lag['p99']:.1f}ms max={lag['max']:.1f}ms"
+    )
+    print(f"question log: {report['question_log']}")
+    print(f"stub requests: {report['stub_requests']}")
+    if report["stub_errors"]:
+        print(f"stub injected errors: {report['stub_errors']}")
+    print("\n[stubs] время обработки в процессе заглушек (с заданной задержкой)")
+    print(f"  {'service':<24}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, values in sorted(report["stub_latency_ms"].items()):
+        print(
+            f"  {name:<24}{values['p50']:>10.1f}{values['p95']:>10.1f}"
+            f"{values['p99']:>10.1f}{values['max']:>10.1f}"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест pipeline Telegram и Jivo")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--messages-per-user", type=int, default=3)
+    parser.add_argument(
+        "--concurrency", type=int, default=100, help="Одновременно активных пользователей"
+    )
+    parser.add_argument(
+        "--think-time", type=float, default=0.0, help="Средняя пауза между репликами, с"
+    )
+    parser.add_argument("--channels", default="telegram,jivo")
+    parser.add_argument("--streaming", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--embedding-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--telegram-latency", type=float, default=0.05)
+    parser.add_argument("--telegram-error-rate", type=float, default=0.0)
+    parser.add_argument("--jivo-latency", type=float, default=0.05)
+    parser.add_argument("--jivo-error-rate", type=float, default=0.0)
+    parser.add_argument("--limits-backend", choices=("memory", "sqlite"), default="memory")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", help="Сохранить отчёт в JSON")
+    args = parser.parse_args()
+
+    unknown = {name.strip() for name in args.channels.split(",")} - {"telegram", "jivo"}
+    if unknown:
+        parser.error(f"Неизвестные каналы: {', '.join(sorted(unknown))}")
+
+    random.seed(args.seed)
+    stubs = StubServices(args)
+    stubs.start()
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            _configure_environment(args, stubs, workdir)
+            report = asyncio.run(run(args))
+    finally:
+        stub_stats = stubs.stop()
+    report["stub_requests"] = stub_stats["requests"]
+    report["stub_errors"] = stub_stats["errors"]
+    report["stub_latency_ms"] = stub_stats["latency_ms"]
+
+    _print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+"""Бенчмарк SQLite БД вопросов: настройки соединения до/после.
+
+Для каждой конфигурации создаётся свежая БД во временной директории,
+заполняется `--rows` вопросами, после чего одновременно работают:
+- писатели (`--writers`), каждый вставляет `--inserts` вопросов отдельными
+  транзакциями — так пишут обработчики без очереди аналитики, и ещё
+  столько же пачками по `--batch-size` — так пишет `question_log`;
+- читатели (`--readers`), выполняющие запросы админки: последние вопросы
+  по `created_at` и число вопросов канала по `source`.
+
+Отчёт: вставок в секунду и p95 фиксации, запросов чтения в секунду и
+p95, число ошибок `database is locked`.
+
+Конфигурации:
+- `baseline` — прежнее поведение: rollback-журнал, `synchronous=FULL`,
+  новое соединение на каждую сессию, без mmap и индексов;
+- `wal` — только WAL и `synchronous=NORMAL`;
+- `tuned` — настройки по умолчанию (WAL, пул, mmap) и индексы.
+
+Запуск из корня проекта:
+    python -m benchmarks.questions_db
+    python -m benchmarks.questions_db --rows 50000 --writers 8 --readers 8
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+from datetime import timedelta
+from typing import Dict
+from typing import List
+
+import numpy as np
+
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:offline-benchmark")
+
+from sqlalchemy import func  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.database.models import Base  # noqa: E402
+from app.database.models import UniqueQuestion  # noqa: E402
+from app.database.sqlite import create_sqlite_engine  # noqa: E402
+from benchmarks.retrieval import override_settings  # noqa: E402
+
+SOURCES = ("telegram", "jivo")
+
+CONFIGURATIONS: Dict[str, Dict] = {
+    "baseline": {
+        "settings": {
+            "SQLITE_JOURNAL_MODE": "delete",
+            "SQLITE_SYNCHRONOUS": "full",
+            "SQLITE_MMAP_SIZE": 0,
+            "SQLITE_POOL_SIZE": 0,
+        },
+        "indexes": False,
+    },
+    "wal": {
+        "settings": {
+            "SQLITE_JOURNAL_MODE": "wal",
+            "SQLITE_SYNCHRONOUS": "normal",
+            "SQLITE_MMAP_SIZE": 0,
+            "SQLITE_POOL_SIZE": 0,
+        },
+        "indexes": False,
+    },
+    "tuned": {"settings": {}, "indexes": True},
+}
+
+
+def _percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def _question_row(rng: random.Random, dimension: int, created_at: datetime) -> Dict:
+    return {
+        "question": f"Вопрос {rng.randrange(10 ** 9)} о курсе и оплате",
+        "embedding": rng.randbytes(dimension * 4),
+        "embedding_dim": dimension,
+        "embedding_version": 1,
+        "source": rng.choice(SOURCES),
+        "created_at": created_at,
+        "count": 1,
+    }
+
+
+async def _prepare(engine, rows: int, dimension: int, indexes: bool) -> None:
+    """Создаёт схему и заполняет БД одной транзакцией."""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        if not indexes:
+            for index in UniqueQuestion.__table__.indexes:
+                await conn.execute(text(f"DROP INDEX {index.name}"))
+
+    rng = random.Random(0)
+    started = datetime.utcnow() - timedelta(days=365)
+    batch = 5000
+    async with engine.begin() as conn:
+        for offset in range(0, rows, batch):
+            await conn.execute(insert(UniqueQuestion), [
+                _question_row(rng, dimension, started + timedelta(minutes=rng.randrange(525600)))
+                for _ in range(min(batch, rows - offset))
+            ])
+
+
+async def run_configuration(name: str, config: Dict, args: argparse.Namespace) -> Dict:
+    """Прогоняет смешанную нагрузку на свежей БД в конфигурации `config`."""
+    with override_settings(**config["settings"]), tempfile.TemporaryDirectory() as workdir:
+        engine = create_sqlite_engine(os.path.join(workdir, "database.db"))
+        session_factory = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+        await _prepare(engine, args.rows, args.dim, config["indexes"])
+
+        commit_ms: List[float] = []
+        read_ms: List[float] = []
+        errors: Counter = Counter()
+        inserted = 0
+        writers_done = asyncio.Event()
+
+        async def write_single(rng: random.Random) -> None:
+            nonlocal inserted
+            for _ in range(args.inserts):
+                started_at = time.perf_counter()
+                try:
+                    async with session_factory() as session:
+                        row = _question_row(rng, args.dim, datetime.utcnow())
+                        session.add(UniqueQuestion(**row))
+                        await session.commit()
+                except OperationalError as e:
+                    errors[type(e.orig).__name__] += 1
+                    continue
+                commit_ms.append((time.perf_counter() - started_at) * 1000)
+                inserted += 1
+
+        async def write_batches(rng: random.Random) -> None:
+            nonlocal inserted
+            for offset in range(0, args.inserts, args.batch_size):
+                size = min(args.batch_size, args.inserts - offset)
+                started_at = time.perf_counter()
+                try:
+                    async with session_factory() as session:
+                        session.add_all([
+                            UniqueQuestion(**_question_row(rng, args.dim, datetime.utcnow()))
+                            for _ in range(size)
+                        ])
+                        await session.commit()
+                except OperationalError as e:
+                    errors[type(e.orig).__name__] += 1
+                    continue
+                commit_ms.append((time.perf_counter() - started_at) * 1000)
+                inserted += size
+
+        async def writer(writer_id: int) -> None:
+            rng = random.Random(writer_id)
+            await write_single(rng)
+            await write_batches(rng)
+
+        async def reader(reader_id: int) -> None:
+            rng = random.Random(-reader_id - 1)
+            while not writers_done.is_set():
+                if rng.random() < 0.5:
+                    query = select(UniqueQuestion.id, UniqueQuestion.question).order_by(
+                        UniqueQuestion.created_at.desc()
+                    ).limit(100)
+                else:
+                    query = select(func.count()).where(UniqueQuestion.source == rng.choice(SOURCES))
+                started_at = time.perf_counter()
+                try:
+                    async with session_factory() as session:
+                        (await session.execute(query)).all()
+                except OperationalError as e:
+                    errors[type(e.orig).__name__] += 1
+                    continue
+                read_ms.append((time.perf_counter() - started_at) * 1000)
+
+        async def run_writers() -> None:
+            await asyncio.gather(*(writer(i) for i in range(args.writers)))
+            writers_done.set()
+
+        started_at = time.perf_counter()
+        await asyncio.gather(run_writers(), *(reader(i) for i in range(args.readers)))
+        elapsed = time.perf_counter() - started_at
+        await engine.dispose()
+
+    return {
+        "config": name,
+        "elapsed_s": elapsed,
+        "inserts_per_s": inserted / elapsed,
+        "commit_p50_ms": _percentile(commit_ms, 50),
+        "commit_p95_ms": _percentile(commit_ms, 95),
+        "reads_per_s": len(read_ms) / elapsed,
+        "read_p50_ms": _percentile(read_ms, 50),
+        "read_p95_ms": _percentile(read_ms, 95),
+        "errors": dict(errors),
+    }
+
+
+def _print_report(rows: List[Dict]) -> None:
+    header = (
+        f"{'config':<10}{'time s':>8}{'ins/s':>9}{'commit p50':>12}{'commit p95':>12}"
+        f"{'reads/s':>9}{'read p50':>10}{'read p95':>10}  errors"
+    )
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(
+            f"{row['config']:<10}{row['elapsed_s']:>8.2f}{row['inserts_per_s']:>9.1f}"
+            f"{row['commit_p50_ms']:>12.2f}{row['commit_p95_ms']:>12.2f}{row['reads_per_s']:>9.1f}"
+            f"{row['read_p50_ms']:>10.2f}{row['read_p95_ms']:>10.2f}  {row['errors'] or '-'}"
+        )
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк SQLite БД вопросов")
+    parser.add_argument("--rows", type=int, default=20000, help="Вопросов в БД до начала замера")
+    parser.add_argument(
+        "--dim", type=int, default=1536, help="Размерность embeddings (влияет на размер строки)"
+    )
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument(
+        "--inserts", type=int, default=200, help="Вставок на писателя в каждом режиме"
+    )
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument(
+        "--configs",
+        default=",".join(CONFIGURATIONS),
+        help=f"Конфигурации через запятую: {', '.join(CONFIGURATIONS)}",
+    )
+    parser.add_argument("--json", dest="json_path", help="Сохранить отчёт в JSON")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.configs.split(",") if name.strip()]
+    unknown = [name for name in names if name not in CONFIGURATIONS]
+    if unknown:
+        parser.error(f"Неизвестные конфигурации: {', '.join(unknown)}")
+
+    rows = [await run_configuration(name, CONFIGURATIONS[name], args) for name in names]
+    _print_report(rows)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=4)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
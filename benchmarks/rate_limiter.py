@@ -0,0 +1,184 @@
+"""Микробенчмарк in-memory rate limiter на большом числе пользователей.
+
+Сравнивает прежний `RateLimiter` (список меток времени на пользователя,
+без удаления простаивающих) с `MemoryLimitsBackend` (два счётчика на
+пользователя в `__slots__`-записи, удаление простаивающих ключей и
+лимит `max_keys`). Время подменяется искусственными часами, поэтому
+прогон детерминирован и не ждёт реального окна.
+
+Этапы для каждой реализации:
+1. `--users` разных пользователей делают по `--hits-per-user` запросов; стоимость
+   вызова меряется по отрезкам в `--chunk` пользователей — у O(1)
+   реализации она не растёт с числом пользователей;
+2. пиковая память Python-объектов (tracemalloc) после первого этапа;
+3. часы сдвигаются на два окна, и `--chunk` новых пользователей делают
+   запросы: простаивающие ключи должны уйти.
+
+Запуск из корня проекта:
+    python -m benchmarks.rate_limiter
+    python -m benchmarks.rate_limiter --users 200000 --hits-per-user 10 --max-keys 50000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable
+from typing import Dict
+from typing import List
+
+import numpy as np
+
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:offline-benchmark")
+
+from app.core.limit_backends import MemoryLimitsBackend  # noqa: E402
+from app.core.spam_filter import RateLimiter  # noqa: E402
+
+LIMIT = 20
+WINDOW = 3600
+
+
+class FakeClock:
+    """Ручные часы: время двигается только вызовом `advance`."""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+class LegacyRateLimiter:
+    """Прежняя реализация: список меток на пользователя, ключи не удаляются."""
+
+    def __init__(self, clock: Callable[[], float]):
+        self.clock = clock
+        self.requests: Dict[str, List[float]] = {}
+
+    async def acquire(self, user_id: str) -> bool:
+        now = self.clock()
+        if user_id in self.requests:
+            self.requests[user_id] = [ts for ts in self.requests[user_id] if now - ts < WINDOW]
+            if len(self.requests[user_id]) >= LIMIT:
+                return False
+        self.requests.setdefault(user_id, []).append(now)
+        return True
+
+    def keys(self) -> int:
+        return len(self.requests)
+
+
+class TunedRateLimiter:
+    """`RateLimiter` поверх `MemoryLimitsBackend` с искусственными часами."""
+
+    def __init__(self, clock: Callable[[], float], max_keys: int):
+        self.backend = MemoryLimitsBackend(max_keys=max_keys, clock=clock)
+        self.limiter = RateLimiter(self.backend, max_requests=LIMIT, window=WINDOW)
+
+    async def acquire(self, user_id: str) -> bool:
+        return await self.limiter.acquire(user_id)
+
+    def keys(self) -> int:
+        return self.backend.stats()["rate_limit_keys"]
+
+
+async def _drive(limiter, first_user: int, users: int, chunk: int, hits: int = 1) -> List[float]:
+    """По `hits` запросов от каждого пользователя; возвращает нс на вызов по отрезкам."""
+    costs = []
+    for start in range(first_user, first_user + users, chunk):
+        stop = min(start + chunk, first_user + users)
+        names = [f"telegram_{user_id}" for user_id in range(start, stop)]
+        started_at = time.perf_counter_ns()
+        for _ in range(hits):
+            for name in names:
+                await limiter.acquire(name)
+        costs.append((time.perf_counter_ns() - started_at) / (len(names) * hits))
+    return costs
+
+
+async def run(name: str, factory: Callable[[FakeClock], object], args: argparse.Namespace) -> Dict:
+    clock = FakeClock()
+    limiter = factory(clock)
+    costs = await _drive(limiter, 0, args.users, args.chunk, args.hits_per_user)
+    keys_after_load = limiter.keys()
+
+    # Память меряем отдельным прогоном: tracemalloc замедляет вызовы.
+    tracemalloc.start()
+    measured = factory(FakeClock())
+    await _drive(measured, 0, args.users, args.chunk, args.hits_per_user)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del measured
+
+    clock.advance(2 * WINDOW + 1)
+    await _drive(limiter, args.users, args.chunk, args.chunk)
+
+    return {
+        "impl": name,
+        "first_ns": costs[0],
+        "last_ns": costs[-1],
+        "max_ns": max(costs),
+        "p50_ns": float(np.median(costs)),
+        "keys_after_load": keys_after_load,
+        "memory_mb": memory / 2 ** 20,
+        "keys_after_idle": limiter.keys(),
+    }
+
+
+def _print_report(rows: List[Dict], args: argparse.Namespace) -> None:
+    print(
+        f"users={args.users} hits/user={args.hits_per_user} chunk={args.chunk} "
+        f"limit={LIMIT}/{WINDOW}s"
+    )
+    header = (
+        f"{'impl':<20}{'first ns':>10}{'last ns':>10}{'p50 ns':>10}{'max ns':>10}"
+        f"{'keys':>10}{'mem MB':>9}{'keys after idle':>17}"
+    )
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(
+            f"{row['impl']:<20}{row['first_ns']:>10.0f}{row['last_ns']:>10.0f}"
+            f"{row['p50_ns']:>10.0f}{row['max_ns']:>10.0f}{row['keys_after_load']:>10}"
+            f"{row['memory_mb']:>9.1f}{row['keys_after_idle']:>17}"
+        )
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description="Микробенчмарк in-memory rate limiter")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--chunk", type=int, default=100_000, help="Пользователей в отрезке замера")
+    parser.add_argument(
+        "--hits-per-user",
+        type=int,
+        default=1,
+        help="Запросов от каждого пользователя на первом этапе (в пределах окна)",
+    )
+    parser.add_argument(
+        "--max-keys",
+        type=int,
+        default=100_000,
+        help="LIMITS_MEMORY_MAX_KEYS для варианта с ограничением",
+    )
+    args = parser.parse_args()
+
+    implementations = {
+        "legacy": LegacyRateLimiter,
+        "memory-unbounded": lambda clock: TunedRateLimiter(clock, max_keys=args.users),
+        f"memory-max-{args.max_keys}": (
+            lambda clock: TunedRateLimiter(clock, max_keys=args.max_keys)
+        ),
+    }
+    rows = [await run(name, factory, args) for name, factory in implementations.items()]
+    _print_report(rows, args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
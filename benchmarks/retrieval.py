@@ -0,0 +1,271 @@
+"""Офлайн-бенчмарк поиска по базе знаний.
+
+Собирает индекс `RAGEngine` в нескольких конфигурациях и прогоняет по
+каждой размеченный набор запросов (`retrieval_queries.json`). Вместо
+embeddings API используется детерминированный локальный эмбеддер на
+хешах символьных триграмм, поэтому бенчмарк не требует сети и ключей,
+а результаты воспроизводимы между запусками.
+
+Для каждой конфигурации выводятся:
+- recall@k — доля запросов, для которых релевантный чанк есть в top-k;
+- MRR — средний обратный ранг первого релевантного чанка;
+- p50/p95 задержки `RAGEngine.search` (embedding запроса посчитан заранее);
+- время сборки индекса (локальный эмбеддер почти бесплатен, так что это
+  в основном чанкинг, FAISS и BM25) и память: пик Python/numpy-аллокаций
+  при пересборке, размер сериализованного FAISS индекса и матрицы векторов.
+
+IVF-PQ обучается только на тысячах векторов: на небольшой базе
+`RAGEngine` строит вместо него `flat`, и такая строка отчёта помечается
+`→flat`. Чтобы измерить настоящий IVF-PQ, передайте большую базу `--kb`.
+
+Чанк считается релевантным, если содержит хотя бы одну из строк `relevant`
+запроса, поэтому разметка не зависит от параметров чанкинга.
+
+Запуск из корня проекта:
+    python -m benchmarks.retrieval
+    python -m benchmarks.retrieval --configs flat-cosine,hybrid --chunk-size 600
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+
+import numpy as np
+
+# Бенчмарк не обращается к внешним сервисам: достаточно заглушек для
+# обязательных настроек и выключенного кэша embeddings.
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:offline-benchmark")
+os.environ.setdefault("EMBEDDING_CACHE_ENABLED", "false")
+
+import faiss  # noqa: E402
+from loguru import logger  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.core.faiss_index import index_type  # noqa: E402
+from app.core.rag_engine import RAGEngine  # noqa: E402
+from benchmarks.fake_embeddings import HashingEmbeddings  # noqa: E402
+
+QUERIES_PATH = os.path.join(os.path.dirname(__file__), "retrieval_queries.json")
+
+CONFIGURATIONS: Dict[str, Dict] = {
+    "flat-l2": {
+        "RAG_INDEX_METRIC": "l2",
+        "RAG_INDEX_TYPE": "flat",
+        "RAG_HYBRID_SEARCH": False,
+    },
+    "flat-cosine": {
+        "RAG_INDEX_METRIC": "cosine",
+        "RAG_INDEX_TYPE": "flat",
+        "RAG_HYBRID_SEARCH": False,
+    },
+    "hnsw-cosine": {
+        "RAG_INDEX_METRIC": "cosine",
+        "RAG_INDEX_TYPE": "hnsw",
+        "RAG_HYBRID_SEARCH": False,
+    },
+    "ivfpq-cosine": {
+        "RAG_INDEX_METRIC": "cosine",
+        "RAG_INDEX_TYPE": "ivfpq",
+        "RAG_HYBRID_SEARCH": False,
+    },
+    "hybrid": {
+        "RAG_INDEX_METRIC": "cosine",
+        "RAG_INDEX_TYPE": "flat",
+        "RAG_HYBRID_SEARCH": True,
+        "RAG_LEXICAL_FAST_PATH": False,
+    },
+    "hybrid-fast-path": {
+        "RAG_INDEX_METRIC": "cosine",
+        "RAG_INDEX_TYPE": "flat",
+        "RAG_HYBRID_SEARCH": True,
+        "RAG_LEXICAL_FAST_PATH": True,
+    },
+}
+
+
+@contextlib.contextmanager
+def override_settings(**values) -> Iterator[None]:
+    """Временно подменяет поля `settings`."""
+    previous = {name: getattr(settings, name) for name in values}
+    for name, value in values.items():
+        setattr(settings, name, value)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            setattr(settings, name, value)
+
+
+def _first_relevant_rank(results: List[Dict], relevant: List[str]) -> Optional[int]:
+    """Ранг (с 1) первого результата, содержащего одну из строк `relevant`."""
+    needles = [item.casefold() for item in relevant]
+    for rank, result in enumerate(results, start=1):
+        text = result["text"].casefold()
+        if any(needle in text for needle in needles):
+            return rank
+    return None
+
+
+def _check_labels(rag: RAGEngine, queries: List[Dict]) -> None:
+    """Предупреждает о разметке, которой нет ни в одном чанке."""
+    texts = [item["text"].casefold() for item in rag.metadata]
+    for item in queries:
+        if not any(needle.casefold() in text for text in texts for needle in item["relevant"]):
+            logger.warning("No chunk matches labels of query '{}'", item["query"])
+
+
+async def run_configuration(
+    name: str,
+    overrides: Dict,
+    kb_path: str,
+    queries: List[Dict],
+    top_k: int,
+    repeat: int,
+) -> Dict:
+    """Собирает индекс в конфигурации `overrides` и измеряет поиск."""
+    embeddings = HashingEmbeddings()
+    with override_settings(**overrides), tempfile.TemporaryDirectory() as index_dir:
+        rag = RAGEngine(kb_path, index_dir, embeddings=embeddings)
+
+        started_at = time.perf_counter()
+        await rag.rebuild_index()
+        build_seconds = time.perf_counter() - started_at
+
+        # Память меряем отдельной пересборкой: tracemalloc заметно
+        # замедляет код и исказил бы время сборки.
+        tracemalloc.start()
+        await rag.rebuild_index()
+        _, build_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        _check_labels(rag, queries)
+        query_embeddings = [await embeddings.embed(item["query"]) for item in queries]
+
+        reciprocal_ranks = []
+        hits = 0
+        for item, embedding in zip(queries, query_embeddings):
+            results = await rag.search(item["query"], top_k=top_k, embedding=embedding)
+            rank = _first_relevant_rank(results, item["relevant"])
+            if rank is not None:
+                hits += 1
+            reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+
+        timings = []
+        for _ in range(repeat):
+            for item, embedding in zip(queries, query_embeddings):
+                started_at = time.perf_counter()
+                await rag.search(item["query"], top_k=top_k, embedding=embedding)
+                timings.append((time.perf_counter() - started_at) * 1000)
+
+        built = index_type(rag.index)
+        if built != overrides["RAG_INDEX_TYPE"]:
+            # Строка не должна выдавать flat за приближённый индекс.
+            logger.warning(
+                "{}: {} vectors are too few for {}, {} index was built",
+                name,
+                rag.index.ntotal,
+                overrides["RAG_INDEX_TYPE"],
+                built,
+            )
+            name = f"{name}→{built}"
+
+        return {
+            "config": name,
+            "index_type": built,
+            "chunks": len(rag.metadata),
+            "recall_at_k": hits / len(queries),
+            "mrr": float(np.mean(reciprocal_ranks)),
+            "p50_ms": float(np.percentile(timings, 50)),
+            "p95_ms": float(np.percentile(timings, 95)),
+            "build_s": build_seconds,
+            "build_peak_mb": build_peak / 2 ** 20,
+            "index_mb": len(faiss.serialize_index(rag.index)) / 2 ** 20,
+            "vectors_mb": os.path.getsize(os.path.join(index_dir, "embeddings.npy")) / 2 ** 20,
+        }
+
+
+def _print_report(rows: List[Dict], top_k: int) -> None:
+    header = (
+        f"{'config':<18}{'index':<7}{'chunks':>7}{f'recall@{top_k}':>11}{'MRR':>7}"
+        f"{'p50 ms':>9}{'p95 ms':>9}{'build s':>9}{'peak MB':>9}{'index MB':>10}{'vec MB':>8}"
+    )
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(
+            f"{row['config']:<18}{row['index_type']:<7}{row['chunks']:>7}"
+            f"{row['recall_at_k']:>11.3f}{row['mrr']:>7.3f}{row['p50_ms']:>9.3f}"
+            f"{row['p95_ms']:>9.3f}{row['build_s']:>9.2f}{row['build_peak_mb']:>9.1f}"
+            f"{row['index_mb']:>10.2f}{row['vectors_mb']:>8.2f}"
+        )
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк поиска RAGEngine")
+    parser.add_argument("--kb", default=settings.KNOWLEDGE_BASE_PATH, help="Markdown база знаний")
+    parser.add_argument("--queries", default=QUERIES_PATH, help="JSON с размеченными запросами")
+    parser.add_argument(
+        "--configs",
+        default=",".join(CONFIGURATIONS),
+        help=f"Конфигурации через запятую: {', '.join(CONFIGURATIONS)}",
+    )
+    parser.add_argument("--top-k", type=int, default=settings.TOP_K_RESULTS)
+    parser.add_argument(
+        "--repeat", type=int, default=20, help="Повторов набора запросов для задержек"
+    )
+    parser.add_argument("--chunk-size", type=int, default=settings.CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=settings.CHUNK_OVERLAP)
+    parser.add_argument(
+        "--min-score",
+        type=float,
+        default=-1.0,
+        help="RAG_MIN_SCORE для cosine (по умолчанию без фильтра: шкала эмбеддера другая)",
+    )
+    parser.add_argument("--json", dest="json_path", help="Сохранить отчёт в JSON")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.configs.split(",") if name.strip()]
+    unknown = [name for name in names if name not in CONFIGURATIONS]
+    if unknown:
+        parser.error(f"Неизвестные конфигурации: {', '.join(unknown)}")
+
+    with open(args.queries, "r", encoding="utf-8") as f:
+        queries = json.load(f)
+
+    logger.remove()
+    # Из логов приложения оставляем только предупреждения самого бенчмарка.
+    logger.add(sys.stderr, level="WARNING", filter=__name__)
+
+    common = {
+        "CHUNK_SIZE": args.chunk_size,
+        "CHUNK_OVERLAP": args.chunk_overlap,
+        "RAG_MIN_SCORE": args.min_score,
+        "TOP_K_RESULTS": args.top_k,
+    }
+    rows = []
+    for name in names:
+        overrides = {**common, **CONFIGURATIONS[name]}
+        rows.append(await run_configuration(
+            name, overrides, args.kb, queries, args.top_k, args.repeat
+        ))
+
+    _print_report(rows, args.top_k)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=4)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -58,7 +58,9 @@ async def migrate_embeddings():
     logger.info("Это может занять несколько минут в зависимости от размера базы знаний.")
     
     try:
-        rag.rebuild_index()
+        if not await rag.rebuild_index():
+            logger.error("✗ Индекс не пересоздан, подробности в логах выше.")
+            return False
         logger.success("✓ Миграция успешно завершена!")
         logger.info(f"Новый индекс сохранен в: {settings.FAISS_INDEX_PATH}")
         return True
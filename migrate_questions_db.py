@@ -0,0 +1,60 @@
+"""
+Миграционный скрипт БД вопросов: pickle-embeddings -> компактный бинарный формат.
+
+Конвертирует `unique_questions.embedding` в little-endian float32/float16
+(по `QUESTION_EMBEDDING_DTYPE`) и заполняет колонки `embedding_dim` и
+`embedding_version`. Повторный запуск безопасен: уже сконвертированные
+строки пропускаются. Pickle-строки приложение конвертирует и само при
+старте (`QuestionsDB.init_db`); скрипт нужен для смены формата и делает
+backup перед конвертацией.
+
+Использование:
+    python migrate_questions_db.py
+"""
+import asyncio
+import os
+import sqlite3
+import sys
+
+# Добавляем корневую директорию в путь
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.database.questions_db import QuestionsDB  # noqa: E402
+from app.config import settings  # noqa: E402
+from loguru import logger  # noqa: E402
+
+DATABASE_FILE = settings.DATABASE_PATH
+
+
+async def main():
+    """Главная функция миграции."""
+    if not os.path.exists(DATABASE_FILE):
+        logger.error(f"Файл БД не найден: {DATABASE_FILE}")
+        return
+
+    backup_file = DATABASE_FILE + ".backup"
+    # В режиме WAL часть данных может быть ещё в `-wal` файле, поэтому
+    # копируем через backup API, а не файл целиком.
+    source = sqlite3.connect(DATABASE_FILE)
+    target = sqlite3.connect(backup_file)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    logger.info(f"Backup сохранен: {backup_file}")
+
+    logger.info(f"Конвертируем embeddings в формат {settings.QUESTION_EMBEDDING_DTYPE}...")
+    try:
+        converted = await QuestionsDB().migrate_embeddings()
+    except Exception as e:
+        logger.error(f"✗ Ошибка при миграции: {e}")
+        logger.error("Для восстановления используйте backup файл.")
+        return
+
+    logger.success(f"✓ Сконвертировано строк: {converted}")
+    logger.info("Перезапустите приложение, чтобы индекс вопросов перечитал БД.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,120 @@
+"""Заглушка Redis для тестов и бенчмарка хранилищ контекста.
+
+Минимальный RESP-сервер в памяти процесса: списки RPUSH/LRANGE/LTRIM,
+PEXPIRE, MULTI/EXEC, GET, SET, DEL, AUTH, SELECT, PING — ровно то, что
+использует `RedisContextBackend`.
+"""
+
+import asyncio
+import time
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+
+class RespStandIn:
+    """Заглушка Redis: подмножество команд RESP в памяти процесса."""
+
+    def __init__(self):
+        self.data: Dict[bytes, Tuple[Union[bytes, List[bytes]], Optional[float]]] = {}
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        return f"redis://127.0.0.1:{port}/1"
+
+    async def stop(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    @staticmethod
+    def _bulk(value: Optional[bytes]) -> bytes:
+        if value is None:
+            return b"$-1\r\n"
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def _get(self, key: bytes):
+        value, expires_at = self.data.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    @staticmethod
+    def _slice(items: List[bytes], start: int, stop: int) -> slice:
+        """Срез Python для индексов LRANGE/LTRIM (включительно, с отрицательными)."""
+        size = len(items)
+        start = max(0, start + size if start < 0 else start)
+        stop = stop + size if stop < 0 else stop
+        return slice(start, stop + 1)
+
+    def _execute(self, command: List[bytes]) -> bytes:
+        name = command[0].upper()
+        if name in (b"PING", b"AUTH", b"SELECT"):
+            return b"+OK\r\n" if name != b"PING" else b"+PONG\r\n"
+        if name == b"GET":
+            return self._bulk(self._get(command[1]))
+        if name == b"SET":
+            expires_at = None
+            if len(command) == 5:
+                scale = 1.0 if command[3].upper() == b"EX" else 0.001
+                expires_at = time.monotonic() + int(command[4]) * scale
+            self.data[command[1]] = (command[2], expires_at)
+            return b"+OK\r\n"
+        if name == b"DEL":
+            return b":%d\r\n" % sum(self.data.pop(key, None) is not None for key in command[1:])
+        if name == b"RPUSH":
+            items = self._get(command[1]) or []
+            items.extend(command[2:])
+            self.data[command[1]] = (items, self.data.get(command[1], (None, None))[1])
+            return b":%d\r\n" % len(items)
+        if name == b"LRANGE":
+            items = self._get(command[1]) or []
+            selected = items[self._slice(items, int(command[2]), int(command[3]))]
+            return b"*%d\r\n" % len(selected) + b"".join(self._bulk(item) for item in selected)
+        if name == b"LTRIM":
+            items = self._get(command[1])
+            if items is not None:
+                items[:] = items[self._slice(items, int(command[2]), int(command[3]))]
+            return b"+OK\r\n"
+        if name == b"PEXPIRE":
+            value = self._get(command[1])
+            if value is None:
+                return b":0\r\n"
+            self.data[command[1]] = (value, time.monotonic() + int(command[2]) / 1000)
+            return b":1\r\n"
+        return b"-ERR unknown command\r\n"
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # Команды между MULTI и EXEC копятся и выполняются разом.
+        queued: Optional[List[List[bytes]]] = None
+        try:
+            while True:
+                header = await reader.readline()
+                if not header:
+                    break
+                command = []
+                for _ in range(int(header[1:-2])):
+                    length = int((await reader.readline())[1:-2])
+                    command.append((await reader.readexactly(length + 2))[:-2])
+                name = command[0].upper()
+                if name == b"MULTI":
+                    queued = []
+                    writer.write(b"+OK\r\n")
+                elif name == b"EXEC" and queued is not None:
+                    replies = [self._execute(item) for item in queued]
+                    queued = None
+                    writer.write(b"*%d\r\n" % len(replies) + b"".join(replies))
+                elif queued is not None:
+                    queued.append(command)
+                    writer.write(b"+QUEUED\r\n")
+                else:
+                    writer.write(self._execute(command))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,80 @@
+"""Семантический кэш ответов: сходство, TTL, LRU и версия индекса."""
+
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:test")
+
+import numpy as np  # noqa: E402
+import pytest  # noqa: E402
+
+from app.core import answer_cache as answer_cache_module  # noqa: E402
+from app.core.answer_cache import AnswerCache  # noqa: E402
+
+TTL = 60
+VERSION = "v1"
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = _Clock()
+    monkeypatch.setattr(answer_cache_module.time, "monotonic", fake)
+    return fake
+
+
+def _vector(angle: float) -> np.ndarray:
+    return np.array([np.cos(angle), np.sin(angle)], dtype=np.float32)
+
+
+def test_similar_question_hits_and_distant_misses(clock):
+    cache = AnswerCache(max_items=10, ttl=TTL, threshold=0.95)
+    cache.put(_vector(0.0), "ответ", VERSION)
+
+    assert cache.get(_vector(0.1), VERSION) == "ответ"
+    assert cache.get(_vector(1.0), VERSION) is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+
+def test_expired_entry_is_removed_and_fresh_neighbour_served(clock):
+    cache = AnswerCache(max_items=10, ttl=TTL, threshold=0.9)
+    cache.put(_vector(0.0), "старый", VERSION)
+    clock.now += TTL + 1
+    cache.put(_vector(0.05), "свежий", VERSION)
+
+    # Ближайшая запись истекла: она удаляется, ответ берётся у соседа.
+    assert cache.get(_vector(0.0), VERSION) == "свежий"
+    assert len(cache) == 1
+
+    clock.now += TTL + 1
+    assert cache.get(_vector(0.0), VERSION) is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_is_evicted(clock):
+    cache = AnswerCache(max_items=2, ttl=TTL, threshold=0.99)
+    cache.put(_vector(0.0), "a", VERSION)
+    cache.put(_vector(1.0), "b", VERSION)
+    assert cache.get(_vector(0.0), VERSION) == "a"
+
+    cache.put(_vector(2.0), "c", VERSION)
+    assert len(cache) == 2
+    assert cache.get(_vector(1.0), VERSION) is None
+    assert cache.get(_vector(0.0), VERSION) == "a"
+    assert cache.get(_vector(2.0), VERSION) == "c"
+
+
+def test_new_index_version_clears_cache(clock):
+    cache = AnswerCache(max_items=10, ttl=TTL, threshold=0.95)
+    cache.put(_vector(0.0), "ответ", VERSION)
+
+    assert cache.get(_vector(0.0), "v2") is None
+    assert len(cache) == 0
+    assert cache.get(_vector(0.0), VERSION) is None
@@ -0,0 +1,81 @@
+"""Общий контекст нескольких воркеров поверх одного хранилища."""
+
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:test")
+
+import pytest  # noqa: E402
+import pytest_asyncio  # noqa: E402
+
+from app.core.context_backends import RedisContextBackend  # noqa: E402
+from app.core.context_backends import SQLiteContextBackend  # noqa: E402
+from app.core.context_manager import ContextManager  # noqa: E402
+from tests.resp_stand_in import RespStandIn  # noqa: E402
+
+TTL = 3600
+MAX_CONTEXT = 10
+
+
+@pytest_asyncio.fixture(params=["sqlite", "redis"])
+async def backend_factory(request, tmp_path):
+    if request.param == "sqlite":
+        path = str(tmp_path / "context.db")
+        yield lambda: SQLiteContextBackend(path, ttl=TTL, max_messages=MAX_CONTEXT)
+        return
+    stand_in = RespStandIn()
+    url = await stand_in.start()
+    yield lambda: RedisContextBackend(url, ttl=TTL, max_messages=MAX_CONTEXT)
+    await stand_in.stop()
+
+
+def _worker(backend_factory) -> ContextManager:
+    # Копия в памяти свежа весь тест: проверяем, что устаревший кэш не затирает хранилище.
+    return ContextManager(
+        max_context=MAX_CONTEXT, ttl=TTL, backend=backend_factory(), cache_ttl=TTL
+    )
+
+
+async def _history(manager: ContextManager, user_id: str):
+    return [message["content"] for message in await manager.get_context(user_id)]
+
+
+@pytest.mark.asyncio
+async def test_stale_cache_does_not_overwrite_other_worker(backend_factory):
+    worker_a = _worker(backend_factory)
+    worker_b = _worker(backend_factory)
+
+    await worker_a.add_message("u1", "user", "q1")
+    await worker_a.add_message("u1", "assistant", "a1")
+    await worker_a.flush()
+
+    assert await _history(worker_b, "u1") == ["q1", "a1"]
+    await worker_b.add_message("u1", "user", "q2")
+    await worker_b.add_message("u1", "assistant", "a2")
+    await worker_b.flush()
+
+    # У A в памяти всё ещё только q1/a1.
+    await worker_a.add_message("u1", "user", "q3")
+    await worker_a.add_message("u1", "assistant", "a3")
+    await worker_a.aclose()
+    await worker_b.aclose()
+
+    reader = _worker(backend_factory)
+    assert await _history(reader, "u1") == ["q1", "a1", "q2", "a2", "q3", "a3"]
+    await reader.aclose()
+
+
+@pytest.mark.asyncio
+async def test_history_is_trimmed_and_cleared(backend_factory):
+    worker = _worker(backend_factory)
+    for i in range(MAX_CONTEXT + 3):
+        await worker.add_message("u1", "user", f"q{i}")
+    await worker.add_message("u2", "user", "hello")
+    await worker.clear_context("u2")
+    await worker.add_message("u2", "user", "again")
+    await worker.aclose()
+
+    reader = _worker(backend_factory)
+    assert await _history(reader, "u1") == [f"q{i}" for i in range(3, MAX_CONTEXT + 3)]
+    assert await _history(reader, "u2") == ["again"]
+    await reader.aclose()
@@ -0,0 +1,53 @@
+"""BM25-индекс и русский стеммер гибридного поиска."""
+
+import pytest
+
+from app.core.lexical_index import BM25Index
+from app.core.lexical_index import stem_russian
+from app.core.lexical_index import tokenize
+
+
+@pytest.mark.parametrize(
+    "forms",
+    [
+        ("курс", "курсы", "курса", "курсов"),
+        ("обучение", "обучения"),
+        ("стоимость", "стоимости"),
+        ("медитация", "медитации"),
+    ],
+)
+def test_word_forms_share_a_stem(forms):
+    assert len({stem_russian(form) for form in forms}) == 1
+
+
+def test_tokenize_normalizes_text():
+    terms = tokenize("Сколько стоит курс в 2024 году? Ёлка и ещё")
+    assert "2024" in terms
+    assert stem_russian("курс") in terms
+    assert stem_russian("елка") in terms
+    # Служебные слова отбрасываются.
+    assert "и" not in terms
+
+
+def test_search_ranks_by_matched_terms():
+    index = BM25Index([
+        "Стоимость курса Путь 15000 рублей",
+        "Медитации проходят по вторникам",
+        "Курс медитации для начинающих",
+    ])
+
+    hits = index.search("сколько стоит курс путь", top_k=3)
+    assert [hit.doc_id for hit in hits] == [0, 2]
+    assert hits[0].score > hits[1].score
+    assert hits[0].matched_terms == 2
+    assert hits[0].query_terms == len(set(tokenize("сколько стоит курс путь")))
+
+    assert [hit.doc_id for hit in index.search("медитация", top_k=1)] in ([1], [2])
+    assert index.search("15000", top_k=3)[0].doc_id == 0
+
+
+def test_search_without_matches():
+    index = BM25Index(["Курс медитации"])
+    assert index.search("расписание", top_k=3) == []
+    assert index.search("и", top_k=3) == []
+    assert BM25Index([]).search("курс", top_k=3) == []
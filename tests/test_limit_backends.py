@@ -0,0 +1,110 @@
+"""Хранилища состояния rate limiter и спам-фильтра."""
+
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:test")
+
+import pytest  # noqa: E402
+import pytest_asyncio  # noqa: E402
+
+from app.core import limit_backends  # noqa: E402
+from app.core.limit_backends import MemoryLimitsBackend  # noqa: E402
+from app.core.limit_backends import SQLiteLimitsBackend  # noqa: E402
+
+WINDOW = 60
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest_asyncio.fixture(params=["memory", "sqlite"])
+async def backend(request, tmp_path):
+    if request.param == "memory":
+        yield MemoryLimitsBackend(max_keys=100)
+        return
+    backend = SQLiteLimitsBackend(str(tmp_path / "limits.db"))
+    yield backend
+    await backend.aclose()
+
+
+@pytest.mark.asyncio
+async def test_hit_enforces_limit_per_key(backend):
+    results = [await backend.hit("u1", limit=3, window=WINDOW) for _ in range(5)]
+    assert results == [True, True, True, False, False]
+    assert await backend.hit("u2", limit=3, window=WINDOW)
+
+
+@pytest.mark.asyncio
+async def test_push_recent_keeps_last_values(backend):
+    for value in ("a", "b", "c"):
+        recent = await backend.push_recent("u1", value, keep=2)
+    assert recent == ["b", "c"]
+    assert await backend.push_recent("u2", "x", keep=2) == ["x"]
+
+
+@pytest.mark.asyncio
+async def test_flags(backend):
+    assert not await backend.has_flag("u1")
+    await backend.add_flag("u1")
+    await backend.add_flag("u1")
+    assert await backend.has_flag("u1")
+    assert not await backend.has_flag("u2")
+
+
+@pytest.mark.asyncio
+async def test_memory_window_slides():
+    clock = _Clock()
+    backend = MemoryLimitsBackend(max_keys=100, clock=clock)
+    for _ in range(3):
+        assert await backend.hit("u1", limit=3, window=WINDOW)
+    assert not await backend.hit("u1", limit=3, window=WINDOW)
+
+    # Сразу после смены окна предыдущее ещё учитывается почти целиком.
+    clock.now += WINDOW
+    assert not await backend.hit("u1", limit=3, window=WINDOW)
+    clock.now += WINDOW / 2
+    assert await backend.hit("u1", limit=3, window=WINDOW)
+    clock.now += 2 * WINDOW
+    assert all([await backend.hit("u1", limit=3, window=WINDOW) for _ in range(3)])
+
+
+@pytest.mark.asyncio
+async def test_memory_sweeps_idle_and_evicts_over_max_keys():
+    clock = _Clock()
+    backend = MemoryLimitsBackend(max_keys=3, clock=clock)
+    for i in range(5):
+        await backend.hit(f"u{i}", limit=3, window=WINDOW)
+    assert backend.stats()["rate_limit_keys"] == 3
+    assert backend.stats()["evicted"] == 2
+
+    clock.now += 2 * WINDOW
+    await backend.hit("fresh", limit=3, window=WINDOW)
+    assert backend.stats()["rate_limit_keys"] == 1
+    assert backend.stats()["swept"] == 3
+
+
+@pytest.mark.asyncio
+async def test_sqlite_state_is_shared_between_workers(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(limit_backends.time, "time", lambda: now[0])
+    path = str(tmp_path / "limits.db")
+    worker_a = SQLiteLimitsBackend(path)
+    worker_b = SQLiteLimitsBackend(path)
+
+    assert await worker_a.hit("u1", limit=2, window=WINDOW)
+    assert await worker_b.hit("u1", limit=2, window=WINDOW)
+    assert not await worker_a.hit("u1", limit=2, window=WINDOW)
+    await worker_a.add_flag("spammer")
+    assert await worker_b.has_flag("spammer")
+
+    now[0] += WINDOW
+    assert await worker_b.hit("u1", limit=2, window=WINDOW)
+
+    await worker_a.aclose()
+    await worker_b.aclose()
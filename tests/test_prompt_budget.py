@@ -0,0 +1,120 @@
+"""Сборка промпта Chat API в пределах бюджета токенов."""
+
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:test")
+
+from app.core.prompt_budget import CONTEXT_HEADER  # noqa: E402
+from app.core.prompt_budget import EMPTY_CONTEXT  # noqa: E402
+from app.core.prompt_budget import PART_CONTEXT  # noqa: E402
+from app.core.prompt_budget import PART_HISTORY  # noqa: E402
+from app.core.prompt_budget import PART_SYSTEM  # noqa: E402
+from app.core.prompt_budget import PromptBuilder  # noqa: E402
+from app.core.prompt_budget import TokenCounter  # noqa: E402
+from app.core.rag_engine import CONTEXT_SEPARATOR  # noqa: E402
+
+SYSTEM_PROMPT = "Ты консультант школы."
+
+
+class _WordCounter(TokenCounter):
+    """Токен — слово: результат не зависит от наличия `tiktoken`."""
+
+    @property
+    def exact(self) -> bool:
+        return True
+
+    def count(self, text: str) -> int:
+        return len(text.split())
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        return " ".join(text.split()[:max(0, max_tokens)])
+
+
+def _builder(budget: int, system: int = 1000, context: int = 1000, history: int = 1000):
+    return PromptBuilder(
+        counter=_WordCounter(),
+        budget=budget,
+        system_tokens=system,
+        context_tokens=context,
+        history_tokens=history,
+    )
+
+
+def _chunk(name: str, words: int) -> str:
+    return " ".join([name] * words)
+
+
+def _history(count: int):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"сообщение {i}"}
+        for i in range(count)
+    ]
+
+
+def test_without_budget_nothing_is_truncated():
+    context = CONTEXT_SEPARATOR.join([_chunk("a", 50), _chunk("b", 50)])
+    messages, usage = _builder(budget=0).build("вопрос", context, _history(4), SYSTEM_PROMPT)
+
+    assert [message["role"] for message in messages] == [
+        "system", "system", "user", "assistant", "user", "assistant", "user",
+    ]
+    assert messages[0]["content"] == SYSTEM_PROMPT
+    assert messages[1]["content"] == CONTEXT_HEADER + context
+    assert messages[-1]["content"] == "вопрос"
+    assert usage.truncated == ()
+    assert usage.budget == 0
+
+
+def test_empty_context_is_still_sent():
+    messages, _ = _builder(budget=0).build("вопрос", "", [], SYSTEM_PROMPT)
+    assert messages[1]["content"] == CONTEXT_HEADER + EMPTY_CONTEXT
+
+
+def test_least_relevant_context_chunks_are_dropped():
+    context = CONTEXT_SEPARATOR.join([_chunk("a", 30), _chunk("b", 30), _chunk("c", 30)])
+    messages, usage = _builder(budget=1000, context=60).build(
+        "вопрос", context, [], SYSTEM_PROMPT
+    )
+
+    sent_context = messages[1]["content"]
+    assert _chunk("a", 30) in sent_context
+    assert _chunk("b", 30) not in sent_context
+    assert _chunk("c", 30) not in sent_context
+    assert usage.truncated == (PART_CONTEXT,)
+
+
+def test_oldest_history_is_dropped_first():
+    history = _history(10)
+    messages, usage = _builder(budget=1000, history=20).build(
+        "вопрос", "", history, SYSTEM_PROMPT
+    )
+
+    sent_history = messages[2:-1]
+    assert sent_history == history[-len(sent_history):]
+    assert 0 < len(sent_history) < len(history)
+    assert usage.truncated == (PART_HISTORY,)
+
+
+def test_total_fits_budget_and_question_is_kept():
+    question = _chunk("вопрос", 20)
+    context = CONTEXT_SEPARATOR.join([_chunk("a", 60), _chunk("b", 60)])
+    system_prompt = _chunk("правило", 200)
+    messages, usage = _builder(budget=150, system=60).build(
+        question, context, _history(20), system_prompt
+    )
+
+    assert messages[-1]["content"] == question
+    assert usage.total <= 150
+    assert PART_SYSTEM in usage.truncated
+    assert PART_CONTEXT in usage.truncated
+
+
+def test_template_with_placeholder_embeds_context():
+    context = _chunk("a", 10)
+    template = "Ответь по контексту:\n{rag_context}"
+    messages, usage = _builder(budget=1000).build("вопрос", context, [], template)
+
+    assert [message["role"] for message in messages] == ["system", "user"]
+    assert messages[0]["content"] == "Ответь по контексту:\n" + context
+    assert usage.context == 10
@@ -0,0 +1,75 @@
+"""In-memory индекс векторов для дедупликации вопросов и кэша ответов."""
+
+import numpy as np
+import pytest
+
+from app.core.vector_index import VectorIndex
+
+
+def _unit(*values: float) -> np.ndarray:
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_nearest_returns_cosine_similarity():
+    index = VectorIndex()
+    assert index.nearest(_unit(1, 0, 0)) is None
+
+    index.add_many([10, 20], np.stack([_unit(1, 0, 0), _unit(0, 1, 0)]))
+    # Норма запроса не влияет на результат: индекс нормализует векторы.
+    key, similarity = index.nearest(np.array([3.0, 0.3, 0.0]))
+    assert key == 10
+    assert similarity == pytest.approx(float(_unit(3.0, 0.3, 0.0)[0]), abs=1e-6)
+
+
+def test_search_orders_by_similarity():
+    index = VectorIndex()
+    index.add(1, _unit(1, 0))
+    index.add(2, _unit(1, 1))
+    index.add(3, _unit(0, 1))
+
+    found = index.search(_unit(1, 0.2), k=2)
+    assert [key for key, _ in found] == [1, 2]
+    assert found[0][1] >= found[1][1]
+    assert [key for key, _ in index.search(_unit(1, 0.2), k=10)] == [1, 2, 3]
+    assert index.search(_unit(1, 0), k=0) == []
+
+
+def test_remove_moves_last_vector_into_the_gap():
+    index = VectorIndex(initial_capacity=4)
+    vectors = [_unit(1, 0, 0), _unit(0, 1, 0), _unit(0, 0, 1)]
+    index.add_many([1, 2, 3], np.stack(vectors))
+
+    assert index.remove(1)
+    assert not index.remove(1)
+    assert len(index) == 2
+    assert 1 not in index
+    # Последний вектор занял освободившуюся строку и по-прежнему находится по ключу.
+    assert index.nearest(vectors[2])[0] == 3
+    assert index.nearest(vectors[1])[0] == 2
+
+    assert index.remove(3)
+    assert index.remove(2)
+    assert len(index) == 0
+    assert index.nearest(vectors[0]) is None
+
+
+def test_grows_past_initial_capacity():
+    index = VectorIndex(initial_capacity=2)
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((50, 8)).astype(np.float32)
+    index.add_many(list(range(50)), vectors)
+
+    assert len(index) == 50
+    assert index.dimension == 8
+    for key in (0, 17, 49):
+        found_key, similarity = index.nearest(vectors[key])
+        assert found_key == key
+        assert similarity == pytest.approx(1.0, abs=1e-5)
+
+
+def test_rejects_dimension_mismatch():
+    index = VectorIndex()
+    index.add(1, _unit(1, 0, 0))
+    with pytest.raises(ValueError):
+        index.add(2, _unit(1, 0))